@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import threading
+import time
+
+from datetime import datetime
+
+from common import log
+from db import BaseModel, User, Chat
+from storage import storage
+
+
+class ActivityTracker:
+    """
+    Время последней активности пользователей и чатов.
+
+    Хранится в памяти и периодически записывается в базу: на каждую таблицу
+    один UPDATE, сколько бы сообщений ни пришло за интервал
+    """
+
+    def __init__(self, flush_timeout: float = 30):
+        self.flush_timeout: float = flush_timeout
+
+        self._lock = threading.Lock()
+        self._activity_by_model: dict[type[BaseModel], dict[int, datetime]] = {
+            User: dict(),
+            Chat: dict(),
+        }
+        self._thread: threading.Thread | None = None
+
+    def touch(self, model: type[BaseModel], obj_id: int, dt: datetime | None = None):
+        if dt is None:
+            dt = datetime.now()
+
+        with self._lock:
+            self._activity_by_model[model][obj_id] = dt
+
+    def touch_user(self, user_id: int, dt: datetime | None = None):
+        self.touch(User, user_id, dt)
+
+    def touch_chat(self, chat_id: int, dt: datetime | None = None):
+        self.touch(Chat, chat_id, dt)
+
+    def get_pending_count(self) -> int:
+        with self._lock:
+            return sum(len(items) for items in self._activity_by_model.values())
+
+    def flush(self):
+        with self._lock:
+            activity_by_model = self._activity_by_model
+            self._activity_by_model = {model: dict() for model in activity_by_model}
+
+        pending: list[type[BaseModel]] = list(activity_by_model)
+        try:
+            while pending:
+                model = pending[0]
+                storage.update_last_activity(model, activity_by_model[model])
+                pending.pop(0)
+        except:
+            # Незаписанные отметки возвращаются, более новые не перетираются
+            with self._lock:
+                for model in pending:
+                    for obj_id, dt in activity_by_model[model].items():
+                        self._activity_by_model[model].setdefault(obj_id, dt)
+            raise
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_timeout)
+            try:
+                self.flush()
+            except:
+                log.exception("")
+
+    def start(self):
+        if self._thread:
+            return
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name="ActivityTracker",
+            daemon=True,
+        )
+        self._thread.start()
+
+
+activity_tracker = ActivityTracker()
@@ -13,6 +13,7 @@ from telegram import Update
 from telegram.ext import CallbackContext
 
 import db
+from activity import activity_tracker
 from common import prepare_text
 
 
@@ -28,13 +29,16 @@ def log_func(log: logging.Logger):
                 username: str | None = None
                 language_code: str | None = None
 
+                # Время активности записывается в базу периодически, пачками
                 if update.effective_chat:
-                    db.Chat.get_from(update.effective_chat).update_last_activity()
+                    db.Chat.get_from(update.effective_chat)
+                    activity_tracker.touch_chat(update.effective_chat.id)
 
                     chat_id = update.effective_chat.id
 
                 if update.effective_user:
-                    db.User.get_from(update.effective_user).update_last_activity()
+                    db.User.get_from(update.effective_user)
+                    activity_tracker.touch_user(update.effective_user.id)
 
                     user_id = update.effective_user.id
                     first_name = update.effective_user.first_name
@@ -4,6 +4,8 @@
 __author__ = "ipetrash"
 
 
+import math
+
 from datetime import datetime, tzinfo, timezone
 
 from telegram import Update, Bot, InlineKeyboardButton, InlineKeyboardMarkup, ParseMode
@@ -25,8 +27,12 @@ from common import (
     convert_tz,
     get_tz,
 )
+from config import MESS_MAX_LENGTH, REMINDERS_PER_PAGE
 from bot_utils import log_func, reply_error, get_blockquote_html
 from db import Reminder, Chat, User
+from maintenance import TzMigrationResult, change_chat_tz
+from scheduler import reminder_scheduler
+from storage import storage
 
 from parser import (
     TimeUnit,
@@ -43,7 +49,11 @@ from regexp_patterns import (
     COMMAND_TZ,
     COMMAND_LIST,
     PATTERN_LIST,
+    COMMAND_SHORT_LIST,
+    PATTERN_SHORT_LIST,
     PATTERN_REMINDER_PAGE,
+    PATTERN_REMINDER_PAGE_FROM,
+    PATTERN_REMINDER_LIST_PAGE,
     PATTERN_REMINDER_DELETE,
     PATTERN_REMINDER_ASK_DELETE,
     PATTERN_DELETE_MESSAGE,
@@ -57,6 +67,9 @@ INLINE_BUTTON_TEXT_DELETE: str = "❌ Удалить"
 INLINE_BUTTON_TEXT_YES: str = "✅ Да"
 INLINE_BUTTON_TEXT_NO: str = "❌ Нет"
 
+# Количество кнопок удаления в строке краткого списка
+DELETE_BUTTONS_PER_ROW: int = 5
+
 
 def get_delete_button_for_reminder(reminder_id: int) -> InlineKeyboardButton:
     return InlineKeyboardButton(
@@ -137,7 +150,7 @@ def send_reminder(
     lines += _fill_repeat_before(
         repeat_before=reminder.get_repeat_before(),
         target_datetime=target_datetime,
-        tz_chat=chat.get_tz(),
+        tz_chat=reminder.chat.get_tz(),
     )
     lines.append(
         f"\nОригинальное сообщение:\n"
@@ -181,24 +194,31 @@ def get_reminders(update: Update, context: CallbackContext):
     chat = Chat.get_from(update.effective_chat)
 
     page: int = get_int_from_match(context.match, "page", default=1)
-    filters = [
-        (Reminder.chat_id == chat.id),
-        # TODO: Нужно ли фильтровать по user_id? Отправка идет в chat
-        (Reminder.user_id == update.effective_user.id),
-    ]
-
-    reminder: Reminder | None = Reminder.get_by_page(page=page, filters=filters)
-    if not reminder:
+    # TODO: Нужно ли фильтровать по user_id? Отправка идет в chat
+    user_id: int = update.effective_user.id
+
+    total: int = storage.get_count(chat.id, user_id)
+    reminders: list[Reminder] = storage.get_page(
+        chat_id=chat.id,
+        user_id=user_id,
+        page=page,
+        total=total,
+        anchor_page=get_int_from_match(context.match, "anchor_page"),
+        anchor_id=get_int_from_match(context.match, "anchor_id"),
+    )
+    if not reminders:
         message.reply_text("Напоминаний нет", quote=True)
         return
 
-    total = Reminder.count(filters)
-    pattern = PATTERN_REMINDER_PAGE
+    reminder: Reminder = reminders[0]
 
+    # Другие страницы отсчитываются от текущего напоминания
     paginator = InlineKeyboardPaginator(
         page_count=total,
         current_page=page,
-        data_pattern=fill_string_pattern(pattern, "{page}"),
+        data_pattern=fill_string_pattern(
+            PATTERN_REMINDER_PAGE_FROM, "{page}", page, reminder.id
+        ),
     )
     paginator.add_before(
         get_delete_button_for_reminder(reminder.id),
@@ -226,6 +246,114 @@ def get_reminders(update: Update, context: CallbackContext):
         raise e
 
 
+def get_short_list_text(
+    reminders: list[Reminder],
+    first_number: int,
+    page: int,
+    page_count: int,
+    max_length: int = MESS_MAX_LENGTH,
+) -> str:
+    lines: list[str] = [f"Напоминания, страница {page} из {page_count}:"]
+
+    prefixes: list[str] = []
+    for number, reminder in enumerate(reminders, start=first_number):
+        repeat_mark: str = " 🔁" if reminder.get_repeat_every() else ""
+        prefixes.append(
+            f"{number}. {datetime_to_str(reminder.get_next_send_datetime())}"
+            f"{repeat_mark}: "
+        )
+
+    # Тексты напоминаний обрезаются поровну, чтобы список поместился в сообщение
+    free_length: int = (
+        max_length
+        - len(lines[0])
+        - sum(len(prefix) + 1 for prefix in prefixes)  # С переводом строки
+    )
+    target_max_length: int = max(free_length // len(reminders), 10)
+
+    for prefix, reminder in zip(prefixes, reminders):
+        lines.append(prefix + prepare_text(reminder.target, target_max_length))
+
+    return prepare_text("\n".join(lines), max_length)
+
+
+def get_short_list(update: Update, context: CallbackContext):
+    query = update.callback_query
+    if query:
+        query.answer()
+
+    message = update.effective_message
+    chat = Chat.get_from(update.effective_chat)
+
+    # TODO: Нужно ли фильтровать по user_id? Отправка идет в chat
+    user_id: int = update.effective_user.id
+    total: int = storage.get_count(chat.id, user_id)
+    page_count: int = math.ceil(total / REMINDERS_PER_PAGE)
+
+    # Если напоминания удалили, то страницы из кнопок могло уже не стать
+    page: int = get_int_from_match(context.match, "page", default=1)
+    page = min(page, page_count)
+
+    reminders: list[Reminder] = storage.get_page(
+        chat_id=chat.id,
+        user_id=user_id,
+        page=page,
+        items_per_page=REMINDERS_PER_PAGE,
+        total=total,
+        anchor_page=get_int_from_match(context.match, "anchor_page"),
+        anchor_id=get_int_from_match(context.match, "anchor_id"),
+    )
+    if not reminders:
+        message.reply_text("Напоминаний нет", quote=True)
+        return
+
+    # Другие страницы отсчитываются от первого напоминания текущей
+    paginator = InlineKeyboardPaginator(
+        page_count=page_count,
+        current_page=page,
+        data_pattern=fill_string_pattern(
+            PATTERN_REMINDER_LIST_PAGE, "{page}", page, reminders[0].id
+        ),
+    )
+
+    first_number: int = (page - 1) * REMINDERS_PER_PAGE + 1
+    buttons: list[InlineKeyboardButton] = [
+        InlineKeyboardButton(
+            text=f"❌ {number}",
+            callback_data=fill_string_pattern(
+                PATTERN_REMINDER_ASK_DELETE, reminder.id
+            ),
+        )
+        for number, reminder in enumerate(reminders, start=first_number)
+    ]
+    for i in range(0, len(buttons), DELETE_BUTTONS_PER_ROW):
+        paginator.add_before(*buttons[i : i + DELETE_BUTTONS_PER_ROW])
+
+    reply_markup: str | None = paginator.markup
+    text: str = get_short_list_text(
+        reminders=reminders,
+        first_number=first_number,
+        page=page,
+        page_count=page_count,
+    )
+
+    if not query:
+        message.reply_text(text=text, reply_markup=reply_markup, quote=True)
+        return
+
+    # Fix error: "telegram.error.BadRequest: Message is not modified"
+    if is_equal_inline_keyboards(reply_markup, query.message.reply_markup):
+        return
+
+    try:
+        message.edit_text(text=text, reply_markup=reply_markup)
+    except BadRequest as e:
+        if "Message is not modified" in str(e):
+            return
+
+        raise e
+
+
 @log_func(log)
 def on_start(update: Update, _: CallbackContext):
     update.effective_message.reply_markdown(
@@ -244,6 +372,7 @@ def on_start(update: Update, _: CallbackContext):
 - `День рождения "^_^" 10 февраля. Повтор раз в год. Напомнить за месяц, за неделю, за 3 дня, за день`
 
 Для получения списка напоминаний, напишите: `список` или /list.
+Для краткого списка по нескольку напоминаний на странице: `краткий список` или /short\\_list.
 
 Чтобы бот правильно работал с датами, нужно задать свой часовой пояс.
 Для установки или получения часового пояса:
@@ -293,11 +422,24 @@ def on_tz(update: Update, context: CallbackContext):
             )
             return
 
-        chat.tz = value
-        chat.save()
+        prev_tz_chat: tzinfo = chat.get_tz()
+
+        # Местное время напоминаний чата сохраняется в новом часовом поясе
+        result: TzMigrationResult = change_chat_tz(chat, value)
+        for reminder_id, next_send_datetime_utc in result.next_send_by_id.items():
+            reminder_scheduler.schedule(reminder_id, next_send_datetime_utc)
+
+        log.info(
+            f"Migrated reminders of chat #{chat.id} from {prev_tz_chat} to {tz_chat}: "
+            f"changed={result.changed}, elapsed={result.elapsed:.3f} secs"
+        )
 
         message.reply_markdown(
-            text=prepare_text(f"Установлен часовой пояс `{value}`.\n{date_info}"),
+            text=prepare_text(
+                f"Установлен часовой пояс `{value}`.\n"
+                f"Напоминаний перенесено: {result.changed} "
+                f"(за {result.elapsed:.3f} сек.)\n{date_info}"
+            ),
             quote=True,
         )
         return
@@ -380,7 +522,7 @@ def add_reminder(command: str, update: Update):
         return
 
     # TODO: Проверка на дубликат команды
-    reminder = Reminder.add(
+    reminder: Reminder = storage.add_reminder(
         original_message_id=message.message_id,
         original_message_text=message.text,
         target=parse_result.target,
@@ -391,6 +533,7 @@ def add_reminder(command: str, update: Update):
         user=User.get_from(update.effective_user),
         chat=Chat.get_from(update.effective_chat),
     )
+    reminder_scheduler.schedule(reminder.id, reminder.next_send_datetime_utc)
 
     next_send_datetime: datetime = reminder.get_next_send_datetime()
 
@@ -444,6 +587,16 @@ def on_change_reminder_page(update: Update, context: CallbackContext):
     get_reminders(update, context)
 
 
+@log_func(log)
+def on_get_short_list(update: Update, context: CallbackContext):
+    get_short_list(update, context)
+
+
+@log_func(log)
+def on_change_short_list_page(update: Update, context: CallbackContext):
+    get_short_list(update, context)
+
+
 @log_func(log)
 def on_reminder_ask_delete(update: Update, context: CallbackContext):
     query = update.callback_query
@@ -453,7 +606,7 @@ def on_reminder_ask_delete(update: Update, context: CallbackContext):
     message = update.effective_message
     reminder_id: int = get_int_from_match(context.match, "id")
 
-    reminder: Reminder | None = Reminder.get_or_none(id=reminder_id)
+    reminder: Reminder | None = storage.get_reminder(reminder_id)
     if not reminder:
         message.reply_text("⚠ Напоминания уже нет", quote=True)
         return
@@ -508,12 +661,11 @@ def on_reminder_delete(update: Update, context: CallbackContext):
     message = update.effective_message
     reminder_id: int = get_int_from_match(context.match, "id")
 
-    reminder: Reminder | None = Reminder.get_or_none(id=reminder_id)
-    if not reminder:
+    if not storage.delete_reminders([reminder_id]):
         message.reply_text("⚠ Напоминания уже нет", quote=True)
         return
 
-    reminder.delete_instance()
+    reminder_scheduler.unschedule(reminder_id)
 
     message.reply_markdown(
         # TODO: Мб вывести оригинальное сообщение?
@@ -556,9 +708,26 @@ def setup(dp: Dispatcher):
     dp.add_handler(CommandHandler(COMMAND_LIST, on_get_reminders))
     dp.add_handler(MessageHandler(Filters.regex(PATTERN_LIST), on_get_reminders))
 
+    dp.add_handler(CommandHandler(COMMAND_SHORT_LIST, on_get_short_list))
+    dp.add_handler(
+        MessageHandler(Filters.regex(PATTERN_SHORT_LIST), on_get_short_list)
+    )
+
+    # NOTE: Кнопки старого вида без текущего напоминания остаются рабочими
     dp.add_handler(
         CallbackQueryHandler(on_change_reminder_page, pattern=PATTERN_REMINDER_PAGE)
     )
+    dp.add_handler(
+        CallbackQueryHandler(
+            on_change_reminder_page, pattern=PATTERN_REMINDER_PAGE_FROM
+        )
+    )
+
+    dp.add_handler(
+        CallbackQueryHandler(
+            on_change_short_list_page, pattern=PATTERN_REMINDER_LIST_PAGE
+        )
+    )
 
     dp.add_handler(
         CallbackQueryHandler(
@@ -4,17 +4,28 @@
 __author__ = "ipetrash"
 
 
+import functools
 import logging
 import re
 import sys
+import threading
+
+from collections import OrderedDict
 
 from datetime import datetime, tzinfo
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
+from typing import Any, Hashable
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 import config
-from third_party.get_tz_from_offset__zoneinfo import get_tz as get_tz_from_offset
+from third_party.get_tz_from_offset__zoneinfo import (
+    PATTERN_TZ_OFFSET,
+    get_tz as get_tz_from_offset,
+)
+
+
+TZ_CACHE_MAX_SIZE: int = 1024
 
 
 def get_logger(file_name: str, dir_name: Path = config.DIR / "logs") -> logging.Logger:
@@ -77,16 +88,76 @@ def convert_tz(dt: datetime, from_tz: tzinfo, to_tz: tzinfo) -> datetime:
     )
 
 
-def get_tz(value: str) -> tzinfo:
-    try:
-        return get_tz_from_offset(value)
-    except Exception:
+@functools.lru_cache(maxsize=TZ_CACHE_MAX_SIZE)
+def _resolve_tz(value: str) -> tzinfo | None:
+    if PATTERN_TZ_OFFSET.search(value):
         try:
-            return ZoneInfo(value)
-        except ZoneInfoNotFoundError:
-            pass
+            return get_tz_from_offset(value)
+        except ValueError:
+            # Смещение вне диапазона, например "+24:00"
+            return
 
+    try:
+        return ZoneInfo(value)
+    except ZoneInfoNotFoundError:
+        # Несуществующие часовые пояса тоже кэшируются
+        return
+
+
+def get_tz(value: str) -> tzinfo:
+    tz: tzinfo | None = _resolve_tz(value)
+    if tz is None:
         raise ZoneInfoNotFoundError(value)
 
+    return tz
+
+
+def get_tz_cache_info() -> functools._CacheInfo:
+    return _resolve_tz.cache_info()
+
+
+class LRUCache:
+    def __init__(self, max_size: int):
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self._items: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
 
 log = get_logger(__file__)
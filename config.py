@@ -5,6 +5,7 @@ __author__ = "ipetrash"
 
 
 import os
+import secrets
 from pathlib import Path
 
 
@@ -17,3 +18,25 @@ except:
     raise Exception("TOKEN не задан")
 
 MESS_MAX_LENGTH: int = 4096
+
+# Количество напоминаний на странице краткого списка
+REMINDERS_PER_PAGE: int = 10
+
+# Если задан адрес, то обновления принимаются вебхуком, иначе через start_polling.
+# Адрес должен вести на WEBHOOK_HOST:WEBHOOK_PORT, например через reverse proxy
+WEBHOOK_URL: str | None = os.environ.get("WEBHOOK_URL")
+WEBHOOK_HOST: str = os.environ.get("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT: int = int(os.environ.get("WEBHOOK_PORT", 8080))
+
+# Нужно задавать явно, если несколько процессов бота работают за балансировщиком
+WEBHOOK_SECRET_TOKEN: str = (
+    os.environ.get("WEBHOOK_SECRET_TOKEN") or secrets.token_urlsafe(32)
+)
+
+# Если включено, то процессы бота делят чаты на шарды и каждый отправляет
+# напоминания только своих шардов. Нужно, если запущено несколько процессов
+SCHEDULER_SHARDING: bool = os.environ.get("SCHEDULER_SHARDING") == "1"
+
+# Хранилище напоминаний: SQLITE, SQLITE_CONCURRENT (без очереди записи,
+# для большого количества одновременных записей) или MEMORY (для тестов)
+STORAGE_BACKEND: str = os.environ.get("STORAGE_BACKEND", "SQLITE").upper()
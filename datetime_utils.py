@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import calendar
+
+from datetime import datetime, timedelta
+
+
+# NOTE: Все функции работают за O(1), без перебора дней и без ValueError
+
+
+def get_days_in_month(year: int, month: int) -> int:
+    return calendar.monthrange(year, month)[1]
+
+
+def add_months(dt: datetime, months: int) -> datetime:
+    """
+    Сдвигает дату на указанное количество месяцев.
+    Если дня нет в итоговом месяце, то берется последний день месяца,
+    например 31 января + 1 месяц = 28 (29) февраля
+    """
+
+    year, month = divmod(dt.year * 12 + (dt.month - 1) + months, 12)
+    month += 1
+
+    day: int = min(dt.day, get_days_in_month(year, month))
+    return dt.replace(year=year, month=month, day=day)
+
+
+def add_years(dt: datetime, years: int) -> datetime:
+    return add_months(dt, years * 12)
+
+
+def get_months_between(start: datetime, end: datetime) -> int:
+    """
+    Количество полных месяцев от start до end.
+    Полным считается месяц, для которого add_months(start, months) <= end
+    """
+
+    months: int = (end.year - start.year) * 12 + (end.month - start.month)
+    if add_months(start, months) > end:
+        months -= 1
+    return months
+
+
+def add_weekdays(dt: datetime, isoweekday: int, count: int = 1) -> datetime:
+    """
+    Возвращает count-й по счету день недели isoweekday после dt.
+    Сам dt не учитывается, даже если он приходится на этот день недели
+    """
+
+    days: int = (isoweekday - dt.isoweekday() - 1) % 7 + 1
+    return dt + timedelta(days=days + 7 * (count - 1))
+
+
+def get_steps_to_pass(start: datetime, end: datetime, step: timedelta) -> int:
+    """
+    Минимальное количество шагов step от start, после которых дата станет больше end
+    """
+
+    if start > end:
+        return 0
+    return (end - start) // step + 1
@@ -4,25 +4,46 @@
 __author__ = "ipetrash"
 
 
+import enum
 import json
-import time
+import uuid
 
-from datetime import datetime, tzinfo, timezone
+from datetime import datetime, timedelta, tzinfo, timezone
 from typing import Optional, Iterable
 from pathlib import Path
 
 from peewee import (
+    BlobField,
     TextField,
     DateTimeField,
+    Expression,
     ForeignKeyField,
     IntegerField,
+    ModelSelect,
+    OP,
+    SqliteDatabase,
+    Tuple,
+    chunked,
 )
+from playhouse.migrate import SqliteMigrator, migrate
 from playhouse.sqliteq import SqliteQueueDatabase
 
 import telegram
 
-from common import convert_tz, get_tz
-from parser import TimeUnit, RepeatEvery, get_nearest_datetime
+from common import LRUCache, convert_tz, get_tz
+from occurrences import (
+    Occurrence,
+    occurrences_cache,
+    parse_repeat_every,
+    parse_repeat_before,
+)
+from parser import AutoName, TimeUnit, RepeatEvery
+from repeat_codec import (
+    encode_repeat_every,
+    decode_repeat_every,
+    encode_repeat_before,
+    decode_repeat_before,
+)
 from third_party.db_peewee_meta_model import MetaModel
 
 
@@ -32,16 +53,51 @@ DB_FILE_NAME = str(DB_DIR_NAME / "database.sqlite")
 
 DB_DIR_NAME.mkdir(parents=True, exist_ok=True)
 
+DB_PRAGMAS: dict[str, int | str] = {
+    "foreign_keys": 1,
+    "journal_mode": "wal",  # WAL-mode
+    "cache_size": -1024 * 64,  # 64MB page-cache
+}
+
+# Время, на которое процесс захватывает напоминания для отправки.
+# Если процесс упадет, не записав результат, напоминания будут захвачены повторно
+CLAIM_LEASE_TIMEOUT: timedelta = timedelta(hours=1)
+
+
+class CatchUpPolicyEnum(AutoName):
+    """
+    Что делать с повторами, пропущенными за время простоя бота
+    """
+
+    FIRE_ONCE = enum.auto()  # Одно уведомление, затем сразу ближайший будущий повтор
+    FIRE_ALL = enum.auto()  # По уведомлению на каждый пропущенный повтор
+    SKIP = enum.auto()  # Пропущенные повторы не отправляются
+
+
+CATCH_UP_POLICY: CatchUpPolicyEnum = CatchUpPolicyEnum.FIRE_ONCE
+
+# Через сколько после времени отправки она считается пропущенной
+CATCH_UP_MISSED_TIMEOUT: timedelta = timedelta(minutes=5)
+
+# Максимальное количество пользователей и чатов, хранимых в кэше
+IDENTITY_CACHE_MAX_SIZE: int = 10_000
+
+# Для скольких пар чат-пользователь хранится количество напоминаний
+COUNT_CACHE_MAX_SIZE: int = 10_000
+
+# Количество шардов, на которые делятся чаты между процессами бота
+SHARD_COUNT: int = 16
+
+# Ограничение на количество записей в одном UPDATE, т.к. у SQLite есть
+# ограничение на количество параметров в запросе
+BULK_BATCH_SIZE: int = 500
+
 
 # This working with multithreading
 # SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#sqliteq
 db = SqliteQueueDatabase(
     DB_FILE_NAME,
-    pragmas={
-        "foreign_keys": 1,
-        "journal_mode": "wal",  # WAL-mode
-        "cache_size": -1024 * 64,  # 64MB page-cache
-    },
+    pragmas=DB_PRAGMAS,
     use_gevent=False,  # Use the standard library "threading" module.
     autostart=True,
     queue_max_size=64,  # Max. # of pending writes that can accumulate.
@@ -54,24 +110,55 @@ class BaseModel(MetaModel):
         database = db
 
 
+class IdentityCacheMixin:
+    # Объекты кэшируются по id, чтобы не запрашивать их из базы на каждое сообщение.
+    # При сохранении объект записывается в кэш
+    _identity_cache: LRUCache
+
+    @classmethod
+    def get_cached(cls, obj_id: int) -> Optional["IdentityCacheMixin"]:
+        obj = cls._identity_cache.get(obj_id)
+        if obj is None:
+            obj = cls.get_or_none(cls.id == obj_id)
+            if obj:
+                cls._identity_cache.put(obj_id, obj)
+
+        return obj
+
+    @classmethod
+    def clear_cache(cls):
+        cls._identity_cache.clear()
+
+    def save(self, *args, **kwargs) -> int | bool:
+        rows = super().save(*args, **kwargs)
+        self._identity_cache.put(self.id, self)
+        return rows
+
+    def delete_instance(self, *args, **kwargs) -> int:
+        self._identity_cache.pop(self.id)
+        return super().delete_instance(*args, **kwargs)
+
+
 # SOURCE: https://core.telegram.org/bots/api#user
-class User(BaseModel):
+class User(IdentityCacheMixin, BaseModel):
     first_name: str = TextField()
     last_name: str = TextField(null=True)
     username: str = TextField(null=True)
     language_code: str = TextField(null=True)
     last_activity: datetime = DateTimeField(default=datetime.now)
 
-    def update_last_activity(self):
-        self.last_activity = datetime.now()
-        self.save()
+    _identity_cache = LRUCache(max_size=IDENTITY_CACHE_MAX_SIZE)
+
+    class Meta:
+        # Объект из кэша может быть устаревшим, поэтому записываются только измененные поля
+        only_save_dirty = True
 
     @classmethod
     def get_from(cls, user: telegram.User | None) -> Optional["User"]:
         if not user:
             return
 
-        user_db = cls.get_or_none(cls.id == user.id)
+        user_db = cls.get_cached(user.id)
         if not user_db:
             user_db = cls.create(
                 id=user.id,
@@ -80,12 +167,11 @@ class User(BaseModel):
                 username=user.username,
                 language_code=user.language_code,
             )
-            user_db.update_last_activity()
         return user_db
 
 
 # SOURCE: https://core.telegram.org/bots/api#chat
-class Chat(BaseModel):
+class Chat(IdentityCacheMixin, BaseModel):
     type: str = TextField()
     title: str = TextField(null=True)
     username: str = TextField(null=True)
@@ -95,19 +181,26 @@ class Chat(BaseModel):
     tz: str = TextField(default="UTC")
     last_activity: datetime = DateTimeField(default=datetime.now)
 
-    def get_tz(self) -> tzinfo:
-        return get_tz(self.tz)
+    _identity_cache = LRUCache(max_size=IDENTITY_CACHE_MAX_SIZE)
 
-    def update_last_activity(self):
-        self.last_activity = datetime.now()
-        self.save()
+    class Meta:
+        # Объект из кэша может быть устаревшим, поэтому записываются только измененные поля
+        only_save_dirty = True
+
+    def get_tz(self) -> tzinfo:
+        # Часовой пояс разбирается один раз, пока не изменится значение tz
+        cache: tuple[str, tzinfo] | None = self.__dict__.get("_tz_cache")
+        if not cache or cache[0] != self.tz:
+            cache = self.tz, get_tz(self.tz)
+            self._tz_cache = cache
+        return cache[1]
 
     @classmethod
     def get_from(cls, chat: telegram.Chat | None) -> Optional["Chat"]:
         if not chat:
             return
 
-        chat_db = cls.get_or_none(cls.id == chat.id)
+        chat_db = cls.get_cached(chat.id)
         if not chat_db:
             chat_db = cls.create(
                 id=chat.id,
@@ -118,7 +211,6 @@ class Chat(BaseModel):
                 last_name=chat.last_name,
                 description=chat.description,
             )
-            chat_db.update_last_activity()
         return chat_db
 
 
@@ -131,15 +223,36 @@ class Reminder(BaseModel):
     next_send_datetime_utc: datetime = DateTimeField()
     repeat_every: str = TextField(null=True)
     repeat_before: str = TextField(null=True)
+    # Те же повторы в виде чисел, чтобы не разбирать строки и JSON при чтении
+    repeat_every_unit: int = IntegerField(null=True)
+    repeat_every_number: int = IntegerField(null=True)
+    repeat_every_weekdays: int = IntegerField(null=True)
+    repeat_before_packed: bytes = BlobField(null=True)
     last_send_message_id: int = IntegerField(null=True)
     last_send_datetime_utc: datetime = DateTimeField(null=True)
     user: User = ForeignKeyField(User, backref="reminders")
     chat: Chat = ForeignKeyField(Chat, backref="reminders")
+    claim_token: str = TextField(null=True)
+    claim_expires_datetime_utc: datetime = DateTimeField(null=True)
+
+    # Количество напоминаний пользователя в чате, чтобы не считать его
+    # при каждом перелистывании списка. Сбрасывается при добавлении и удалении
+    _count_cache = LRUCache(max_size=COUNT_CACHE_MAX_SIZE)
+
+    class Meta:
+        # NOTE: В существующих базах индексы будут созданы при запуске,
+        #       т.к. create_tables создает отсутствующие индексы
+        indexes = (
+            # Поиск напоминаний, время отправки которых наступило
+            (("next_send_datetime_utc",), False),
+            # Список напоминаний пользователя в чате
+            (("chat", "user", "next_send_datetime_utc"), False),
+        )
 
     # TODO: Проверка существования
 
     @classmethod
-    def add(
+    def build(
         cls,
         original_message_id: int,
         original_message_text: str,
@@ -151,7 +264,11 @@ class Reminder(BaseModel):
         user: User,
         chat: Chat,
     ) -> "Reminder":
-        return cls.create(
+        # Напоминание без сохранения в базу
+        repeat_every_unit, repeat_every_number, repeat_every_weekdays = (
+            encode_repeat_every(repeat_every)
+        )
+        return cls(
             original_message_id=original_message_id,
             original_message_text=original_message_text,
             target=target,
@@ -163,22 +280,295 @@ class Reminder(BaseModel):
                 if repeat_before
                 else None
             ),
+            repeat_every_unit=repeat_every_unit,
+            repeat_every_number=repeat_every_number,
+            repeat_every_weekdays=repeat_every_weekdays,
+            repeat_before_packed=encode_repeat_before(repeat_before),
             user=user,
             chat=chat,
         )
 
     @classmethod
-    def get_by_page(
+    def add(cls, *args, **kwargs) -> "Reminder":
+        reminder: Reminder = cls.build(*args, **kwargs)
+        reminder.save(force_insert=True)
+        return reminder
+
+    @classmethod
+    def fill_repeat_columns(cls) -> int:
+        """
+        Заполняет числовые столбцы повторов у напоминаний, созданных до их появления
+        """
+
+        query = cls.select().where(
+            (cls.repeat_every.is_null(False) & cls.repeat_every_unit.is_null())
+            | (cls.repeat_before.is_null(False) & cls.repeat_before_packed.is_null())
+        )
+
+        reminders: list[Reminder] = []
+        for reminder in query:
+            repeat_every: RepeatEvery | None = (
+                parse_repeat_every(reminder.repeat_every)
+                if reminder.repeat_every
+                else None
+            )
+            (
+                reminder.repeat_every_unit,
+                reminder.repeat_every_number,
+                reminder.repeat_every_weekdays,
+            ) = encode_repeat_every(repeat_every)
+
+            reminder.repeat_before_packed = encode_repeat_before(
+                list(parse_repeat_before(reminder.repeat_before))
+                if reminder.repeat_before
+                else []
+            )
+            reminders.append(reminder)
+
+        cls.bulk_update(
+            reminders,
+            fields=[
+                cls.repeat_every_unit,
+                cls.repeat_every_number,
+                cls.repeat_every_weekdays,
+                cls.repeat_before_packed,
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        return len(reminders)
+
+    @classmethod
+    def select_with_chat(cls) -> ModelSelect:
+        # Чат нужен для часового пояса, поэтому загружается сразу, а не
+        # отдельным запросом на каждое напоминание
+        return cls.select(cls, Chat).join(Chat)
+
+    @classmethod
+    def get_with_chat(cls, reminder_id: int) -> Optional["Reminder"]:
+        return cls.select_with_chat().where(cls.id == reminder_id).first()
+
+    @classmethod
+    def get_due(cls, now_utc: datetime) -> ModelSelect:
+        return (
+            cls.select_with_chat()
+            .where(cls.next_send_datetime_utc <= now_utc)
+            .order_by(cls.next_send_datetime_utc)
+        )
+
+    @classmethod
+    def get_shard_expr(cls, shard_count: int = SHARD_COUNT) -> Expression:
+        # То же, что get_shard, но в SQL. У групп id отрицательный, а остаток
+        # от деления в SQLite имеет знак делимого
+        # NOTE: Оператор % у полей peewee означает LIKE
+        remainder = Expression(cls.chat, OP.MOD, shard_count)
+        return Expression(remainder + shard_count, OP.MOD, shard_count)
+
+    @classmethod
+    def claim_due(
+        cls,
+        now_utc: datetime,
+        lease_timeout: timedelta = CLAIM_LEASE_TIMEOUT,
+        shards: Iterable[int] | None = None,
+    ) -> list["Reminder"]:
+        # Одним запросом захватываются все напоминания, время отправки которых
+        # наступило и которые не захвачены (или захват истек).
+        # Если заданы shards, то только напоминания чатов этих шардов
+        filters = [
+            cls.next_send_datetime_utc <= now_utc,
+            cls.claim_token.is_null() | (cls.claim_expires_datetime_utc < now_utc),
+        ]
+        if shards is not None:
+            filters.append(cls.get_shard_expr().in_(list(shards)))
+
+        claim_token: str = uuid.uuid4().hex
+        cls.update(
+            claim_token=claim_token,
+            claim_expires_datetime_utc=now_utc + lease_timeout,
+        ).where(*filters).execute()
+
+        reminders: list[Reminder] = list(
+            cls.get_due(now_utc).where(cls.claim_token == claim_token)
+        )
+
+        # Напоминания одного чата используют общий объект чата,
+        # чтобы часовой пояс разбирался один раз на чат
+        chat_by_id: dict[int, Chat] = dict()
+        for reminder in reminders:
+            reminder.chat = chat_by_id.setdefault(reminder.chat_id, reminder.chat)
+
+        return reminders
+
+    @classmethod
+    def save_claimed(cls, reminders: list["Reminder"]) -> int:
+        if not reminders:
+            return 0
+
+        # Если часовой пояс чата сменили, пока напоминания отправлялись, то
+        # в базе они уже перенесены, а рассчитанная при отправке следующая
+        # отправка в старом поясе переносится здесь
+        tz_by_chat_id: dict[int, str] = dict()
+        for chat_ids in chunked({r.chat_id for r in reminders}, BULK_BATCH_SIZE):
+            query = Chat.select(Chat.id, Chat.tz).where(Chat.id.in_(chat_ids))
+            tz_by_chat_id.update(query.tuples())
+
+        for reminder in reminders:
+            reminder.claim_token = None
+            reminder.claim_expires_datetime_utc = None
+
+            tz: str | None = tz_by_chat_id.get(reminder.chat_id)
+            if tz is not None and tz != reminder.chat.tz:
+                reminder.move_to_tz(from_tz=reminder.chat.get_tz(), to_tz=get_tz(tz))
+
+        # Каждая пачка записывается одним UPDATE
+        return cls.bulk_update(
+            reminders,
+            fields=[
+                cls.target_datetime_utc,
+                cls.next_send_datetime_utc,
+                cls.last_send_message_id,
+                cls.last_send_datetime_utc,
+                cls.claim_token,
+                cls.claim_expires_datetime_utc,
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+
+    @classmethod
+    def release_claimed(cls, reminder_ids: list[int]) -> int:
+        if not reminder_ids:
+            return 0
+
+        return (
+            cls.update(claim_token=None, claim_expires_datetime_utc=None)
+            .where(cls.id.in_(reminder_ids))
+            .execute()
+        )
+
+    @classmethod
+    def delete_by_ids(cls, reminder_ids: list[int]) -> int:
+        if not reminder_ids:
+            return 0
+
+        for reminder_id in reminder_ids:
+            occurrences_cache.pop(reminder_id)
+
+        query = (
+            cls.select(cls.chat_id, cls.user_id)
+            .where(cls.id.in_(reminder_ids))
+            .distinct()
+        )
+        for chat_id, user_id in query.tuples():
+            cls._count_cache.pop((chat_id, user_id))
+
+        return cls.delete().where(cls.id.in_(reminder_ids)).execute()
+
+    def save(self, *args, **kwargs) -> int | bool:
+        is_new: bool = kwargs.get("force_insert") or self.id is None
+        result = super().save(*args, **kwargs)
+        if is_new:
+            self._count_cache.pop((self.chat_id, self.user_id))
+        return result
+
+    def delete_instance(self, *args, **kwargs) -> int:
+        occurrences_cache.pop(self.id)
+        self._count_cache.pop((self.chat_id, self.user_id))
+        return super().delete_instance(*args, **kwargs)
+
+    @classmethod
+    def clear_count_cache(cls):
+        cls._count_cache.clear()
+
+    @classmethod
+    def get_filters_of(cls, chat_id: int, user_id: int) -> list:
+        return [
+            (cls.chat_id == chat_id),
+            (cls.user_id == user_id),
+        ]
+
+    @classmethod
+    def get_count_of(cls, chat_id: int, user_id: int) -> int:
+        key: tuple[int, int] = (chat_id, user_id)
+
+        count: int | None = cls._count_cache.get(key)
+        if count is None:
+            count = cls.count(cls.get_filters_of(chat_id, user_id))
+            cls._count_cache.put(key, count)
+
+        return count
+
+    @classmethod
+    def get_page(
         cls,
         page: int = 1,
+        items_per_page: int = 1,
         filters: Iterable | None = None,
-    ) -> Optional["Reminder"]:
-        items = cls.paginating(
-            page=page,
-            filters=filters,
-            order_by=cls.next_send_datetime_utc,
-        )
-        return items[0] if items else None
+        total: int | None = None,
+        anchor_page: int | None = None,
+        anchor_id: int | None = None,
+    ) -> list["Reminder"]:
+        """
+        Напоминания на странице page в порядке (next_send_datetime_utc, id).
+
+        Страница ищется по индексу от ближайшей известной позиции: начала списка,
+        конца (если передано количество total) или напоминания anchor_id,
+        первого на странице anchor_page. Так перелистывание на соседние
+        страницы не зависит от количества напоминаний, в отличие от OFFSET
+        от начала списка. Если напоминания anchor_id уже нет, то отсчет идет
+        от начала или конца списка
+        """
+
+        page = max(page, 1)
+        first_index: int = (page - 1) * items_per_page
+
+        key = Tuple(cls.next_send_datetime_utc, cls.id)
+
+        # Варианты поиска: смещение, количество, условие на ключ
+        # и обратный ли порядок
+        seeks: list[tuple[int, int, Expression | None, bool]] = [
+            (first_index, items_per_page, None, False)
+        ]
+        if total is not None:
+            if first_index >= total:
+                return []
+
+            end_index: int = min(first_index + items_per_page, total)
+            seeks.append((total - end_index, end_index - first_index, None, True))
+
+        if anchor_page and anchor_id:
+            anchor = cls.alias("anchor")
+            anchor_key = anchor.select(
+                anchor.next_send_datetime_utc, anchor.id
+            ).where(anchor.id == anchor_id)
+
+            if page >= anchor_page:
+                offset = (page - anchor_page) * items_per_page
+                seeks.append((offset, items_per_page, key >= anchor_key, False))
+            else:
+                offset = (anchor_page - page - 1) * items_per_page
+                seeks.append((offset, items_per_page, key < anchor_key, True))
+
+        seeks.sort(key=lambda seek: seek[0])
+        for offset, limit, where, backward in seeks:
+            query = cls.select_with_chat()
+            if filters:
+                query = query.filter(*filters)
+            if where is not None:
+                query = query.where(where)
+
+            if backward:
+                query = query.order_by(
+                    cls.next_send_datetime_utc.desc(), cls.id.desc()
+                )
+            else:
+                query = query.order_by(cls.next_send_datetime_utc, cls.id)
+
+            items: list[Reminder] = list(query.offset(offset).limit(limit))
+            if backward:
+                items.reverse()
+
+            # Не найти напоминания от anchor_id могли, если его уже нет
+            if items or where is None:
+                return items
 
     def get_reply_to_message_id(self) -> int:
         if self.last_send_message_id is not None:
@@ -187,16 +577,29 @@ class Reminder(BaseModel):
         return self.original_message_id
 
     def get_repeat_every(self) -> RepeatEvery | None:
+        if self.repeat_every_unit is not None:
+            return decode_repeat_every(
+                self.repeat_every_unit,
+                self.repeat_every_number,
+                self.repeat_every_weekdays,
+            )
+
+        # Числовые столбцы еще не заполнены
         if self.repeat_every:
-            return RepeatEvery.parse_value(self.repeat_every)
+            return parse_repeat_every(self.repeat_every)
         return
 
-    def get_repeat_before(self) -> list[TimeUnit]:
+    def get_repeat_before_units(self) -> tuple[TimeUnit, ...]:
+        if self.repeat_before_packed is not None:
+            return decode_repeat_before(bytes(self.repeat_before_packed))
+
+        # Числовые столбцы еще не заполнены
         if self.repeat_before:
-            return [
-                TimeUnit.parse_value(value) for value in json.loads(self.repeat_before)
-            ]
-        return []
+            return parse_repeat_before(self.repeat_before)
+        return tuple()
+
+    def get_repeat_before(self) -> list[TimeUnit]:
+        return list(self.get_repeat_before_units())
 
     def get_create_datetime(self) -> datetime:
         return convert_tz(
@@ -219,37 +622,152 @@ class Reminder(BaseModel):
             to_tz=self.chat.get_tz(),
         )
 
-    def process_next_notify(self, now_utc: datetime) -> bool:
+    def move_to_tz(self, from_tz: tzinfo, to_tz: tzinfo):
+        # Местное время целевой даты сохраняется в новом часовом поясе,
+        # ближайшая отправка сдвигается вместе с ней
+        target_datetime_utc: datetime = convert_tz(
+            dt=convert_tz(
+                dt=self.target_datetime_utc, from_tz=timezone.utc, to_tz=from_tz
+            ),
+            from_tz=to_tz,
+            to_tz=timezone.utc,
+        )
+        self.next_send_datetime_utc += target_datetime_utc - self.target_datetime_utc
+        self.target_datetime_utc = target_datetime_utc
+
+    def is_missed(self, now_utc: datetime) -> bool:
+        return now_utc - self.next_send_datetime_utc > CATCH_UP_MISSED_TIMEOUT
+
+    def process_next_notify(
+        self,
+        now_utc: datetime,
+        catch_up_policy: CatchUpPolicyEnum = CATCH_UP_POLICY,
+    ) -> bool:
         target_datetime_utc: datetime = self.target_datetime_utc
 
-        if now_utc >= target_datetime_utc:
+        if (
+            catch_up_policy == CatchUpPolicyEnum.FIRE_ALL
+            and now_utc >= target_datetime_utc
+        ):
             repeat_every: RepeatEvery | None = self.get_repeat_every()
             if repeat_every:
                 target_datetime_utc = repeat_every.get_next_datetime(
                     target_datetime_utc
                 )
-            else:
-                self.delete_instance()
-                return False
-
-        self.target_datetime_utc = target_datetime_utc
 
-        # Следующая дата отправки
-        self.next_send_datetime_utc = get_nearest_datetime(
-            dt=now_utc,
-            target_dt=self.target_datetime_utc,
-            repeat_before=self.get_repeat_before(),
+                # Пропущенный повтор будет отправлен сразу
+                if target_datetime_utc <= now_utc:
+                    self.target_datetime_utc = target_datetime_utc
+                    self.next_send_datetime_utc = target_datetime_utc
+                    return True
+
+        # Следующая отправка берется из заранее рассчитанных.
+        # Пропущенные повторы не перебираются, сразу берется первая отправка
+        # после текущего времени
+        occurrence: Occurrence | None = occurrences_cache.get_next(
+            reminder_id=self.id,
+            target_datetime=self.target_datetime_utc,
+            next_send_datetime=self.next_send_datetime_utc,
+            repeat_every=self.get_repeat_every(),
+            repeat_before=self.get_repeat_before_units(),
+            now=now_utc,
         )
+        if not occurrence:
+            # Следующей отправки нет, напоминание нужно удалить
+            return False
 
+        self.target_datetime_utc = occurrence.target_datetime
+        self.next_send_datetime_utc = occurrence.send_datetime
         return True
 
 
-db.connect()
-db.create_tables(BaseModel.get_inherited_models())
+class SchedulerWorker(BaseModel):
+    """
+    Процесс бота, отправляющий напоминания. Живым считается, пока обновляет
+    время последнего сигнала
+    """
+
+    id: str = TextField(primary_key=True)
+    heartbeat_datetime_utc: datetime = DateTimeField(default=datetime.utcnow)
+
+    class Meta:
+        table_name = "scheduler_worker"
 
-# Задержка в 50мс, чтобы дать время на запуск SqliteQueueDatabase и создание таблиц
-# Т.к. в SqliteQueueDatabase запросы на чтение выполняются сразу, а на запись попадают в очередь
-time.sleep(0.050)
+
+class ShardLease(BaseModel):
+    """
+    Захват шарда чатов процессом бота. Напоминания чатов шарда отправляет
+    только владелец, пока захват не истек
+    """
+
+    shard: int = IntegerField(primary_key=True)
+    owner: str = TextField(null=True)
+    expires_datetime_utc: datetime = DateTimeField(null=True)
+
+    class Meta:
+        table_name = "shard_lease"
+
+
+def set_process_caches_enabled(enabled: bool):
+    # Кэши хранятся в памяти процесса. Если процессов бота несколько, то
+    # изменения из другого процесса (часовой пояс чата, добавление и удаление
+    # напоминаний) в них не видны, поэтому кэши нужно отключать
+    caches: list[tuple[LRUCache, int]] = [
+        (User._identity_cache, IDENTITY_CACHE_MAX_SIZE),
+        (Chat._identity_cache, IDENTITY_CACHE_MAX_SIZE),
+        (Reminder._count_cache, COUNT_CACHE_MAX_SIZE),
+    ]
+    for cache, max_size in caches:
+        cache.max_size = max_size if enabled else 0
+        cache.clear()
+
+
+def get_shard(chat_id: int, shard_count: int = SHARD_COUNT) -> int:
+    return chat_id % shard_count
+
+
+def migrate_tables(database: SqliteDatabase, models: list[type[BaseModel]]):
+    # Добавление в существующие таблицы новых столбцов
+    migrator = SqliteMigrator(database)
+    for model in models:
+        table_name: str = model._meta.table_name
+        if not database.table_exists(table_name):
+            continue
+
+        column_names: set[str] = {
+            column.name for column in database.get_columns(table_name)
+        }
+        migrate(
+            *(
+                migrator.add_column(table_name, field.column_name, field)
+                for field in model._meta.sorted_fields
+                if field.column_name not in column_names
+            )
+        )
+
+
+def get_sync_db() -> SqliteDatabase:
+    # Подключение, в котором запросы выполняются сразу, а не через очередь,
+    # и доступны транзакции. Для миграций и обслуживания базы
+    return SqliteDatabase(DB_FILE_NAME, pragmas=DB_PRAGMAS)
+
+
+def init_db():
+    # Создание и миграция таблиц выполняются через отдельное подключение, т.к.
+    # в SqliteQueueDatabase запросы на запись выполняются асинхронно в другом потоке,
+    # а запросы на чтение - сразу
+    models: list[type[BaseModel]] = BaseModel.get_inherited_models()
+
+    sync_db = get_sync_db()
+    with sync_db.bind_ctx(models):
+        migrate_tables(sync_db, models)
+        sync_db.create_tables(models)
+        Reminder.fill_repeat_columns()
+    sync_db.close()
+
+
+db.connect()
+init_db()
 
 
 if __name__ == "__main__":
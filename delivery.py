@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import asyncio
+import functools
+
+from typing import Awaitable, Callable
+
+from common import log
+
+
+class DeliveryPool:
+    """
+    Отправка сообщений в цикле событий asyncio.
+
+    Задачи одного чата выполняются по очереди, поэтому порядок отправки в рамках
+    чата сохраняется, а разные чаты обрабатываются параллельно.
+    Ожидающая задача - это корутина, а не место в очереди потока, поэтому
+    медленный чат не задерживает другие чаты.
+
+    NOTE: Методы вызываются только из потока цикла событий
+    """
+
+    def __init__(self):
+        self._in_flight: set[int] = set()
+        self._last_task_by_chat: dict[int, asyncio.Task] = dict()
+        self._tasks: set[asyncio.Task] = set()
+
+    async def _run(
+        self,
+        prev_task: asyncio.Task | None,
+        task_id: int,
+        func: Callable[[], Awaitable[None]],
+    ):
+        try:
+            if prev_task:
+                await asyncio.wait([prev_task])
+
+            await func()
+        except Exception:
+            log.exception("")
+        finally:
+            self._in_flight.discard(task_id)
+
+    def _on_done(self, chat_id: int, task: asyncio.Task):
+        self._tasks.discard(task)
+        if self._last_task_by_chat.get(chat_id) is task:
+            self._last_task_by_chat.pop(chat_id)
+
+    def is_in_flight(self, task_id: int) -> bool:
+        return task_id in self._in_flight
+
+    def submit(
+        self,
+        chat_id: int,
+        task_id: int,
+        func: Callable[[], Awaitable[None]],
+    ) -> bool:
+        """
+        Ставит задачу в очередь чата. Возвращает False, если задача с таким
+        идентификатором еще не выполнена
+        """
+
+        if task_id in self._in_flight:
+            return False
+        self._in_flight.add(task_id)
+
+        task: asyncio.Task = asyncio.create_task(
+            self._run(self._last_task_by_chat.get(chat_id), task_id, func)
+        )
+        task.add_done_callback(functools.partial(self._on_done, chat_id))
+        self._last_task_by_chat[chat_id] = task
+        self._tasks.add(task)
+        return True
+
+    async def join(self):
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
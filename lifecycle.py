@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import asyncio
+import concurrent.futures
+import enum
+import threading
+
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from telegram import Bot
+
+from common import log
+from parser import AutoName
+
+
+# Сколько ждать завершения начатых отправок при остановке
+DRAIN_TIMEOUT: float = 60
+
+
+class LifecycleStateEnum(AutoName):
+    STARTING = enum.auto()  # Бот еще не запущен
+    READY = enum.auto()  # Бот запущен, напоминания отправляются
+    PAUSED = enum.auto()  # Бот перезапускается, отправка остановлена
+    STOPPED = enum.auto()  # Бот остановлен
+
+
+class Lifecycle:
+    """
+    Жизненный цикл бота для планировщика напоминаний.
+
+    Планировщик ждет готовности бота, а при перезапуске бота отправка
+    приостанавливается, начатые отправки дожидаются завершения и затем
+    продолжаются уже с новым ботом.
+
+    Переходы вызываются из любого потока, ожидание - из цикла событий loop
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        drain: Callable[[], Awaitable[None]] | None = None,
+    ):
+        self.loop = loop
+        self._drain = drain
+
+        self._lock = threading.Lock()
+        self._state: LifecycleStateEnum = LifecycleStateEnum.STARTING
+        self._state_datetime_utc: datetime = datetime.utcnow()
+        self._bot: Bot | None = None
+
+        # Используются только из цикла событий
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._active: int = 0
+
+    def _set_state(self, state: LifecycleStateEnum):
+        with self._lock:
+            if self._state == state:
+                return
+
+            log.info(f"Lifecycle: {self._state.value} -> {state.value}")
+            self._state = state
+            self._state_datetime_utc = datetime.utcnow()
+
+    def get_state(self) -> LifecycleStateEnum:
+        with self._lock:
+            return self._state
+
+    def is_ready(self) -> bool:
+        return self.get_state() == LifecycleStateEnum.READY
+
+    def get_health(self) -> dict[str, Any]:
+        with self._lock:
+            return dict(
+                state=self._state.value,
+                since_utc=self._state_datetime_utc.isoformat(),
+                bot=self._bot.username if self._bot else None,
+            )
+
+    def start(self, bot: Bot):
+        with self._lock:
+            self._bot = bot
+
+        self._set_state(LifecycleStateEnum.READY)
+        self.loop.call_soon_threadsafe(self._ready.set)
+
+    def pause(self, timeout: float = DRAIN_TIMEOUT):
+        """
+        Останавливает отправку и ждет, пока начатые отправки завершатся
+        """
+
+        self._set_state(LifecycleStateEnum.PAUSED)
+
+        future = asyncio.run_coroutine_threadsafe(self._pause(), self.loop)
+
+        # До Python 3.11 concurrent.futures.TimeoutError - не встроенный TimeoutError
+        try:
+            future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            log.warning(f"Lifecycle: sending was not drained in {timeout} seconds")
+
+    def stop(self, timeout: float = DRAIN_TIMEOUT):
+        self.pause(timeout)
+        self._set_state(LifecycleStateEnum.STOPPED)
+
+    async def _pause(self):
+        self._ready.clear()
+        await self._idle.wait()
+
+        if self._drain:
+            await self._drain()
+
+    @asynccontextmanager
+    async def running(self) -> AsyncIterator[Bot]:
+        """
+        Ждет готовности и возвращает текущего бота.
+        Остановка ждет выхода из этого блока
+        """
+
+        await self._ready.wait()
+
+        self._active += 1
+        self._idle.clear()
+        try:
+            yield self._bot
+        finally:
+            self._active -= 1
+            if not self._active:
+                self._idle.set()
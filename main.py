@@ -4,139 +4,425 @@
 __author__ = "ipetrash"
 
 
-import os
+import asyncio
+import enum
+import functools
+import signal
 import time
 
-from datetime import datetime
-from threading import Thread
-from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Event, Thread, Lock
+from typing import Any, Callable
+from urllib.parse import urlparse
 
 from telegram import Bot, Message
 from telegram.ext import Updater, Defaults
+from telegram.utils.request import Request
 from telegram.error import BadRequest, Unauthorized
 
 import commands
+from activity import activity_tracker
 from common import datetime_to_str, prepare_text, log
-from config import TOKEN
-from db import Reminder
+from config import (
+    TOKEN,
+    WEBHOOK_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET_TOKEN,
+    SCHEDULER_SHARDING,
+)
+from db import Reminder, CatchUpPolicyEnum, CATCH_UP_POLICY, set_process_caches_enabled
+from delivery import DeliveryPool
+from lifecycle import Lifecycle
+from rate_limiter import RateLimitedBot, rate_limiter, PRIORITY_BULK
+from scheduler import reminder_scheduler
+from sharding import ShardLeaseManager
+from storage import storage
+from webhook import WebhookServer
+
+
+# С вебхуком за балансировщиком или с шардами процессов бота может быть
+# несколько, и изменения одного не видны в кэшах другого
+if WEBHOOK_URL or SCHEDULER_SHARDING:
+    set_process_caches_enabled(False)
+
+# Сигналы остановки бота, как у Updater.idle
+STOP_SIGNALS: tuple[signal.Signals, ...] = (
+    signal.SIGINT,
+    signal.SIGTERM,
+    signal.SIGABRT,
+)
+
+# Через сколько повторить попытку отправки, если она завершилась ошибкой
+RETRY_SEND_TIMEOUT: timedelta = timedelta(seconds=5)
+
+# Как часто записываются результаты отправки, пока пачка еще отправляется
+BATCH_FLUSH_TIMEOUT: float = 1
+
+# Количество потоков для обработчиков команд. Обработчики в основном ждут
+# ответа Bot API, поэтому количество не привязано к количеству ядер
+HANDLER_WORKERS: int = 32
+
+# Количество потоков для блокирующих вызовов Bot API при отправке напоминаний.
+# Ожидающие отправки напоминания - корутины цикла событий и потоков не занимают
+DELIVERY_WORKERS: int = 16
+
+# Количество потоков для запросов к базе из цикла событий
+DB_WORKERS: int = 4
+
+delivery_executor = ThreadPoolExecutor(
+    max_workers=DELIVERY_WORKERS, thread_name_prefix="Delivery"
+)
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="DB")
+
+delivery_pool = DeliveryPool()
+
+# Цикл событий планировщика и рассылки напоминаний, работает в отдельном потоке
+reminders_loop = asyncio.new_event_loop()
+
+# При перезапуске бота начатые отправки завершаются до запуска нового бота
+lifecycle = Lifecycle(loop=reminders_loop, drain=delivery_pool.join)
+
+# Если процессов бота несколько, то каждый отправляет напоминания своих шардов.
+# Пока бот перезапускается, его шарды отпускаются другим процессам
+shard_lease_manager: ShardLeaseManager | None = (
+    ShardLeaseManager(is_active=lifecycle.is_ready) if SCHEDULER_SHARDING else None
+)
+
+# Напоминания, добавленные другими процессами, не попадают в планировщик этого
+# процесса, поэтому с шардами база дополнительно проверяется с этим интервалом
+SHARD_POLL_TIMEOUT: float = 5
+
+
+class SendStatusEnum(enum.Enum):
+    SENT = enum.auto()  # Отправлено, запланирована следующая отправка
+    FINISHED = enum.auto()  # Отправлено, повторов нет или нет доступа к чату
+    FAILED = enum.auto()  # Не отправлено, попытка будет повторена
+    SKIPPED = enum.auto()  # Уже отправляется в другой пачке
+    MISSED = enum.auto()  # Пропущенный повтор не отправлен, запланирован следующий
+
+
+class ReminderBatch:
+    # Результаты отправки захваченных напоминаний. Записываются в базу
+    # несколькими запросами за раз: накопленные к моменту записи результаты,
+    # а не только после обработки всех напоминаний пачки, чтобы медленный
+    # чат не задерживал запись результатов остальных
+
+    def __init__(self, reminders: list[Reminder]):
+        self._lock = Lock()
+        self._remaining: int = len(reminders)
+        self._reminders_by_status: dict[SendStatusEnum, list[Reminder]] = {
+            status: [] for status in SendStatusEnum
+        }
+
+    def add(self, reminder: Reminder, status: SendStatusEnum) -> bool:
+        """
+        Возвращает True, если это был результат последнего напоминания пачки
+        """
+
+        with self._lock:
+            self._reminders_by_status[status].append(reminder)
+            self._remaining -= 1
+            return self._remaining == 0
+
+    def flush(self):
+        # Записываются накопленные результаты, новые копятся для следующей записи
+        with self._lock:
+            reminders_by_status = self._reminders_by_status
+            self._reminders_by_status = {status: [] for status in SendStatusEnum}
+
+        sent: list[Reminder] = reminders_by_status[SendStatusEnum.SENT]
+        finished: list[Reminder] = reminders_by_status[SendStatusEnum.FINISHED]
+        failed: list[Reminder] = reminders_by_status[SendStatusEnum.FAILED]
+        missed: list[Reminder] = reminders_by_status[SendStatusEnum.MISSED]
+        if not (sent or finished or failed or missed):
+            return
+
+        log.info(
+            f"Reminders batch: sent={len(sent)}, finished={len(finished)}, "
+            f"failed={len(failed)}, missed={len(missed)}"
+        )
+
+        # У пропущенных, как и у отправленных, сохраняется следующая отправка
+        sent = sent + missed
+
+        storage.save_claimed(sent)
+        storage.delete_reminders([reminder.id for reminder in finished])
+        storage.release_claimed([reminder.id for reminder in failed])
+
+        # Планирование следующего пробуждения планировщика
+        for reminder in sent:
+            reminder_scheduler.schedule(reminder.id, reminder.next_send_datetime_utc)
+
+        for reminder in finished:
+            reminder_scheduler.unschedule(reminder.id)
+
+        retry_datetime_utc: datetime = datetime.utcnow() + RETRY_SEND_TIMEOUT
+        for reminder in failed:
+            reminder_scheduler.schedule(reminder.id, retry_datetime_utc)
+
+
+def send_reminder_notification(
+    bot: Bot,
+    reminder: Reminder,
+    now_utc: datetime,
+) -> SendStatusEnum:
+    log.info("Send reminder: %s", reminder)
+
+    # Отправка уведомления
+    # Планирование следующей отправки
+    try:
+        is_missed: bool = reminder.is_missed(now_utc)
+        has_next: bool = reminder.process_next_notify(now_utc)
+
+        # Без повторов пропускать нечего, поэтому такое напоминание отправляется
+        if has_next and is_missed and CATCH_UP_POLICY == CatchUpPolicyEnum.SKIP:
+            log.info(f"Reminder #{reminder.id} missed, skipped")
+            return SendStatusEnum.MISSED
+
+        next_send_datetime_utc = reminder.next_send_datetime_utc
+        next_send_datetime = reminder.get_next_send_datetime()
+
+        lines: list[str] = [f"⌛ {reminder.target}"]
+        if has_next:
+            lines.append(
+                f"Следующее: {datetime_to_str(next_send_datetime)} "
+                f"(в UTC {datetime_to_str(next_send_datetime_utc)})"
+            )
+        text: str = prepare_text("\n".join(lines))
+
+        reply_to_message_id: int | None = reminder.get_reply_to_message_id()
+        while True:
+            try:
+                # Рассылка напоминаний уступает ответам пользователям
+                with rate_limiter.use_priority(PRIORITY_BULK):
+                    rs: Message = bot.send_message(
+                        chat_id=reminder.chat_id,
+                        text=text,
+                        reply_to_message_id=reply_to_message_id,
+                    )
+                reminder.last_send_message_id = rs.message_id
+                reminder.last_send_datetime_utc = datetime.utcnow()
+
+                return SendStatusEnum.SENT if has_next else SendStatusEnum.FINISHED
 
+            except BadRequest as e:
+                if "Message to be replied not found" in str(e):
+                    reply_to_message_id = None
+                    continue
 
-DATA: dict[str, Any] = {
-    "BOT": None,
-}
+                raise e
 
+            except Unauthorized:
+                log.exception(f"Нет доступа к чату #{reminder.chat_id}. Напоминание будет удалено")
+                return SendStatusEnum.FINISHED
 
-def process_check_reminders(bot: Bot):
+    except:
+        log.exception("")
+        return SendStatusEnum.FAILED
+
+
+async def run_db(func: Callable, *args) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(db_executor, func, *args)
+
+
+async def process_check_reminders(bot: Bot):
     now_utc = datetime.utcnow()
 
-    query = (
-        Reminder.select()
-        .where(now_utc >= Reminder.next_send_datetime_utc)
-        .order_by(Reminder.next_send_datetime_utc)
+    # Захват всех наступивших напоминаний одним запросом,
+    # результаты отправки будут записаны пакетно
+    shards: frozenset[int] | None = None
+    if shard_lease_manager:
+        shards = shard_lease_manager.get_shards()
+        if not shards:
+            return
+
+    reminders: list[Reminder] = await run_db(
+        functools.partial(storage.claim_due, now_utc, shards=shards)
     )
+    if not reminders:
+        return
 
-    for reminder in query:
-        log.info("Send reminder: %s", reminder)
+    batch = ReminderBatch(reminders)
+    flush_task: asyncio.Task | None = None
 
-        # Отправка уведомления
-        # Планирование следующей отправки
-        try:
-            has_next: bool = reminder.process_next_notify(now_utc)
-
-            next_send_datetime_utc = reminder.next_send_datetime_utc
-            next_send_datetime = reminder.get_next_send_datetime()
-
-            lines: list[str] = [f"⌛ {reminder.target}"]
-            if has_next:
-                lines.append(
-                    f"Следующее: {datetime_to_str(next_send_datetime)} "
-                    f"(в UTC {datetime_to_str(next_send_datetime_utc)})"
-                )
-            text: str = prepare_text("\n".join(lines))
-
-            reply_to_message_id: int | None = reminder.get_reply_to_message_id()
-            while True:
-                try:
-                    rs: Message = bot.send_message(
-                        chat_id=reminder.chat_id,
-                        text=text,
-                        reply_to_message_id=reply_to_message_id,
-                    )
-                    reminder.last_send_message_id = rs.message_id
-                    reminder.last_send_datetime_utc = datetime.utcnow()
-                    reminder.save()
+    async def _flush_later():
+        nonlocal flush_task
 
-                    break
+        await asyncio.sleep(BATCH_FLUSH_TIMEOUT)
+        flush_task = None
+        await run_db(batch.flush)
 
-                except BadRequest as e:
-                    if "Message to be replied not found" in str(e):
-                        reply_to_message_id = None
-                        continue
+    async def _finish(reminder: Reminder, status: SendStatusEnum):
+        nonlocal flush_task
 
-                    raise e
+        if batch.add(reminder, status):
+            if flush_task:
+                flush_task.cancel()
+                flush_task = None
 
-                except Unauthorized:
-                    log.exception(f"Нет доступа к чату #{reminder.chat_id}. Напоминание будет удалено")
-                    reminder.delete_instance()
-                    break
+            await run_db(batch.flush)
 
-        except:
-            log.exception("")
+        elif not flush_task:
+            # Результаты, накопленные за интервал, записываются вместе
+            flush_task = asyncio.create_task(_flush_later())
 
+    async def _send(reminder: Reminder):
+        status: SendStatusEnum = SendStatusEnum.FAILED
+        try:
+            status = await asyncio.get_running_loop().run_in_executor(
+                delivery_executor, send_reminder_notification, bot, reminder, now_utc
+            )
         finally:
-            time.sleep(1)
+            await _finish(reminder, status)
 
+    for reminder in reminders:
+        is_submitted: bool = delivery_pool.submit(
+            chat_id=reminder.chat_id,
+            task_id=reminder.id,
+            func=functools.partial(_send, reminder),
+        )
+        if not is_submitted:
+            await _finish(reminder, SendStatusEnum.SKIPPED)
 
-def do_checking_reminders():
-    while True:
-        bot: Bot | None = DATA["BOT"]
-        if not bot:
-            time.sleep(0.001)
-            continue
 
+async def do_checking_reminders():
+    while True:
+        reminder_ids: list[int] = []
         try:
-            process_check_reminders(bot)
-        except:
+            # Ожидание ближайшей отправки вместо постоянного опроса базы
+            reminder_ids = await reminder_scheduler.wait_due(
+                executor=db_executor,
+                max_timeout=SHARD_POLL_TIMEOUT if shard_lease_manager else None,
+            )
+
+            # Пока бот не запущен или перезапускается, напоминания ждут.
+            # Наступившие за это время захватываются все сразу из базы
+            async with lifecycle.running() as bot:
+                await process_check_reminders(bot)
+        except Exception:
             log.exception("")
-        finally:
-            time.sleep(1)
+
+            # Например, при ошибке захвата напоминаний. Снятые с расписания
+            # напоминания повторяются, а не ждут перезагрузки расписания
+            reminder_scheduler.schedule_missing(
+                reminder_ids, datetime.utcnow() + RETRY_SEND_TIMEOUT
+            )
+            await asyncio.sleep(1)
+
+
+def run_reminders_loop():
+    asyncio.set_event_loop(reminders_loop)
+    reminders_loop.run_until_complete(do_checking_reminders())
+
+
+def run_webhook(updater: Updater):
+    dp = updater.dispatcher
+
+    server = WebhookServer(
+        bot=updater.bot,
+        update_queue=dp.update_queue,
+        secret_token=WEBHOOK_SECRET_TOKEN,
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORT,
+        url_path=urlparse(WEBHOOK_URL).path,
+        lifecycle=lifecycle,
+    )
+    dispatcher_thread = Thread(target=dp.start, name="Dispatcher")
+    dispatcher_thread.start()
+    server.start()
+    log.debug(f"Webhook server on {WEBHOOK_HOST}:{server.port}")
+
+    # Updater.idle не подходит: без start_polling/start_webhook его обработчик
+    # сигнала завершает процесс через os._exit, и остановка не выполняется
+    stop_event = Event()
+
+    def _on_signal(signum: int, _):
+        log.info(f"Received signal {signum}, stopping")
+        stop_event.set()
+
+    prev_handlers: dict[int, Any] = {
+        signum: signal.signal(signum, _on_signal) for signum in STOP_SIGNALS
+    }
+    try:
+        updater.bot.set_webhook(
+            url=WEBHOOK_URL,
+            api_kwargs=dict(secret_token=WEBHOOK_SECRET_TOKEN),
+        )
+
+        # Ожидание сигнала остановки
+        stop_event.wait()
+
+    finally:
+        for signum, handler in prev_handlers.items():
+            signal.signal(signum, handler)
+
+        server.stop()
+        dp.stop()
+        dispatcher_thread.join()
 
 
 def main():
     log.debug("Start")
 
-    cpu_count = os.cpu_count()
-    workers = cpu_count
-    log.debug(f"System: CPU_COUNT={cpu_count}, WORKERS={workers}")
+    workers = HANDLER_WORKERS
+    log.debug(f"System: WORKERS={workers}, DELIVERY_WORKERS={DELIVERY_WORKERS}")
 
-    updater = Updater(
+    # Все исходящие запросы бота проходят через ограничитель частоты
+    bot = RateLimitedBot(
         TOKEN,
-        workers=workers,
+        request=Request(con_pool_size=workers + 4 + DELIVERY_WORKERS),
         defaults=Defaults(run_async=True),
     )
-    bot = updater.bot
-    log.debug(f"Bot name {bot.first_name!r} ({bot.name})")
 
-    DATA["BOT"] = bot
+    updater = Updater(
+        bot=bot,
+        workers=workers,
+    )
+    log.debug(f"Bot name {bot.first_name!r} ({bot.name})")
 
     dp = updater.dispatcher
     commands.setup(dp)
 
-    updater.start_polling()
-    updater.idle()
+    lifecycle.start(bot)
+    try:
+        if WEBHOOK_URL:
+            run_webhook(updater)
+        else:
+            updater.start_polling()
+            updater.idle()
+    finally:
+        # Напоминания, начатые этим ботом, отправляются до запуска нового
+        lifecycle.pause()
+        activity_tracker.flush()
 
     log.debug("Finish")
 
 
 if __name__ == "__main__":
-    Thread(target=do_checking_reminders).start()
+    # Начатые отправки завершаются при остановке бота, поэтому поток
+    # планировщика не держит процесс
+    Thread(target=run_reminders_loop, daemon=True).start()
+    activity_tracker.start()
+    if shard_lease_manager:
+        shard_lease_manager.start()
 
     while True:
         try:
             main()
+
+            # Бот остановлен сигналом
+            lifecycle.stop()
+            break
+
         except:
             log.exception("")
 
             timeout = 15
             log.info(f"Restarting the bot after {timeout} seconds")
             time.sleep(timeout)
+
+    # Шарды сразу достаются другим процессам
+    if shard_lease_manager:
+        shard_lease_manager.release_all()
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import argparse
+import sqlite3
+import time
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone, tzinfo
+from typing import Iterable, NamedTuple, Sequence
+
+from peewee import Case, Database, DateTimeField, fn
+from playhouse.sqliteq import SqliteQueueDatabase
+
+from common import convert_tz, get_tz, log
+from db import BaseModel, Chat, Reminder, BULK_BATCH_SIZE, get_sync_db
+from occurrences import parse_repeat_before
+from repeat_codec import decode_repeat_before
+
+
+# UPDATE ... FROM появился в SQLite 3.33
+IS_UPDATE_FROM_SUPPORTED: bool = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+
+def get_epoch(dt: datetime) -> int:
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+def get_nearest_send(target: int, offsets: tuple[int, ...], now: int) -> int:
+    """
+    То же, что get_nearest_datetime, но над секундами от начала эпохи.
+    offsets - смещения напоминаний до в секундах по возрастанию, первое равно 0.
+    Если даже target не позже now, то возвращается target
+    """
+
+    # Ближайшая отправка - с наибольшим смещением, при котором она еще впереди
+    i: int = bisect_left(offsets, target - now) - 1
+    if i < 0:
+        return target
+    return target - offsets[i]
+
+
+class OffsetsTable:
+    # Смещения хранятся один раз на каждое уникальное значение напоминаний до,
+    # а у напоминания только номер строки этой таблицы
+
+    def __init__(self):
+        self.items: list[tuple[int, ...]] = []
+        self._index_by_value: dict[bytes | str | None, int] = dict()
+
+    def get_index(self, packed: bytes | None, value: str | None) -> int:
+        key: bytes | str | None = bytes(packed) if packed is not None else value
+
+        index: int | None = self._index_by_value.get(key)
+        if index is None:
+            if packed is not None:
+                units = decode_repeat_before(key)
+            elif value:
+                units = parse_repeat_before(value)
+            else:
+                units = tuple()
+
+            offsets: set[int] = {0}
+            offsets.update(int(unit.delta.total_seconds()) for unit in units)
+
+            index = len(self.items)
+            self.items.append(tuple(sorted(offsets)))
+            self._index_by_value[key] = index
+
+        return index
+
+
+def update_datetimes(
+    fields: list[DateTimeField],
+    reminder_ids: Sequence[int],
+    *values: Sequence[int],
+    database: Database | None = None,
+):
+    """
+    Записывает в поля fields значения values (секунды от начала эпохи)
+    напоминаний reminder_ids одним UPDATE.
+    Значения передаются таблицей VALUES, а запрос собирается строкой, а не
+    через peewee, т.к. на больших пачках построение выражения peewee медленнее
+    самого запроса. В SQLite старше 3.33 запись идет через update_datetimes_by_case
+    """
+
+    if not IS_UPDATE_FROM_SUPPORTED:
+        update_datetimes_by_case(fields, reminder_ids, *values, database=database)
+        return
+
+    table: str = Reminder._meta.table_name
+    id_column: str = Reminder.id.column_name
+
+    assignments: str = ", ".join(
+        f"\"{field.column_name}\" = datetime(v.column{i}, 'unixepoch')"
+        for i, field in enumerate(fields, start=2)
+    )
+    row: str = "(" + ", ".join("?" * (len(fields) + 1)) + ")"
+    sql: str = (
+        f'UPDATE "{table}" SET {assignments} '
+        f'FROM (VALUES {", ".join([row] * len(reminder_ids))}) AS v '
+        f'WHERE "{table}"."{id_column}" = v.column1'
+    )
+
+    params: list[int] = []
+    for row_values in zip(reminder_ids, *values):
+        params += row_values
+
+    (database or Reminder._meta.database).execute_sql(sql, params)
+
+
+def update_datetimes_by_case(
+    fields: list[DateTimeField],
+    reminder_ids: Sequence[int],
+    *values: Sequence[int],
+    database: Database | None = None,
+):
+    """
+    То же, что update_datetimes, но через CASE, как Reminder.bulk_update.
+    Работает в любой версии SQLite
+    """
+
+    query = Reminder.update(
+        {
+            field: Case(
+                Reminder.id,
+                [
+                    (reminder_id, field.db_value(datetime.utcfromtimestamp(value)))
+                    for reminder_id, value in zip(reminder_ids, field_values)
+                ],
+            )
+            for field, field_values in zip(fields, values)
+        }
+    ).where(Reminder.id.in_(list(reminder_ids)))
+    query.execute(database or Reminder._meta.database)
+
+
+def recompute_next_send_datetime(
+    now_utc: datetime | None = None,
+    filters: Iterable | None = None,
+    batch_size: int = BULK_BATCH_SIZE,
+) -> int:
+    """
+    Пересчитывает ближайшую отправку напоминаний по их целевой дате и
+    напоминаниям до. Возвращает количество измененных записей.
+
+    Столбцы загружаются в массивы без создания объектов моделей и datetime,
+    даты переводятся в секунды в SQLite. В базу записываются только
+    изменившиеся значения, пачками по одному UPDATE.
+    Захваченные для отправки напоминания не меняются
+    """
+
+    if now_utc is None:
+        now_utc = datetime.utcnow()
+    now: int = get_epoch(now_utc)
+
+    query = (
+        Reminder.select(
+            Reminder.id,
+            fn.strftime("%s", Reminder.target_datetime_utc).cast("INTEGER"),
+            fn.strftime("%s", Reminder.next_send_datetime_utc).cast("INTEGER"),
+            Reminder.repeat_before_packed,
+            Reminder.repeat_before,
+        )
+        .where(Reminder.claim_token.is_null(), *(filters or []))
+    )
+
+    ids = array("q")
+    targets = array("q")
+    next_sends = array("q")
+    offsets_indexes = array("l")
+    offsets_table = OffsetsTable()
+
+    # Строки читаются напрямую из курсора, без обработки каждой строки в peewee
+    cursor = Reminder._meta.database.execute_sql(*query.sql())
+    for reminder_id, target, next_send, packed, value in cursor:
+        ids.append(reminder_id)
+        targets.append(target)
+        next_sends.append(next_send)
+        offsets_indexes.append(offsets_table.get_index(packed, value))
+
+    offsets_items: list[tuple[int, ...]] = offsets_table.items
+    changed_ids = array("q")
+    changed_next_sends = array("q")
+    for i, target in enumerate(targets):
+        next_send: int = get_nearest_send(
+            target, offsets_items[offsets_indexes[i]], now
+        )
+        if next_send != next_sends[i]:
+            changed_ids.append(ids[i])
+            changed_next_sends.append(next_send)
+
+    for i in range(0, len(changed_ids), batch_size):
+        update_datetimes(
+            [Reminder.next_send_datetime_utc],
+            changed_ids[i : i + batch_size],
+            changed_next_sends[i : i + batch_size],
+        )
+
+    return len(changed_ids)
+
+
+class TzMigrationResult(NamedTuple):
+    changed: int
+    elapsed: float  # Секунды
+    next_send_by_id: dict[int, datetime]
+
+
+def migrate_chat_tz(
+    chat_id: int,
+    from_tz: tzinfo,
+    to_tz: tzinfo,
+    now_utc: datetime | None = None,
+    batch_size: int = BULK_BATCH_SIZE,
+    database: Database | None = None,
+) -> TzMigrationResult:
+    """
+    Переносит напоминания чата в новый часовой пояс так, чтобы местное время
+    напоминаний не изменилось: "10:00 каждый день" останется в 10:00.
+    Целевая дата и ближайшая отправка записываются только у изменившихся
+    напоминаний, одним UPDATE на пачку.
+    Захваченные для отправки напоминания тоже переносятся, а следующую
+    отправку, рассчитанную при отправке в старом поясе, переносит
+    Reminder.save_claimed
+    """
+
+    t = time.perf_counter()
+
+    if now_utc is None:
+        now_utc = datetime.utcnow()
+    now: int = get_epoch(now_utc)
+
+    # Выборка по индексу (chat, user, next_send_datetime_utc)
+    query = Reminder.select(
+        Reminder.id,
+        Reminder.target_datetime_utc,
+        Reminder.next_send_datetime_utc,
+        Reminder.repeat_before_packed,
+        Reminder.repeat_before,
+    ).where(Reminder.chat == chat_id)
+
+    ids = array("q")
+    targets = array("q")
+    next_sends = array("q")
+    offsets_table = OffsetsTable()
+
+    rows = query.tuples().execute(database or Reminder._meta.database)
+    for reminder_id, target_datetime_utc, next_send_datetime_utc, packed, value in rows:
+        target_datetime: datetime = convert_tz(
+            dt=target_datetime_utc, from_tz=timezone.utc, to_tz=from_tz
+        )
+        target: int = get_epoch(
+            convert_tz(dt=target_datetime, from_tz=to_tz, to_tz=timezone.utc)
+        )
+        offsets: tuple[int, ...] = offsets_table.items[
+            offsets_table.get_index(packed, value)
+        ]
+
+        next_send: int = get_nearest_send(target, offsets, now)
+
+        # Например, у поясов с одинаковым смещением ничего не меняется
+        if (target, next_send) == (
+            get_epoch(target_datetime_utc),
+            get_epoch(next_send_datetime_utc),
+        ):
+            continue
+
+        ids.append(reminder_id)
+        targets.append(target)
+        next_sends.append(next_send)
+
+    # Напоминаний одного чата немного, поэтому запись через CASE, который
+    # работает в любой версии SQLite
+    for i in range(0, len(ids), batch_size):
+        update_datetimes_by_case(
+            [Reminder.target_datetime_utc, Reminder.next_send_datetime_utc],
+            ids[i : i + batch_size],
+            targets[i : i + batch_size],
+            next_sends[i : i + batch_size],
+            database=database,
+        )
+
+    return TzMigrationResult(
+        changed=len(ids),
+        elapsed=time.perf_counter() - t,
+        next_send_by_id={
+            reminder_id: datetime.utcfromtimestamp(next_send)
+            for reminder_id, next_send in zip(ids, next_sends)
+        },
+    )
+
+
+def change_chat_tz(
+    chat: Chat,
+    tz: str,
+    now_utc: datetime | None = None,
+) -> TzMigrationResult:
+    """
+    Устанавливает часовой пояс чата и переносит его напоминания
+    в одной транзакции, чтобы они не разошлись при ошибке
+    """
+
+    from_tz: tzinfo = chat.get_tz()
+    to_tz: tzinfo = get_tz(tz)
+
+    # В SqliteQueueDatabase транзакции недоступны,
+    # поэтому используется отдельное подключение
+    database: Database = Chat._meta.database
+    is_queue_db: bool = isinstance(database, SqliteQueueDatabase)
+    if is_queue_db:
+        database = get_sync_db()
+
+    try:
+        with database.atomic():
+            Chat.update(tz=tz).where(Chat.id == chat.id).execute(database)
+            result: TzMigrationResult = migrate_chat_tz(
+                chat_id=chat.id,
+                from_tz=from_tz,
+                to_tz=to_tz,
+                now_utc=now_utc,
+                database=database,
+            )
+    finally:
+        if is_queue_db:
+            database.close()
+
+    # Объект чата из кэша
+    chat.tz = tz
+
+    return result
+
+
+def run_recompute():
+    models: list[type[BaseModel]] = BaseModel.get_inherited_models()
+
+    # Все изменения записываются в одной транзакции
+    sync_db = get_sync_db()
+    with sync_db.bind_ctx(models):
+        t = time.perf_counter()
+        with sync_db.atomic():
+            Reminder.fill_repeat_columns()
+            changed: int = recompute_next_send_datetime()
+        elapsed: float = time.perf_counter() - t
+    sync_db.close()
+
+    log.info(
+        f"Recomputed next send of reminders: changed={changed}, "
+        f"elapsed={elapsed:.3f} secs"
+    )
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Обслуживание базы напоминаний. "
+        "Работающий бот подхватит изменения при перезагрузке планировщика"
+    )
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "recompute",
+        help="Пересчитать ближайшую отправку всех напоминаний",
+    )
+
+    args = arg_parser.parse_args()
+    match args.command:
+        case "recompute":
+            run_recompute()
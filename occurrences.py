@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import functools
+import json
+import threading
+
+from collections import deque
+from datetime import datetime
+from typing import Iterator, NamedTuple
+
+from common import LRUCache
+from parser import RepeatEvery, TimeUnit
+
+
+# Сколько ближайших отправок рассчитывается за раз
+OCCURRENCES_LIMIT: int = 16
+
+# Для скольких напоминаний хранятся рассчитанные отправки
+OCCURRENCES_CACHE_MAX_SIZE: int = 10_000
+
+# Сколько разных правил повтора хранится в разобранном виде
+RULES_CACHE_MAX_SIZE: int = 1024
+
+
+class Occurrence(NamedTuple):
+    send_datetime: datetime
+    target_datetime: datetime
+
+
+# NOTE: Разобранные значения общие для всех напоминаний, их нельзя изменять
+@functools.lru_cache(maxsize=RULES_CACHE_MAX_SIZE)
+def parse_repeat_every(value: str) -> RepeatEvery | None:
+    return RepeatEvery.parse_value(value)
+
+
+@functools.lru_cache(maxsize=RULES_CACHE_MAX_SIZE)
+def parse_repeat_before(value: str) -> tuple[TimeUnit, ...]:
+    return tuple(TimeUnit.parse_value(v) for v in json.loads(value))
+
+
+def iter_occurrences(
+    target_datetime: datetime,
+    repeat_every: RepeatEvery | None,
+    repeat_before: tuple[TimeUnit, ...],
+    after: datetime,
+) -> Iterator[Occurrence]:
+    """
+    Отправки позже after по возрастанию: для каждого повтора сначала
+    напоминания до него, затем сам повтор.
+    Напоминание до повтора, которое раньше предыдущего повтора, не отправляется,
+    как и в get_nearest_datetime
+    """
+
+    # Пропущенные повторы не перебираются
+    count: int = 0
+    if repeat_every and target_datetime <= after:
+        count = repeat_every.get_count_to_pass(target_datetime, after)
+
+    prev_target_datetime: datetime = after
+    while True:
+        if count == 0:
+            current_target_datetime: datetime = target_datetime
+        elif repeat_every:
+            current_target_datetime = repeat_every.get_next_datetime(
+                target_datetime, count
+            )
+        else:
+            return
+
+        send_datetimes: set[datetime] = {current_target_datetime}
+        for unit in repeat_before:
+            send_datetimes.add(unit.get_prev_datetime(current_target_datetime))
+
+        for send_datetime in sorted(send_datetimes):
+            if send_datetime > prev_target_datetime and send_datetime > after:
+                yield Occurrence(send_datetime, current_target_datetime)
+
+        prev_target_datetime = current_target_datetime
+        count += 1
+
+
+class OccurrencesCache:
+    """
+    Ближайшие отправки напоминаний, рассчитанные заранее.
+
+    При отправке следующая дата берется из очереди и не пересчитывается,
+    пока очередь не закончится
+    """
+
+    def __init__(
+        self,
+        limit: int = OCCURRENCES_LIMIT,
+        max_size: int = OCCURRENCES_CACHE_MAX_SIZE,
+    ):
+        self.limit: int = limit
+        self._cache = LRUCache(max_size=max_size)
+        self._lock = threading.Lock()
+
+    def get_next(
+        self,
+        reminder_id: int,
+        target_datetime: datetime,
+        next_send_datetime: datetime | None,
+        repeat_every: RepeatEvery | None,
+        repeat_before: tuple[TimeUnit, ...],
+        now: datetime,
+    ) -> Occurrence | None:
+        """
+        Возвращает первую отправку позже now.
+        Очередь пересчитывается, если правила повтора или текущая отправка
+        напоминания не совпадают с теми, что были выданы из очереди
+        """
+
+        key = (repeat_every, repeat_before)
+        current = Occurrence(next_send_datetime, target_datetime)
+
+        with self._lock:
+            item: tuple[tuple, Occurrence, deque[Occurrence]] | None = (
+                self._cache.get(reminder_id)
+            )
+            if item and item[0] == key and item[1] == current:
+                queue: deque[Occurrence] = item[2]
+                while queue and queue[0].send_datetime <= now:
+                    queue.popleft()
+            else:
+                queue = deque()
+
+            if not queue:
+                iterator: Iterator[Occurrence] = iter_occurrences(
+                    target_datetime=target_datetime,
+                    repeat_every=repeat_every,
+                    repeat_before=repeat_before,
+                    after=now,
+                )
+                for occurrence in iterator:
+                    queue.append(occurrence)
+                    if len(queue) >= self.limit:
+                        break
+
+            if not queue:
+                self._cache.pop(reminder_id)
+                return
+
+            occurrence: Occurrence = queue.popleft()
+            self._cache.put(reminder_id, (key, occurrence, queue))
+            return occurrence
+
+    def pop(self, reminder_id: int):
+        with self._lock:
+            self._cache.pop(reminder_id)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+occurrences_cache = OccurrencesCache()
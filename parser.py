@@ -5,24 +5,42 @@ __author__ = "ipetrash"
 
 
 import enum
+import functools
 import re
+import time
 
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from typing import Any, Optional, Type
 
 from common import get_int_from_match
+from config import MESS_MAX_LENGTH
+from datetime_utils import (
+    add_months,
+    add_years,
+    add_weekdays,
+    get_months_between,
+    get_steps_to_pass,
+)
 
 
 class ParserException(Exception):
     pass
 
 
-PATTERN_TARGET_DATETIME: re.Pattern = re.compile(
+# Максимальная длина команды, дальше текст не разбирается
+COMMAND_MAX_LENGTH: int = MESS_MAX_LENGTH
+
+# Сколько секунд можно потратить на поиск даты в команде
+PARSE_TIMEOUT: float = 0.5
+
+# Сколько разных TimeUnit хранится для повторного использования
+UNITS_CACHE_MAX_SIZE: int = 1024
+
+# Все, что идет после причины
+PATTERN_TARGET_DATETIME_TAIL: re.Pattern = re.compile(
     r"""
-    .*?
-    # Причина
-    "(?P<target>.+?)"\s*
+    \s*
     (
         # День месяц год в DD MMM YYYY, MMM - название месяца, а не номер
         (?P<day>\d{1,2})\s*(?P<month>\w+)(.*?(?P<year>\d{4}))?
@@ -42,6 +60,16 @@ PATTERN_TARGET_DATETIME: re.Pattern = re.compile(
     flags=re.IGNORECASE | re.VERBOSE,
 )
 
+# NOTE: Шаблон применяется через match с позиций кавычек, см. search_target_datetime
+PATTERN_TARGET_DATETIME: re.Pattern = re.compile(
+    r"""
+    # Причина
+    "(?P<target>.+?)"
+    """
+    + PATTERN_TARGET_DATETIME_TAIL.pattern,
+    flags=PATTERN_TARGET_DATETIME_TAIL.flags,
+)
+
 PATTERN_REPEAT_EVERY: re.Pattern = re.compile(
     r"""
     Повтор\s*(?:раз\s*в|кажд\w{1,2})\s*
@@ -105,11 +133,25 @@ class TimeUnitWeekDayEnum(enum.IntEnum):
     SUNDAY = 7
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TimeUnit:
     number: int
     unit: TimeUnitEnum
 
+    # Рассчитывается один раз при создании, а не при каждом сравнении
+    delta: timedelta = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(
+            self, "delta", timedelta(days=self.number * self.unit.days())
+        )
+
+    @staticmethod
+    @functools.lru_cache(maxsize=UNITS_CACHE_MAX_SIZE)
+    def get(number: int, unit: TimeUnitEnum) -> "TimeUnit":
+        # Одинаковые значения - один и тот же объект
+        return TimeUnit(number=number, unit=unit)
+
     @classmethod
     def parse_text(cls, value: str) -> Optional["TimeUnit"]:
         if not value:
@@ -117,22 +159,22 @@ class TimeUnit:
 
         match value.lower():
             case "год" | "года":
-                return cls(number=1, unit=TimeUnitEnum.YEAR)
+                return cls.get(1, TimeUnitEnum.YEAR)
             case "полгода":
-                return cls(number=6, unit=TimeUnitEnum.MONTH)
+                return cls.get(6, TimeUnitEnum.MONTH)
             case "месяц" | "месяца" | "месяцев":
-                return cls(number=1, unit=TimeUnitEnum.MONTH)
+                return cls.get(1, TimeUnitEnum.MONTH)
             case "неделю" | "недели" | "недель":
-                return cls(number=1, unit=TimeUnitEnum.WEEK)
+                return cls.get(1, TimeUnitEnum.WEEK)
             case "день" | "дня" | "дней":
-                return cls(number=1, unit=TimeUnitEnum.DAY)
+                return cls.get(1, TimeUnitEnum.DAY)
             case _:
                 return
 
     @classmethod
     def parse_value(cls, value: str) -> "TimeUnit":
         number_str, unit_str = value.split()
-        return cls(number=int(number_str), unit=TimeUnitEnum(unit_str))
+        return cls.get(int(number_str), TimeUnitEnum(unit_str))
 
     def get_value(self) -> str:
         return f"{self.number} {self.unit.value}"
@@ -144,13 +186,13 @@ class TimeUnit:
         return dt + self.get_timedelta()
 
     def get_timedelta(self) -> timedelta:
-        return timedelta(days=self.number * self.unit.days())
+        return self.delta
 
     def __lt__(self, other: "TimeUnit") -> bool:
-        return self.get_timedelta() < other.get_timedelta()
+        return self.delta < other.delta
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TimeUnitWeekDayUnit:
     unit: TimeUnitWeekDayEnum
 
@@ -184,15 +226,11 @@ class TimeUnitWeekDayUnit:
     def get_value(self) -> str:
         return self.unit.name
 
-    def get_next_datetime(self, dt: datetime) -> datetime:
-        while True:
-            dt += timedelta(days=1)
-            if dt.isoweekday() == self.unit.value:
-                break
-        return dt
+    def get_next_datetime(self, dt: datetime, count: int = 1) -> datetime:
+        return add_weekdays(dt, self.unit.value, count)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class RepeatEvery:
     unit: TimeUnit | TimeUnitWeekDayUnit
 
@@ -220,55 +258,52 @@ class RepeatEvery:
     def get_value(self) -> str:
         return self.unit.get_value()
 
-    def get_next_datetime(self, dt: datetime) -> datetime:
+    def get_next_datetime(self, dt: datetime, count: int = 1) -> datetime:
+        """
+        Возвращает count-й повтор после dt.
+        Для месяцев и лет день, которого нет в итоговом месяце, заменяется на
+        последний день месяца, а при count > 1 не накапливается:
+        31 января + 2 месяца = 31 марта, а не 28 (29) марта
+        """
+
         # Для повторов по TimeUnit нужна точная дата, а не просто +30 или +365 дней
         if isinstance(self.unit, TimeUnit):
-            # SOURCE: https://github.com/gil9red/SimplePyScripts/blob/9a5a457f066934aa9da593dabf0ff48c1aa7202a/datetime_example/correct_datetime.py#L12
-            # Текущий день может отсутствовать, поэтому ищем ближайший день
-            # Например, если день 31, то ищем ближайший день 30
-            def _correct_datetime(
-                dt: datetime,
-                target_year: int,
-                target_month: int,
-            ) -> datetime:
-                while True:
-                    try:
-                        dt = dt.replace(year=target_year, month=target_month)
-                        break
-                    except ValueError:
-                        dt -= timedelta(days=1)
-                return dt
-
-            if self.unit.unit == TimeUnitEnum.YEAR:
-                return _correct_datetime(
-                    dt=dt,
-                    target_year=dt.year + self.unit.number,
-                    target_month=dt.month,
-                )
-
-            elif self.unit.unit == TimeUnitEnum.MONTH:
-                # TODO: Добавить сдвиг к целевой дате?
-                #       Например, если дата 30, в следующем месяце будет 29,
-                #       а еще в следующем месяце есть 30-я дата, то ее брать
-                month: int = dt.month
-                year: int = dt.year
-
-                for _ in range(self.unit.number):
-                    month += 1
-                    if month > 12:
-                        month = 1
-                        year += 1
-
-                return _correct_datetime(
-                    dt=dt,
-                    target_year=year,
-                    target_month=month,
-                )
-
-        return self.unit.get_next_datetime(dt)
+            match self.unit.unit:
+                case TimeUnitEnum.YEAR:
+                    return add_years(dt, self.unit.number * count)
+                case TimeUnitEnum.MONTH:
+                    return add_months(dt, self.unit.number * count)
+                case _:
+                    return dt + self.unit.get_timedelta() * count
 
+        return self.unit.get_next_datetime(dt, count)
 
-@dataclass
+    def get_count_to_pass(self, dt: datetime, after: datetime) -> int:
+        """
+        Возвращает номер первого повтора после dt, который будет позже after
+        """
+
+        if isinstance(self.unit, TimeUnit):
+            match self.unit.unit:
+                case TimeUnitEnum.YEAR | TimeUnitEnum.MONTH:
+                    months: int = self.unit.number
+                    if self.unit.unit == TimeUnitEnum.YEAR:
+                        months *= 12
+                    return max(1, get_months_between(dt, after) // months + 1)
+                case _:
+                    return max(
+                        1, get_steps_to_pass(dt, after, self.unit.get_timedelta())
+                    )
+
+        first_dt: datetime = self.unit.get_next_datetime(dt)
+        return get_steps_to_pass(first_dt, after, timedelta(weeks=1)) + 1
+
+    def get_next_datetime_after(self, dt: datetime, after: datetime) -> datetime:
+        # Первый повтор позже after без перебора пропущенных повторов
+        return self.get_next_datetime(dt, self.get_count_to_pass(dt, after))
+
+
+@dataclass(frozen=True, slots=True)
 class ParseResult:
     target: str
     target_datetime: datetime
@@ -282,7 +317,48 @@ class Defaults:
     minutes: int
 
 
+def search_target_datetime(
+    command: str,
+    timeout: float = PARSE_TIMEOUT,
+) -> re.Match | None:
+    # Результат тот же, что и у PATTERN_TARGET_DATETIME.search с ведущим .*?,
+    # но за линейное время.
+    # Причина не переходит на следующую строку, поэтому шаблон совпадет с
+    # первой кавычки строки, если в ней есть закрывающая кавычка, после которой
+    # идет дата. Закрывающие кавычки проверяются по очереди хвостом шаблона, и
+    # каждая проверяется один раз, а не для каждой открывающей кавычки
+    command = command[:COMMAND_MAX_LENGTH]
+    deadline: float = time.monotonic() + timeout
+
+    start: int = -1
+    line_end: int = -1
+    pos: int = command.find('"')
+    while pos != -1:
+        if time.monotonic() > deadline:
+            raise ParserException(
+                f"Превышено время разбора команды ({timeout} секунд)"
+            )
+
+        if start == -1 or (line_end != -1 and pos > line_end):
+            # Первая кавычка строки
+            start = pos
+            line_end = command.find("\n", pos)
+
+        elif pos - start > 1 and PATTERN_TARGET_DATETIME_TAIL.match(
+            command, pos + 1
+        ):
+            return PATTERN_TARGET_DATETIME.match(command, start)
+
+        pos = command.find('"', pos + 1)
+
+    return
+
+
 def get_repeat_every(command: str) -> RepeatEvery | None:
+    # Быстрая проверка перед регуляркой
+    if "повтор" not in command.lower():
+        return
+
     m = PATTERN_REPEAT_EVERY.search(command)
     if not m:
         return
@@ -291,13 +367,15 @@ def get_repeat_every(command: str) -> RepeatEvery | None:
 
     repeat_every: RepeatEvery | None = RepeatEvery.parse_text(m.group("unit"))
     if repeat_every and isinstance(repeat_every.unit, TimeUnit):
-        repeat_every.unit.number *= number
+        unit: TimeUnit = repeat_every.unit
+        repeat_every = RepeatEvery(unit=TimeUnit.get(unit.number * number, unit.unit))
 
     return repeat_every
 
 
 def parse_repeat_before(command: str) -> list[TimeUnit]:
-    if not command:
+    # Быстрая проверка перед регуляркой
+    if not command or "напомни" not in command.lower():
         return []
 
     m: re.Match | None = PATTERN_REPEAT_BEFORE.search(command)
@@ -310,10 +388,12 @@ def parse_repeat_before(command: str) -> list[TimeUnit]:
         number: int = get_int_from_match(m, name="number", default=1)
 
         day_value: str = m.group("day")
-        time_unit: TimeUnit = TimeUnit.parse_text(day_value)
-        time_unit.number *= number
+        time_unit: TimeUnit | None = TimeUnit.parse_text(day_value)
+        if not time_unit:
+            continue
 
-        time_by_unit[time_unit.get_timedelta()] = time_unit
+        time_unit = TimeUnit.get(time_unit.number * number, time_unit.unit)
+        time_by_unit[time_unit.delta] = time_unit
 
     return sorted(time_by_unit.values(), reverse=True)
 
@@ -349,7 +429,7 @@ def parse_command(
 ) -> ParseResult:
     command: str = command.strip()
 
-    m: re.Match | None = PATTERN_TARGET_DATETIME.search(command)
+    m: re.Match | None = search_target_datetime(command)
     if not m:
         raise ParserException(f"Команда {command!r} не соответствует шаблону")
 
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import heapq
+import itertools
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Iterator
+
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+
+from common import log
+
+
+# SOURCE: https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+GLOBAL_RATE: float = 30  # Сообщений в секунду на всех
+PRIVATE_CHAT_RATE: float = 1  # Сообщений в секунду в личный чат
+GROUP_CHAT_RATE: float = 20 / 60  # Сообщений в секунду в группу
+
+# Чем меньше значение, тем раньше запрос получит токен
+PRIORITY_INTERACTIVE: int = 0  # Ответы пользователям
+PRIORITY_BULK: int = 1  # Массовая рассылка напоминаний
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate: float = rate
+        self.capacity: float = capacity if capacity is not None else max(rate, 1)
+
+        self._tokens: float = self.capacity
+        self._updated: float = time.monotonic()
+        self._blocked_until: float = 0
+
+        self._condition = threading.Condition()
+
+        # Куча ожидающих токен из пар (приоритет, порядковый номер)
+        self._waiters: list[tuple[int, int]] = []
+        self._counter = itertools.count()
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated) * self.rate,
+        )
+        self._updated = now
+
+    def _take(self) -> float:
+        now: float = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+
+        self._refill(now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+
+        return (1 - self._tokens) / self.rate
+
+    def is_full(self) -> bool:
+        with self._condition:
+            self._refill(time.monotonic())
+            return self._tokens >= self.capacity
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        with self._condition:
+            waiter: tuple[int, int] = (priority, next(self._counter))
+            heapq.heappush(self._waiters, waiter)
+            self._condition.notify_all()
+
+            try:
+                while True:
+                    # Токен забирает только ожидающий с наивысшим приоритетом,
+                    # остальные ждут его ухода
+                    timeout: float | None = None
+                    if self._waiters[0] == waiter:
+                        timeout = self._take()
+                        if not timeout:
+                            return
+
+                    self._condition.wait(timeout)
+
+            finally:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def pause(self, seconds: float):
+        with self._condition:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0)
+            self._condition.notify_all()
+
+
+class RateLimiter:
+    # После скольких корзин чатов удалять неиспользуемые
+    MAX_CHAT_BUCKETS: int = 10_000
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE,
+        private_chat_rate: float = PRIVATE_CHAT_RATE,
+        group_chat_rate: float = GROUP_CHAT_RATE,
+    ):
+        self.global_bucket = TokenBucket(global_rate)
+        self.private_chat_rate: float = private_chat_rate
+        self.group_chat_rate: float = group_chat_rate
+
+        self._chat_buckets: dict[int | str, TokenBucket] = dict()
+        self._lock = threading.Lock()
+
+        self._local = threading.local()
+
+    def get_chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        with self._lock:
+            bucket: TokenBucket | None = self._chat_buckets.get(chat_id)
+            if not bucket:
+                if len(self._chat_buckets) >= self.MAX_CHAT_BUCKETS:
+                    self._remove_full_chat_buckets()
+
+                # У личных чатов положительный id, у групп и каналов - отрицательный
+                # или имя вида @channelusername
+                is_private: bool = isinstance(chat_id, int) and chat_id > 0
+                rate: float = (
+                    self.private_chat_rate if is_private else self.group_chat_rate
+                )
+                bucket = TokenBucket(rate)
+                self._chat_buckets[chat_id] = bucket
+
+            return bucket
+
+    def _remove_full_chat_buckets(self):
+        # Полная корзина ничем не отличается от новой
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if bucket.is_full():
+                self._chat_buckets.pop(chat_id)
+
+    def get_priority(self) -> int:
+        return getattr(self._local, "priority", PRIORITY_INTERACTIVE)
+
+    @contextmanager
+    def use_priority(self, priority: int) -> Iterator[None]:
+        prev_priority: int = self.get_priority()
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = prev_priority
+
+    def acquire(self, chat_id: int | str | None = None, priority: int | None = None):
+        if priority is None:
+            priority = self.get_priority()
+
+        if chat_id is not None:
+            self.get_chat_bucket(chat_id).acquire(priority)
+
+        self.global_bucket.acquire(priority)
+
+    def pause(self, seconds: float, chat_id: int | str | None = None):
+        if chat_id is not None:
+            self.get_chat_bucket(chat_id).pause(seconds)
+        else:
+            self.global_bucket.pause(seconds)
+
+
+rate_limiter = RateLimiter()
+
+
+class RateLimitedBot(ExtBot):
+    """
+    Бот, все отправки и изменения сообщений которого проходят через ограничитель
+    """
+
+    __slots__ = ("rate_limiter", "max_retries")
+
+    def __init__(
+        self,
+        *args,
+        rate_limiter: RateLimiter = rate_limiter,
+        max_retries: int = 3,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+
+        self.rate_limiter: RateLimiter = rate_limiter
+        self.max_retries: int = max_retries
+
+    @staticmethod
+    def is_limited_endpoint(endpoint: str) -> bool:
+        return endpoint.startswith(("send", "edit", "copy", "forward"))
+
+    def _post(self, endpoint: str, data: dict = None, *args, **kwargs):
+        if not self.is_limited_endpoint(endpoint):
+            return super()._post(endpoint, data, *args, **kwargs)
+
+        chat_id: int | str | None = data.get("chat_id") if data else None
+
+        attempt: int = 0
+        while True:
+            self.rate_limiter.acquire(chat_id)
+            try:
+                # Данные меняются при отправке, поэтому для повтора нужна копия
+                return super()._post(
+                    endpoint, dict(data) if data else data, *args, **kwargs
+                )
+
+            except RetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise e
+
+                log.warning(
+                    f"Flood control for {endpoint} (chat_id={chat_id}), "
+                    f"retry after {e.retry_after} seconds"
+                )
+                self.rate_limiter.pause(e.retry_after, chat_id)
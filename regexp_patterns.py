@@ -9,6 +9,13 @@ from third_party.regexp import fill_string_pattern
 
 
 PATTERN_REMINDER_PAGE: re.Pattern = re.compile(r"^reminder page=(?P<page>\d+)$")
+# Страница с напоминанием, от которого она отсчитывается: страница и id напоминания
+PATTERN_REMINDER_PAGE_FROM: re.Pattern = re.compile(
+    r"^reminder page=(?P<page>\d+) from=(?P<anchor_page>\d+)/(?P<anchor_id>\d+)$"
+)
+PATTERN_REMINDER_LIST_PAGE: re.Pattern = re.compile(
+    r"^reminders page=(?P<page>\d+) from=(?P<anchor_page>\d+)/(?P<anchor_id>\d+)$"
+)
 PATTERN_REMINDER_DELETE: re.Pattern = re.compile(r"^reminder#(?P<id>\d+)-delete$")
 PATTERN_REMINDER_ASK_DELETE: re.Pattern = re.compile(r"^reminder#(?P<id>\d+)-ask-delete$")
 PATTERN_DELETE_MESSAGE: re.Pattern = re.compile(r"^delete message$")
@@ -23,6 +30,9 @@ COMMAND_TZ: str = "tz"
 COMMAND_LIST: str = "list"
 PATTERN_LIST: re.Pattern = re.compile("^Список$", flags=re.IGNORECASE)
 
+COMMAND_SHORT_LIST: str = "short_list"
+PATTERN_SHORT_LIST: re.Pattern = re.compile("^Краткий список$", flags=re.IGNORECASE)
+
 
 if __name__ == "__main__":
     # TODO: в тесты
@@ -31,6 +41,18 @@ if __name__ == "__main__":
     print(len(data), data)
     assert data == "reminder page=999999999"
 
+    data: str = fill_string_pattern(
+        PATTERN_REMINDER_PAGE_FROM, 999_999_999, 999_999_999, 999_999_999
+    )
+    print(len(data), data)
+    assert data == "reminder page=999999999 from=999999999/999999999"
+
+    data: str = fill_string_pattern(
+        PATTERN_REMINDER_LIST_PAGE, 999_999_999, 999_999_999, 999_999_999
+    )
+    print(len(data), data)
+    assert data == "reminders page=999999999 from=999999999/999999999"
+
     data: str = fill_string_pattern(PATTERN_REMINDER_DELETE, 999_999_999)
     print(len(data), data)
     assert data == "reminder#999999999-delete"
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import enum
+import functools
+import struct
+
+from parser import (
+    RepeatEvery,
+    TimeUnit,
+    TimeUnitEnum,
+    TimeUnitWeekDayEnum,
+    TimeUnitWeekDayUnit,
+)
+
+
+# Сколько разных значений хранится в разобранном виде
+DECODE_CACHE_MAX_SIZE: int = 1024
+
+
+class RepeatUnitCodeEnum(enum.IntEnum):
+    DAY = 1
+    WEEK = 2
+    MONTH = 3
+    YEAR = 4
+    WEEKDAY = 5  # Дни недели хранятся битовой маской
+
+
+CODE_BY_TIME_UNIT: dict[TimeUnitEnum, RepeatUnitCodeEnum] = {
+    TimeUnitEnum.DAY: RepeatUnitCodeEnum.DAY,
+    TimeUnitEnum.WEEK: RepeatUnitCodeEnum.WEEK,
+    TimeUnitEnum.MONTH: RepeatUnitCodeEnum.MONTH,
+    TimeUnitEnum.YEAR: RepeatUnitCodeEnum.YEAR,
+}
+TIME_UNIT_BY_CODE: dict[RepeatUnitCodeEnum, TimeUnitEnum] = {
+    code: unit for unit, code in CODE_BY_TIME_UNIT.items()
+}
+
+# Напоминание до хранится в одном числе: количество и код единицы в младших битах
+BEFORE_UNIT_BITS: int = 3
+BEFORE_UNIT_MASK: int = (1 << BEFORE_UNIT_BITS) - 1
+
+
+def get_weekday_mask(weekday: TimeUnitWeekDayEnum) -> int:
+    return 1 << (weekday.value - 1)
+
+
+def encode_repeat_every(
+    repeat_every: RepeatEvery | None,
+) -> tuple[int | None, int | None, int | None]:
+    """
+    Возвращает код единицы, количество и маску дней недели
+    """
+
+    if not repeat_every:
+        return None, None, None
+
+    unit: TimeUnit | TimeUnitWeekDayUnit = repeat_every.unit
+    if isinstance(unit, TimeUnitWeekDayUnit):
+        return RepeatUnitCodeEnum.WEEKDAY, 1, get_weekday_mask(unit.unit)
+
+    return CODE_BY_TIME_UNIT[unit.unit], unit.number, None
+
+
+@functools.lru_cache(maxsize=DECODE_CACHE_MAX_SIZE)
+def decode_repeat_every(
+    unit_code: int | None,
+    number: int | None,
+    weekdays: int | None,
+) -> RepeatEvery | None:
+    # NOTE: Значения общие для всех напоминаний, их нельзя изменять
+    if not unit_code:
+        return
+
+    if unit_code == RepeatUnitCodeEnum.WEEKDAY:
+        # Сейчас повтор задается одним днем недели
+        weekday = TimeUnitWeekDayEnum((weekdays & -weekdays).bit_length())
+        return RepeatEvery(unit=TimeUnitWeekDayUnit(unit=weekday))
+
+    return RepeatEvery(
+        unit=TimeUnit(
+            number=number,
+            unit=TIME_UNIT_BY_CODE[RepeatUnitCodeEnum(unit_code)],
+        )
+    )
+
+
+def encode_repeat_before(repeat_before: list[TimeUnit]) -> bytes | None:
+    if not repeat_before:
+        return
+
+    values: list[int] = [
+        unit.number << BEFORE_UNIT_BITS | CODE_BY_TIME_UNIT[unit.unit]
+        for unit in repeat_before
+    ]
+    return struct.pack(f"<{len(values)}I", *values)
+
+
+@functools.lru_cache(maxsize=DECODE_CACHE_MAX_SIZE)
+def decode_repeat_before(data: bytes | None) -> tuple[TimeUnit, ...]:
+    # NOTE: Значения общие для всех напоминаний, их нельзя изменять
+    if not data:
+        return tuple()
+
+    return tuple(
+        TimeUnit(
+            number=value >> BEFORE_UNIT_BITS,
+            unit=TIME_UNIT_BY_CODE[RepeatUnitCodeEnum(value & BEFORE_UNIT_MASK)],
+        )
+        for value in struct.unpack(f"<{len(data) // 4}I", data)
+    )
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import asyncio
+import heapq
+import threading
+
+from concurrent.futures import Executor
+from datetime import datetime, timedelta
+from typing import Callable
+
+from storage import storage
+
+
+class ReminderScheduler:
+    # Полная перезагрузка расписания из базы на случай изменений в обход планировщика
+    RELOAD_TIMEOUT: timedelta = timedelta(hours=1)
+
+    def __init__(self):
+        # Куча из пар (next_send_datetime_utc, reminder_id). Записи не удаляются из кучи
+        # сразу, актуальное значение хранится в _next_by_id, а устаревшие записи
+        # выбрасываются при просмотре вершины кучи
+        self._heap: list[tuple[datetime, int]] = []
+        self._next_by_id: dict[int, datetime] = dict()
+        self._lock = threading.Lock()
+        self._last_reload_datetime_utc: datetime | None = None
+
+        # Вызываются при изменении расписания, чтобы разбудить ожидающих
+        self._listeners: list[Callable[[], None]] = []
+
+    def reload(self):
+        next_by_id: dict[int, datetime] = storage.get_schedule()
+
+        heap: list[tuple[datetime, int]] = [
+            (next_send_datetime_utc, reminder_id)
+            for reminder_id, next_send_datetime_utc in next_by_id.items()
+        ]
+        heapq.heapify(heap)
+
+        with self._lock:
+            self._heap = heap
+            self._next_by_id = next_by_id
+            self._last_reload_datetime_utc = datetime.utcnow()
+            self._notify()
+
+    def schedule(self, reminder_id: int, next_send_datetime_utc: datetime):
+        with self._lock:
+            self._next_by_id[reminder_id] = next_send_datetime_utc
+            heapq.heappush(self._heap, (next_send_datetime_utc, reminder_id))
+            self._notify()
+
+    def schedule_missing(
+        self,
+        reminder_ids: list[int],
+        next_send_datetime_utc: datetime,
+    ):
+        """
+        Планирует напоминания, которых нет в расписании. Нужно, если снятые
+        через wait_due напоминания не удалось обработать: иначе они будут ждать
+        перезагрузки расписания
+        """
+
+        with self._lock:
+            for reminder_id in reminder_ids:
+                if reminder_id in self._next_by_id:
+                    continue
+
+                self._next_by_id[reminder_id] = next_send_datetime_utc
+                heapq.heappush(self._heap, (next_send_datetime_utc, reminder_id))
+
+            self._notify()
+
+    def unschedule(self, reminder_id: int):
+        with self._lock:
+            if self._next_by_id.pop(reminder_id, None):
+                self._notify()
+
+    def get_nearest_datetime(self) -> datetime | None:
+        with self._lock:
+            return self._get_nearest_datetime()
+
+    def pop_due(self, now_utc: datetime) -> list[int]:
+        with self._lock:
+            return self._pop_due(now_utc)
+
+    async def wait_due(
+        self,
+        executor: Executor | None = None,
+        max_timeout: float | None = None,
+    ) -> list[int]:
+        """
+        Ожидает в цикле событий наступления ближайшей отправки и возвращает
+        идентификаторы напоминаний, время отправки которых наступило.
+        Ожидание прерывается, если расписание изменили из другого потока.
+        Перезагрузка из базы выполняется в executor.
+        Если задан max_timeout, то через столько секунд возвращается пустой список
+        """
+
+        loop = asyncio.get_running_loop()
+        deadline: float | None = (
+            loop.time() + max_timeout if max_timeout is not None else None
+        )
+        changed = asyncio.Event()
+
+        def _on_changed():
+            loop.call_soon_threadsafe(changed.set)
+
+        with self._lock:
+            self._listeners.append(_on_changed)
+
+        try:
+            while True:
+                if self._is_reload_needed():
+                    await loop.run_in_executor(executor, self.reload)
+
+                with self._lock:
+                    # Слушатели вызываются под той же блокировкой, поэтому
+                    # изменение после этой проверки не будет пропущено
+                    changed.clear()
+
+                    now_utc: datetime = datetime.utcnow()
+
+                    reminder_ids: list[int] = self._pop_due(now_utc)
+                    if reminder_ids:
+                        return reminder_ids
+
+                    timeout: float = self._get_wait_timeout(now_utc)
+
+                if deadline is not None:
+                    if loop.time() >= deadline:
+                        return []
+                    timeout = min(timeout, deadline - loop.time())
+
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+        finally:
+            with self._lock:
+                self._listeners.remove(_on_changed)
+
+    def _notify(self):
+        for listener in self._listeners:
+            listener()
+
+    def _get_wait_timeout(self, now_utc: datetime) -> float:
+        timeout: float = (
+            self._last_reload_datetime_utc + self.RELOAD_TIMEOUT - now_utc
+        ).total_seconds()
+
+        nearest_datetime: datetime | None = self._get_nearest_datetime()
+        if nearest_datetime:
+            timeout = min(timeout, (nearest_datetime - now_utc).total_seconds())
+
+        return max(timeout, 0)
+
+    def _is_reload_needed(self) -> bool:
+        return (
+            not self._last_reload_datetime_utc
+            or datetime.utcnow() - self._last_reload_datetime_utc >= self.RELOAD_TIMEOUT
+        )
+
+    def _get_nearest_datetime(self) -> datetime | None:
+        while self._heap:
+            next_send_datetime_utc, reminder_id = self._heap[0]
+            if self._next_by_id.get(reminder_id) == next_send_datetime_utc:
+                return next_send_datetime_utc
+
+            # Устаревшая запись: напоминание удалено или перенесено
+            heapq.heappop(self._heap)
+
+        return
+
+    def _pop_due(self, now_utc: datetime) -> list[int]:
+        reminder_ids: list[int] = []
+        while True:
+            nearest_datetime: datetime | None = self._get_nearest_datetime()
+            if not nearest_datetime or nearest_datetime > now_utc:
+                break
+
+            _, reminder_id = heapq.heappop(self._heap)
+            self._next_by_id.pop(reminder_id)
+            reminder_ids.append(reminder_id)
+
+        return reminder_ids
+
+
+reminder_scheduler = ReminderScheduler()
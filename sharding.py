@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import math
+import threading
+import time
+import uuid
+
+from datetime import datetime, timedelta
+from typing import Callable
+
+from common import log
+from db import SchedulerWorker, ShardLease, SHARD_COUNT
+
+
+# Через сколько без сигнала процесс считается упавшим, а его шарды свободными
+SHARD_LEASE_TIMEOUT: timedelta = timedelta(seconds=30)
+
+# Как часто процесс продлевает захват и перераспределяет шарды
+HEARTBEAT_INTERVAL: timedelta = SHARD_LEASE_TIMEOUT / 3
+
+
+class ShardLeaseManager:
+    """
+    Распределение шардов чатов между процессами бота.
+
+    Каждый процесс периодически отмечается в таблице процессов, продлевает
+    захват своих шардов и забирает свободные или истекшие, пока у него
+    не будет своей доли: количество шардов, деленное на количество живых
+    процессов. Лишние шарды отпускаются, чтобы их забрали новые процессы.
+    Шарды упавшего процесса освобождаются по истечении SHARD_LEASE_TIMEOUT
+    """
+
+    def __init__(
+        self,
+        shard_count: int = SHARD_COUNT,
+        lease_timeout: timedelta = SHARD_LEASE_TIMEOUT,
+        heartbeat_interval: timedelta = HEARTBEAT_INTERVAL,
+        is_active: Callable[[], bool] = lambda: True,
+        owner: str | None = None,
+    ):
+        self.shard_count: int = shard_count
+        self.lease_timeout: timedelta = lease_timeout
+        self.heartbeat_interval: timedelta = heartbeat_interval
+        self.owner: str = owner or uuid.uuid4().hex
+
+        # Пока процесс неактивен (например, бот перезапускается),
+        # его шарды отпускаются
+        self.is_active: Callable[[], bool] = is_active
+
+        self._lock = threading.Lock()
+        self._shards: frozenset[int] = frozenset()
+        self._thread: threading.Thread | None = None
+
+    def get_shards(self) -> frozenset[int]:
+        with self._lock:
+            return self._shards
+
+    def _set_shards(self, shards: set[int]):
+        with self._lock:
+            if self._shards != shards:
+                log.info(f"Shards of {self.owner}: {sorted(shards)}")
+            self._shards = frozenset(shards)
+
+    def init_shards(self):
+        ShardLease.insert_many(
+            [dict(shard=shard) for shard in range(self.shard_count)]
+        ).on_conflict_ignore().execute()
+
+    def get_alive_workers(self, now_utc: datetime) -> set[str]:
+        query = SchedulerWorker.select(SchedulerWorker.id).where(
+            SchedulerWorker.heartbeat_datetime_utc >= now_utc - self.lease_timeout
+        )
+        return {worker_id for (worker_id,) in query.tuples()} | {self.owner}
+
+    def heartbeat(self, now_utc: datetime | None = None) -> frozenset[int]:
+        """
+        Продлевает и перераспределяет захваты, возвращает шарды процесса
+        """
+
+        if now_utc is None:
+            now_utc = datetime.utcnow()
+
+        if not self.is_active():
+            self.release_all()
+            return frozenset()
+
+        expires_datetime_utc: datetime = now_utc + self.lease_timeout
+
+        SchedulerWorker.insert(
+            id=self.owner, heartbeat_datetime_utc=now_utc
+        ).on_conflict_replace().execute()
+
+        # Давно не отвечающие процессы удаляются
+        SchedulerWorker.delete().where(
+            SchedulerWorker.heartbeat_datetime_utc < now_utc - self.lease_timeout * 10
+        ).execute()
+
+        ShardLease.update(expires_datetime_utc=expires_datetime_utc).where(
+            ShardLease.owner == self.owner
+        ).execute()
+
+        leases: list[ShardLease] = list(ShardLease.select())
+        shards: set[int] = {
+            lease.shard for lease in leases if lease.owner == self.owner
+        }
+        target: int = math.ceil(self.shard_count / len(self.get_alive_workers(now_utc)))
+
+        if len(shards) > target:
+            surplus: list[int] = sorted(shards)[target:]
+            ShardLease.update(owner=None, expires_datetime_utc=None).where(
+                ShardLease.shard.in_(surplus),
+                ShardLease.owner == self.owner,
+            ).execute()
+            shards.difference_update(surplus)
+
+        free_shards: list[int] = [
+            lease.shard
+            for lease in leases
+            if not lease.owner or lease.expires_datetime_utc < now_utc
+        ]
+        for shard in free_shards:
+            if len(shards) >= target:
+                break
+
+            # Шард может одновременно забирать другой процесс,
+            # поэтому захват проверяется по количеству измененных строк
+            acquired: int = (
+                ShardLease.update(
+                    owner=self.owner,
+                    expires_datetime_utc=expires_datetime_utc,
+                )
+                .where(
+                    ShardLease.shard == shard,
+                    ShardLease.owner.is_null()
+                    | (ShardLease.expires_datetime_utc < now_utc),
+                )
+                .execute()
+            )
+            if acquired:
+                shards.add(shard)
+
+        self._set_shards(shards)
+        return self.get_shards()
+
+    def release_all(self):
+        ShardLease.update(owner=None, expires_datetime_utc=None).where(
+            ShardLease.owner == self.owner
+        ).execute()
+        SchedulerWorker.delete_by_id(self.owner)
+
+        self._set_shards(set())
+
+    def _run(self):
+        while True:
+            try:
+                self.heartbeat()
+            except:
+                log.exception("")
+
+            time.sleep(self.heartbeat_interval.total_seconds())
+
+    def start(self):
+        if self._thread:
+            return
+
+        self.init_shards()
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name="ShardLeaseManager",
+            daemon=True,
+        )
+        self._thread.start()
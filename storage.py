@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import bisect
+import contextlib
+import enum
+import heapq
+import threading
+
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import ContextManager, Iterable
+
+from peewee import Case, SqliteDatabase
+
+from config import STORAGE_BACKEND
+from db import (
+    BaseModel,
+    Chat,
+    Reminder,
+    User,
+    BULK_BATCH_SIZE,
+    CLAIM_LEASE_TIMEOUT,
+    DB_FILE_NAME,
+    DB_PRAGMAS,
+    db,
+    get_shard,
+)
+from occurrences import occurrences_cache
+from parser import AutoName
+
+
+class StorageBackendEnum(AutoName):
+    SQLITE = enum.auto()  # SQLite, запись через очередь в одном потоке
+    SQLITE_CONCURRENT = enum.auto()  # SQLite, подключение на поток
+    MEMORY = enum.auto()  # В памяти процесса, для тестов и замеров
+
+
+class Storage(ABC):
+    """
+    Операции с напоминаниями, пользователями и чатами, которые выполняет бот
+    при отправке напоминаний и работе со списками
+    """
+
+    @abstractmethod
+    def add_reminder(self, **kwargs) -> Reminder:
+        """
+        Сохраняет напоминание, аргументы как у Reminder.build
+        """
+
+    @abstractmethod
+    def get_reminder(self, reminder_id: int) -> Reminder | None:
+        pass
+
+    @abstractmethod
+    def delete_reminders(self, reminder_ids: list[int]) -> int:
+        pass
+
+    @abstractmethod
+    def claim_due(
+        self,
+        now_utc: datetime,
+        lease_timeout: timedelta = CLAIM_LEASE_TIMEOUT,
+        shards: Iterable[int] | None = None,
+    ) -> list[Reminder]:
+        """
+        Захватывает напоминания, время отправки которых наступило.
+        Захваченные не возвращаются повторно, пока захват не истечет
+        """
+
+    @abstractmethod
+    def save_claimed(self, reminders: list[Reminder]) -> int:
+        """
+        Сохраняет следующую отправку захваченных напоминаний и снимает захват
+        """
+
+    @abstractmethod
+    def release_claimed(self, reminder_ids: list[int]) -> int:
+        pass
+
+    @abstractmethod
+    def get_schedule(self) -> dict[int, datetime]:
+        """
+        Время следующей отправки всех напоминаний
+        """
+
+    @abstractmethod
+    def get_count(self, chat_id: int, user_id: int) -> int:
+        pass
+
+    @abstractmethod
+    def get_page(
+        self,
+        chat_id: int,
+        user_id: int,
+        page: int = 1,
+        items_per_page: int = 1,
+        total: int | None = None,
+        anchor_page: int | None = None,
+        anchor_id: int | None = None,
+    ) -> list[Reminder]:
+        """
+        Напоминания пользователя в чате на странице page
+        в порядке (next_send_datetime_utc, id)
+        """
+
+    @abstractmethod
+    def update_last_activity(
+        self,
+        model: type[User | Chat],
+        activity_by_id: dict[int, datetime],
+    ) -> int:
+        pass
+
+
+class SqliteStorage(Storage):
+    """
+    Хранение в SQLite через модели peewee.
+
+    По умолчанию используется база из db.py, в которой запись идет через
+    очередь в одном потоке.
+
+    Если передана другая база, то к ней привязываются только модели MODELS,
+    с которыми работает хранилище. Остальные модели (например, SchedulerWorker
+    и ShardLease) остаются в базе из db.py. Привязка моделей общая для процесса,
+    поэтому хранилище с другой базой может быть только одно, пока его
+    не закроют через close
+    """
+
+    MODELS: list[type[BaseModel]] = [User, Chat, Reminder]
+
+    def __init__(self, database: SqliteDatabase | None = None):
+        self.database: SqliteDatabase = database or db
+        if self.database is db:
+            return
+
+        for model in self.MODELS:
+            if model._meta.database not in (db, self.database):
+                raise Exception(
+                    f"Model {model.__name__} is already bound to another storage"
+                )
+
+        self.database.bind(self.MODELS, bind_refs=False, bind_backrefs=False)
+
+    def close(self):
+        """
+        Возвращает модели в базу из db.py и закрывает подключение
+        """
+
+        if self.database is db:
+            return
+
+        models: list[type[BaseModel]] = [
+            model for model in self.MODELS if model._meta.database is self.database
+        ]
+        db.bind(models, bind_refs=False, bind_backrefs=False)
+        self.database.close()
+
+    def _writing(self) -> ContextManager:
+        # В SqliteQueueDatabase транзакции недоступны
+        return contextlib.nullcontext()
+
+    def add_reminder(self, **kwargs) -> Reminder:
+        with self._writing():
+            return Reminder.add(**kwargs)
+
+    def get_reminder(self, reminder_id: int) -> Reminder | None:
+        return Reminder.get_with_chat(reminder_id)
+
+    def delete_reminders(self, reminder_ids: list[int]) -> int:
+        with self._writing():
+            return Reminder.delete_by_ids(reminder_ids)
+
+    def claim_due(
+        self,
+        now_utc: datetime,
+        lease_timeout: timedelta = CLAIM_LEASE_TIMEOUT,
+        shards: Iterable[int] | None = None,
+    ) -> list[Reminder]:
+        with self._writing():
+            return Reminder.claim_due(now_utc, lease_timeout, shards)
+
+    def save_claimed(self, reminders: list[Reminder]) -> int:
+        with self._writing():
+            return Reminder.save_claimed(reminders)
+
+    def release_claimed(self, reminder_ids: list[int]) -> int:
+        with self._writing():
+            return Reminder.release_claimed(reminder_ids)
+
+    def get_schedule(self) -> dict[int, datetime]:
+        query = Reminder.select(Reminder.id, Reminder.next_send_datetime_utc)
+        return dict(query.tuples())
+
+    def get_count(self, chat_id: int, user_id: int) -> int:
+        return Reminder.get_count_of(chat_id, user_id)
+
+    def get_page(
+        self,
+        chat_id: int,
+        user_id: int,
+        page: int = 1,
+        items_per_page: int = 1,
+        total: int | None = None,
+        anchor_page: int | None = None,
+        anchor_id: int | None = None,
+    ) -> list[Reminder]:
+        return Reminder.get_page(
+            page=page,
+            items_per_page=items_per_page,
+            filters=Reminder.get_filters_of(chat_id, user_id),
+            total=total,
+            anchor_page=anchor_page,
+            anchor_id=anchor_id,
+        )
+
+    def update_last_activity(
+        self,
+        model: type[User | Chat],
+        activity_by_id: dict[int, datetime],
+    ) -> int:
+        # На каждую пачку один UPDATE
+        changed: int = 0
+        items: list[tuple[int, datetime]] = list(activity_by_id.items())
+        for i in range(0, len(items), BULK_BATCH_SIZE):
+            batch = items[i : i + BULK_BATCH_SIZE]
+            with self._writing():
+                changed += (
+                    model.update(
+                        last_activity=Case(
+                            model.id,
+                            [
+                                (obj_id, model.last_activity.db_value(dt))
+                                for obj_id, dt in batch
+                            ],
+                        )
+                    )
+                    .where(model.id.in_([obj_id for obj_id, _ in batch]))
+                    .execute()
+                )
+        return changed
+
+
+class SqliteConcurrentStorage(SqliteStorage):
+    """
+    Хранение в SQLite без очереди записи.
+
+    У каждого потока свое подключение (так peewee работает по умолчанию),
+    в режиме WAL чтения не блокируются записью. Запись идет в транзакции
+    BEGIN IMMEDIATE: блокировка на запись берется сразу, поэтому транзакции
+    ждут друг друга до timeout, а не падают с "database is locked"
+    при попытке чтения перейти в запись
+    """
+
+    PRAGMAS: dict[str, int | str] = {
+        **DB_PRAGMAS,
+        # В режиме WAL это не портит базу при сбое, но ускоряет фиксацию
+        "synchronous": "normal",
+    }
+
+    def __init__(self, path: str = DB_FILE_NAME, timeout: float = 30):
+        super().__init__(SqliteDatabase(path, pragmas=self.PRAGMAS, timeout=timeout))
+
+    def _writing(self) -> ContextManager:
+        return self.database.atomic("IMMEDIATE")
+
+
+class MemoryStorage(Storage):
+    """
+    Хранение в памяти процесса, для тестов и замеров.
+
+    Напоминания хранятся словарями полей, наружу отдаются новые объекты
+    моделей, как при чтении из базы. Пользователи и чаты запоминаются
+    при добавлении напоминаний
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_id: int = 0
+
+        self._data_by_id: dict[int, dict] = dict()
+
+        # Отсортированные ключи (next_send_datetime_utc, id) напоминаний
+        # пользователя в чате, по ним ищутся страницы
+        self._keys_by_owner: dict[tuple[int, int], list[tuple[datetime, int]]] = (
+            defaultdict(list)
+        )
+
+        self._users: dict[int, User] = dict()
+        self._chats: dict[int, Chat] = dict()
+
+        # Куча из пар (next_send_datetime_utc, reminder_id) незахваченных
+        # напоминаний. Устаревшие записи выбрасываются при просмотре вершины
+        self._heap: list[tuple[datetime, int]] = []
+
+        # Время истечения захвата по идентификатору напоминания
+        self._claimed: dict[int, datetime] = dict()
+
+    def _to_reminder(self, data: dict) -> Reminder:
+        reminder = Reminder(**data)
+        reminder.user = self._users[data["user"]]
+        reminder.chat = self._chats[data["chat"]]
+        return reminder
+
+    def _push(self, reminder_id: int):
+        data: dict = self._data_by_id[reminder_id]
+        heapq.heappush(self._heap, (data["next_send_datetime_utc"], reminder_id))
+
+    def _get_keys(self, data: dict) -> list[tuple[datetime, int]]:
+        return self._keys_by_owner[data["chat"], data["user"]]
+
+    def _remove_key(self, data: dict):
+        keys: list[tuple[datetime, int]] = self._get_keys(data)
+        keys.pop(bisect.bisect_left(keys, (data["next_send_datetime_utc"], data["id"])))
+
+    def _is_actual(self, next_send_datetime_utc: datetime, reminder_id: int) -> bool:
+        data: dict | None = self._data_by_id.get(reminder_id)
+        return (
+            data is not None
+            and data["next_send_datetime_utc"] == next_send_datetime_utc
+            and reminder_id not in self._claimed
+        )
+
+    def add_reminder(self, **kwargs) -> Reminder:
+        reminder: Reminder = Reminder.build(**kwargs)
+
+        with self._lock:
+            self._last_id += 1
+            reminder.id = self._last_id
+
+            self._users[reminder.user.id] = reminder.user
+            self._chats[reminder.chat.id] = reminder.chat
+
+            self._data_by_id[reminder.id] = dict(reminder.__data__)
+            bisect.insort(
+                self._get_keys(reminder.__data__),
+                (reminder.next_send_datetime_utc, reminder.id),
+            )
+            self._push(reminder.id)
+
+        return reminder
+
+    def get_reminder(self, reminder_id: int) -> Reminder | None:
+        with self._lock:
+            data: dict | None = self._data_by_id.get(reminder_id)
+            return self._to_reminder(data) if data else None
+
+    def delete_reminders(self, reminder_ids: list[int]) -> int:
+        deleted: int = 0
+        with self._lock:
+            for reminder_id in reminder_ids:
+                data: dict | None = self._data_by_id.pop(reminder_id, None)
+                if not data:
+                    continue
+
+                occurrences_cache.pop(reminder_id)
+                self._claimed.pop(reminder_id, None)
+                self._remove_key(data)
+                deleted += 1
+
+        return deleted
+
+    def claim_due(
+        self,
+        now_utc: datetime,
+        lease_timeout: timedelta = CLAIM_LEASE_TIMEOUT,
+        shards: Iterable[int] | None = None,
+    ) -> list[Reminder]:
+        if shards is not None:
+            shards = set(shards)
+
+        with self._lock:
+            # Напоминания с истекшим захватом снова доступны
+            for reminder_id, expires_datetime_utc in list(self._claimed.items()):
+                if expires_datetime_utc < now_utc:
+                    del self._claimed[reminder_id]
+                    self._push(reminder_id)
+
+            reminders: list[Reminder] = []
+            skipped: list[tuple[datetime, int]] = []
+            while self._heap and self._heap[0][0] <= now_utc:
+                item: tuple[datetime, int] = heapq.heappop(self._heap)
+                if not self._is_actual(*item):
+                    continue
+
+                data: dict = self._data_by_id[item[1]]
+                if shards is not None and get_shard(data["chat"]) not in shards:
+                    skipped.append(item)
+                    continue
+
+                self._claimed[item[1]] = now_utc + lease_timeout
+                reminders.append(self._to_reminder(data))
+
+            for item in skipped:
+                heapq.heappush(self._heap, item)
+
+        return reminders
+
+    def save_claimed(self, reminders: list[Reminder]) -> int:
+        saved: int = 0
+        with self._lock:
+            for reminder in reminders:
+                if reminder.id not in self._data_by_id:
+                    continue
+
+                reminder.claim_token = None
+                reminder.claim_expires_datetime_utc = None
+
+                self._remove_key(self._data_by_id[reminder.id])
+                self._data_by_id[reminder.id] = dict(reminder.__data__)
+                bisect.insort(
+                    self._get_keys(reminder.__data__),
+                    (reminder.next_send_datetime_utc, reminder.id),
+                )
+                self._claimed.pop(reminder.id, None)
+                self._push(reminder.id)
+                saved += 1
+
+        return saved
+
+    def release_claimed(self, reminder_ids: list[int]) -> int:
+        released: int = 0
+        with self._lock:
+            for reminder_id in reminder_ids:
+                if reminder_id not in self._data_by_id:
+                    continue
+
+                self._claimed.pop(reminder_id, None)
+                self._push(reminder_id)
+                released += 1
+
+        return released
+
+    def get_schedule(self) -> dict[int, datetime]:
+        with self._lock:
+            return {
+                reminder_id: data["next_send_datetime_utc"]
+                for reminder_id, data in self._data_by_id.items()
+            }
+
+    def get_count(self, chat_id: int, user_id: int) -> int:
+        with self._lock:
+            return len(self._keys_by_owner.get((chat_id, user_id), ()))
+
+    def get_page(
+        self,
+        chat_id: int,
+        user_id: int,
+        page: int = 1,
+        items_per_page: int = 1,
+        total: int | None = None,
+        anchor_page: int | None = None,
+        anchor_id: int | None = None,
+    ) -> list[Reminder]:
+        # Страница ищется так же, как в Reminder.get_page: от начала списка,
+        # от конца (если передано total) или от напоминания anchor_id
+        page = max(page, 1)
+        first_index: int = (page - 1) * items_per_page
+
+        with self._lock:
+            keys: list[tuple[datetime, int]] = self._keys_by_owner.get(
+                (chat_id, user_id), []
+            )
+
+            # Варианты поиска: смещение, индекс первого ключа, количество
+            # и от напоминания ли anchor_id
+            seeks: list[tuple[int, int, int, bool]] = [
+                (first_index, first_index, items_per_page, False)
+            ]
+            if total is not None:
+                if first_index >= total:
+                    return []
+
+                end_index: int = min(first_index + items_per_page, total)
+                offset: int = total - end_index
+                limit: int = end_index - first_index
+                seeks.append((offset, len(keys) - offset - limit, limit, False))
+
+            anchor: dict | None = (
+                self._data_by_id.get(anchor_id) if anchor_page and anchor_id else None
+            )
+            if anchor:
+                anchor_index: int = bisect.bisect_left(
+                    keys, (anchor["next_send_datetime_utc"], anchor_id)
+                )
+                if page >= anchor_page:
+                    offset = (page - anchor_page) * items_per_page
+                    seeks.append((offset, anchor_index + offset, items_per_page, True))
+                else:
+                    offset = (anchor_page - page - 1) * items_per_page
+                    seeks.append(
+                        (
+                            offset,
+                            anchor_index - offset - items_per_page,
+                            items_per_page,
+                            True,
+                        )
+                    )
+
+            seeks.sort(key=lambda seek: seek[0])
+            for _, start, limit, from_anchor in seeks:
+                # Перед началом списка ключей страница неполная, как при обратном
+                # порядке с OFFSET и LIMIT
+                items: list[tuple[datetime, int]] = keys[
+                    max(start, 0) : max(start + limit, 0)
+                ]
+
+                # Не найти напоминания от anchor_id могли, если страница за концом
+                if items or not from_anchor:
+                    return [
+                        self._to_reminder(self._data_by_id[reminder_id])
+                        for _, reminder_id in items
+                    ]
+
+    def update_last_activity(
+        self,
+        model: type[User | Chat],
+        activity_by_id: dict[int, datetime],
+    ) -> int:
+        objects: dict[int, User | Chat] = self._users if model is User else self._chats
+
+        changed: int = 0
+        with self._lock:
+            for obj_id, dt in activity_by_id.items():
+                obj: User | Chat | None = objects.get(obj_id)
+                if obj:
+                    obj.last_activity = dt
+                    changed += 1
+
+        return changed
+
+
+def get_storage(
+    backend: StorageBackendEnum | str = StorageBackendEnum.SQLITE,
+) -> Storage:
+    backend = StorageBackendEnum(backend)
+    match backend:
+        case StorageBackendEnum.SQLITE:
+            return SqliteStorage()
+        case StorageBackendEnum.SQLITE_CONCURRENT:
+            return SqliteConcurrentStorage()
+        case StorageBackendEnum.MEMORY:
+            return MemoryStorage()
+        case _:
+            raise Exception(f"Unsupported storage backend: {backend}")
+
+
+storage: Storage = get_storage(STORAGE_BACKEND)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import timeit
+
+from datetime import tzinfo
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from common import get_tz, get_tz_cache_info
+from third_party.get_tz_from_offset__zoneinfo import get_tz as get_tz_from_offset
+
+
+def get_tz_without_cache(value: str) -> tzinfo:
+    # Реализация до кэширования: сначала смещение, затем IANA через исключение
+    try:
+        return get_tz_from_offset(value)
+    except Exception:
+        try:
+            return ZoneInfo(value)
+        except ZoneInfoNotFoundError:
+            pass
+
+        raise ZoneInfoNotFoundError(value)
+
+
+def bench(func, value: str, number: int) -> float:
+    def _call():
+        try:
+            func(value)
+        except ZoneInfoNotFoundError:
+            pass
+
+    return timeit.timeit(_call, number=number) / number * 1_000_000
+
+
+if __name__ == "__main__":
+    number: int = 100_000
+
+    print(f"{'Value':<20} {'Before, µs':>12} {'After, µs':>12}")
+    for value in ["+03:00", "-02:30", "UTC", "Europe/Moscow", "Invalid/Zone"]:
+        before: float = bench(get_tz_without_cache, value, number)
+        after: float = bench(get_tz, value, number)
+        print(f"{value!r:<20} {before:>12.3f} {after:>12.3f}")
+
+    print()
+    print(get_tz_cache_info())
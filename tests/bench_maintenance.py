@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import random
+import time
+
+from datetime import datetime, timedelta
+
+from peewee import SqliteDatabase
+
+from db import BaseModel, Reminder, User, Chat
+from maintenance import recompute_next_send_datetime
+from parser import ParserException, TimeUnit, get_nearest_datetime
+from repeat_codec import encode_repeat_before
+
+
+NUMBER: int = 200_000
+
+
+def fill(now_utc: datetime):
+    rnd = random.Random(42)
+    all_repeat_before: list[list[TimeUnit]] = [
+        [],
+        [TimeUnit.parse_value("1 DAY")],
+        [TimeUnit.parse_value("1 WEEK"), TimeUnit.parse_value("3 DAY")],
+        [TimeUnit.parse_value("1 MONTH"), TimeUnit.parse_value("1 DAY")],
+    ]
+
+    User.create(id=1, first_name="user")
+    Chat.create(id=1, type="private")
+
+    rows: list[dict] = []
+    for i in range(NUMBER):
+        repeat_before: list[TimeUnit] = rnd.choice(all_repeat_before)
+        rows.append(
+            dict(
+                original_message_text=f'"{i}"',
+                original_message_id=i,
+                target=str(i),
+                target_datetime_utc=now_utc
+                + timedelta(minutes=rnd.randint(-1000, 60 * 24 * 60)),
+                next_send_datetime_utc=now_utc,
+                repeat_before_packed=encode_repeat_before(repeat_before),
+                user=1,
+                chat=1,
+            )
+        )
+
+    for i in range(0, len(rows), 1000):
+        Reminder.insert_many(rows[i : i + 1000]).execute()
+
+
+def recompute_legacy(now_utc: datetime) -> int:
+    # Построчно через объекты моделей
+    changed: int = 0
+    for reminder in Reminder.select():
+        try:
+            next_send_datetime_utc = get_nearest_datetime(
+                now_utc, reminder.target_datetime_utc, reminder.get_repeat_before()
+            )
+        except ParserException:
+            next_send_datetime_utc = reminder.target_datetime_utc
+
+        if next_send_datetime_utc != reminder.next_send_datetime_utc:
+            reminder.next_send_datetime_utc = next_send_datetime_utc
+            reminder.save()
+            changed += 1
+
+    return changed
+
+
+def bench(name: str, func, now_utc: datetime):
+    models: list[type[BaseModel]] = BaseModel.get_inherited_models()
+    database = SqliteDatabase(":memory:")
+    with database.bind_ctx(models):
+        database.create_tables(models)
+        with database.atomic():
+            fill(now_utc)
+
+        t = time.perf_counter()
+        with database.atomic():
+            changed: int = func(now_utc)
+        elapsed: float = time.perf_counter() - t
+
+    print(f"{name:<10} {changed:>10} {elapsed:>10.3f}")
+
+
+if __name__ == "__main__":
+    now_utc = datetime(year=2025, month=8, day=9, hour=10)
+
+    print(f"Reminders: {NUMBER}")
+    print(f"{'Variant':<10} {'Changed':>10} {'Time, s':>10}")
+    bench("legacy", recompute_legacy, now_utc)
+    bench("current", recompute_next_send_datetime, now_utc)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import random
+import re
+import time
+import unittest
+
+from datetime import datetime
+from typing import Callable
+from unittest.mock import patch
+
+import parser
+from config import MESS_MAX_LENGTH
+from parser import Defaults, ParserException, PARSE_TIMEOUT, parse_command
+
+
+PATTERN_TARGET_DATETIME_LEGACY: re.Pattern = re.compile(
+    ".*?" + parser.PATTERN_TARGET_DATETIME.pattern,
+    flags=parser.PATTERN_TARGET_DATETIME.flags,
+)
+
+
+def search_target_datetime_legacy(command: str) -> re.Match | None:
+    return PATTERN_TARGET_DATETIME_LEGACY.search(command)
+
+
+def get_corpus() -> list[str]:
+    # Команды собираются из тестов parse_command
+    from tests import test_parser
+
+    commands: list[str] = []
+
+    def _parse_command(command: str, *args, **kwargs):
+        commands.append(command)
+        return parse_command(command, *args, **kwargs)
+
+    # Стресс-тест не входит в корпус обычных команд
+    suite = unittest.TestSuite(
+        test
+        for test in unittest.defaultTestLoader.loadTestsFromTestCase(
+            test_parser.TestCaseParseCommand
+        )
+        if "adversarial" not in test.id()
+    )
+    with patch.object(test_parser, "parse_command", _parse_command):
+        suite.run(unittest.TestResult())
+
+    return commands
+
+
+# На полной длине сообщения старый вариант работает минутами
+def get_adversarial_corpus(length: int = MESS_MAX_LENGTH // 8) -> list[str]:
+    return [
+        # Обычный текст без кавычек
+        ("Просто длинное сообщение без команды. " * 200)[:length],
+        # Много кавычек, но без даты
+        ('"a" ' * length)[:length],
+        # Кавычки и числа, похожие на дату
+        ('"1" 1 ' * length)[:length],
+        # Одна кавычка в начале
+        ('"' + "x" * length)[:length],
+        # Слова без дат после причины
+        ('"x" ' + "слово " * length)[:length],
+    ]
+
+
+def get_fuzz_corpus(number: int, seed: int = 42) -> list[str]:
+    # Случайные сообщения из кусков команд, на которых шаблон может откатываться
+    tokens: list[str] = [
+        '"', '"a"', " ", "\n", "1", "10", "2025", "12:00", "февраля", "завтра",
+        "в", "следующую", "через", "дня", "Повтор", "каждый", "Напомни", "за",
+    ]
+    rnd = random.Random(seed)
+
+    commands: list[str] = []
+    for _ in range(number):
+        command: str = ""
+        while len(command) < MESS_MAX_LENGTH:
+            command += rnd.choice(tokens)
+        commands.append(command[:MESS_MAX_LENGTH])
+
+    return commands
+
+
+def stress(name: str, commands: list[str]):
+    worst: float = 0
+    for command in commands:
+        worst = max(worst, bench(lambda: run_parse([command]), number=1))
+
+    print(f"{name:<20} {len(commands):>6} {'':>12} {worst * 1000:>12.3f}")
+    assert worst < PARSE_TIMEOUT, f"Worst parse time {worst:.3f} seconds"
+
+
+def bench(func: Callable[[], None], number: int) -> float:
+    t = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - t) / number
+
+
+def run_parse(commands: list[str]):
+    now = datetime(year=2025, month=8, day=9, hour=22, minute=0)
+    defaults = Defaults(hours=11, minutes=0)
+
+    for command in commands:
+        try:
+            parse_command(command, now, defaults)
+        except ParserException:
+            pass
+
+
+def compare(name: str, commands: list[str], number: int):
+    with patch.object(
+        parser, "search_target_datetime", search_target_datetime_legacy
+    ):
+        before: float = bench(lambda: run_parse(commands), number)
+
+    after: float = bench(lambda: run_parse(commands), number)
+
+    print(
+        f"{name:<20} {len(commands):>6} {before * 1000:>12.3f} {after * 1000:>12.3f}"
+        f" {before / after:>8.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    print(f"{'Corpus':<20} {'Items':>6} {'Before, ms':>12} {'After, ms':>12} {'Speedup':>9}")
+    compare("test_parser", get_corpus(), number=20)
+    compare("adversarial", get_adversarial_corpus(), number=3)
+
+    print()
+    print(f"{'Corpus':<20} {'Items':>6} {'':>12} {'Worst, ms':>12}")
+    stress("adversarial (full)", get_adversarial_corpus(length=MESS_MAX_LENGTH))
+    stress("fuzz", get_fuzz_corpus(number=500))
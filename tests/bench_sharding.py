@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+from tests.test_sharding import run_workers
+
+
+NUMBER: int = 2_000
+
+# Имитация задержки запроса к Telegram
+SEND_TIMEOUT: float = 0.002
+
+
+if __name__ == "__main__":
+    print(f"Reminders: {NUMBER}, send timeout: {SEND_TIMEOUT} s")
+    print(f"{'Workers':<10} {'Sent':>10} {'Time, s':>10} {'Per second':>12}")
+    for workers in [1, 2, 4]:
+        sent_by_worker, elapsed = run_workers(workers, NUMBER, SEND_TIMEOUT)
+        sent: int = sum(len(items) for items in sent_by_worker)
+        print(f"{workers:<10} {sent:>10} {elapsed:>10.3f} {sent / elapsed:>12.1f}")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import tempfile
+import threading
+import time
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable
+
+from peewee import SqliteDatabase
+from playhouse.sqliteq import SqliteQueueDatabase
+
+from db import BaseModel, Chat, Reminder, User, DB_PRAGMAS
+from storage import MemoryStorage, SqliteConcurrentStorage, SqliteStorage, Storage
+
+
+# Потоки, одновременно добавляющие напоминания, как обработчики команд бота
+THREADS: int = 8
+NUMBER_PER_THREAD: int = 250
+PAGE_REQUESTS: int = 1_000
+
+
+def get_queue_storage(path: str) -> Storage:
+    # Как в db.py
+    return SqliteStorage(
+        SqliteQueueDatabase(
+            path,
+            pragmas=DB_PRAGMAS,
+            use_gevent=False,
+            autostart=True,
+            queue_max_size=64,
+            results_timeout=5.0,
+        )
+    )
+
+
+def create_tables(path: str) -> tuple[User, Chat]:
+    models: list[type[BaseModel]] = BaseModel.get_inherited_models()
+
+    # Таблицы создаются отдельным подключением, как в init_db
+    database = SqliteDatabase(path, pragmas=DB_PRAGMAS)
+    with database.bind_ctx(models):
+        database.create_tables(models)
+        User.create(id=1, first_name="user")
+        Chat.create(id=1, type="private")
+    database.close()
+
+    return User.get_by_id(1), Chat.get_by_id(1)
+
+
+def run_threads(func: Callable[[], None]) -> float:
+    threads: list[threading.Thread] = [
+        threading.Thread(target=func) for _ in range(THREADS)
+    ]
+
+    t = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - t
+
+
+def bench(name: str, storage: Storage, user: User, chat: Chat, now_utc: datetime):
+    def _add():
+        for i in range(NUMBER_PER_THREAD):
+            storage.add_reminder(
+                original_message_id=i,
+                original_message_text=f'"{i}" завтра',
+                target=str(i),
+                target_datetime_utc=now_utc,
+                next_send_datetime_utc=now_utc - timedelta(seconds=i),
+                repeat_every=None,
+                repeat_before=[],
+                user=user,
+                chat=chat,
+            )
+
+    add_elapsed: float = run_threads(_add)
+
+    # Захват всех наступивших и сохранение следующей отправки
+    t = time.perf_counter()
+    reminders: list[Reminder] = storage.claim_due(now_utc)
+    for reminder in reminders:
+        reminder.next_send_datetime_utc = now_utc + timedelta(days=1)
+    storage.save_claimed(reminders)
+    claim_elapsed: float = time.perf_counter() - t
+    assert len(reminders) == THREADS * NUMBER_PER_THREAD
+
+    # Перелистывание списка
+    t = time.perf_counter()
+    total: int = storage.get_count(chat.id, user.id)
+    for i in range(PAGE_REQUESTS):
+        storage.get_count(chat.id, user.id)
+        storage.get_page(
+            chat.id, user.id, page=i % 100 + 1, items_per_page=10, total=total
+        )
+    page_elapsed: float = time.perf_counter() - t
+
+    print(
+        f"{name:<20} {add_elapsed:>10.3f} {claim_elapsed:>10.3f} {page_elapsed:>10.3f}"
+    )
+
+
+if __name__ == "__main__":
+    now_utc = datetime(year=2025, month=8, day=9, hour=10)
+
+    print(
+        f"Reminders: {THREADS} threads x {NUMBER_PER_THREAD}, "
+        f"page requests: {PAGE_REQUESTS}"
+    )
+    print(f"{'Storage':<20} {'Add, s':>10} {'Claim, s':>10} {'Pages, s':>10}")
+
+    with tempfile.TemporaryDirectory() as dir_name:
+        path = str(Path(dir_name) / "queue.sqlite")
+        storage = get_queue_storage(path)
+        user, chat = create_tables(path)
+        bench("SQLITE", storage, user, chat, now_utc)
+        storage.close()
+        storage.database.stop()
+
+        path = str(Path(dir_name) / "concurrent.sqlite")
+        storage = SqliteConcurrentStorage(path)
+        user, chat = create_tables(path)
+        bench("SQLITE_CONCURRENT", storage, user, chat, now_utc)
+        storage.close()
+
+    bench(
+        "MEMORY",
+        MemoryStorage(),
+        User(id=1, first_name="user"),
+        Chat(id=1, type="private"),
+        now_utc,
+    )
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import random
+import time
+import tracemalloc
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+
+from parser import (
+    TimeUnit,
+    TimeUnitEnum,
+    get_nearest_datetime,
+    parse_repeat_before,
+)
+
+
+# Количество синтетических напоминаний
+NUMBER: int = 20_000
+
+COMMANDS: list[str] = [
+    "Напомнить за день",
+    "Напомнить за неделю, за 3 дня, за день",
+    "Напомнить за месяц, за 2 недели, за неделю, за 3 дня, за день",
+    "Напомнить за 3 года, за год, за полгода, за 3 месяца, за месяц, за 10 дней",
+]
+
+
+@dataclass
+class TimeUnitLegacy:
+    # Прежний вариант: изменяемый, без слотов, timedelta на каждое сравнение.
+    # Время legacy включает разбор текущей версией и копирование
+    number: int
+    unit: TimeUnitEnum
+
+    def get_timedelta(self) -> timedelta:
+        return timedelta(days=self.number * self.unit.days())
+
+    def get_prev_datetime(self, dt: datetime) -> datetime:
+        return dt - self.get_timedelta()
+
+    def __lt__(self, other: "TimeUnitLegacy") -> bool:
+        return self.get_timedelta() < other.get_timedelta()
+
+
+def parse_repeat_before_legacy(command: str) -> list[TimeUnitLegacy]:
+    return [
+        TimeUnitLegacy(number=unit.number, unit=unit.unit)
+        for unit in parse_repeat_before(command)
+    ]
+
+
+def measure(func: Callable[[], list]) -> tuple[float, int, int]:
+    # Время без tracemalloc, т.к. он сильно замедляет выделение памяти
+    t = time.perf_counter()
+    func()
+    elapsed: float = time.perf_counter() - t
+
+    tracemalloc.start()
+    items: list = func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del items
+    return elapsed, current, peak
+
+
+def run(name: str, parse: Callable[[str], list]):
+    rnd = random.Random(42)
+    commands: list[str] = [rnd.choice(COMMANDS) for _ in range(NUMBER)]
+    dt = datetime(year=2025, month=8, day=9, hour=10)
+
+    def _build() -> list:
+        # Разбор, сортировка и расчет ближайшей отправки для каждого напоминания
+        items: list = []
+        for command in commands:
+            units: list = parse(command)
+            units.sort()
+            get_nearest_datetime(dt, dt + timedelta(days=4000), units)
+            items.append(units)
+        return items
+
+    elapsed, current, peak = measure(_build)
+    print(
+        f"{name:<10} {elapsed * 1000:>10.1f} {current / 1024 / 1024:>12.2f}"
+        f" {peak / 1024 / 1024:>10.2f}"
+    )
+
+
+if __name__ == "__main__":
+    print(f"Reminders: {NUMBER}")
+    print(f"{'Variant':<10} {'Time, ms':>10} {'Memory, MB':>12} {'Peak, MB':>10}")
+    run("legacy", parse_repeat_before_legacy)
+    run("current", parse_repeat_before)
+
+    print(TimeUnit.get.cache_info())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from peewee import SqliteDatabase
+
+from activity import ActivityTracker
+from db import BaseModel, User, Chat, db
+from storage import storage
+from tests.test_db import record_queries
+
+
+class TestCaseActivityTracker(unittest.TestCase):
+    def setUp(self):
+        self.models = BaseModel.get_inherited_models()
+        self.test_db = SqliteDatabase(":memory:")
+        self.test_db.bind(self.models, bind_refs=False, bind_backrefs=False)
+        self.test_db.connect()
+        self.test_db.create_tables(self.models)
+
+        User.clear_cache()
+        Chat.clear_cache()
+
+        self.dt = datetime(year=2025, month=8, day=9, hour=10)
+        for i in range(1, 4):
+            User.create(id=i, first_name=f"user{i}", last_activity=self.dt)
+            Chat.create(id=i, type="private", last_activity=self.dt)
+
+    def tearDown(self):
+        db.bind(self.models, bind_refs=False, bind_backrefs=False)
+
+    def test_flush(self):
+        tracker = ActivityTracker()
+
+        # Повторные отметки одного пользователя схлопываются
+        for i in range(100):
+            tracker.touch_user(1, self.dt + timedelta(seconds=i))
+            tracker.touch_chat(1, self.dt + timedelta(seconds=i))
+        tracker.touch_user(2, self.dt + timedelta(hours=1))
+        self.assertEqual(3, tracker.get_pending_count())
+
+        with record_queries(self.test_db) as queries:
+            tracker.flush()
+
+        # По одному UPDATE на таблицу
+        self.assertEqual(2, len(queries))
+        self.assertEqual(0, tracker.get_pending_count())
+
+        self.assertEqual(
+            self.dt + timedelta(seconds=99), User.get_by_id(1).last_activity
+        )
+        self.assertEqual(self.dt + timedelta(hours=1), User.get_by_id(2).last_activity)
+        self.assertEqual(self.dt, User.get_by_id(3).last_activity)
+        self.assertEqual(
+            self.dt + timedelta(seconds=99), Chat.get_by_id(1).last_activity
+        )
+        self.assertEqual(self.dt, Chat.get_by_id(2).last_activity)
+
+    def test_flush_empty(self):
+        tracker = ActivityTracker()
+        with record_queries(self.test_db) as queries:
+            tracker.flush()
+        self.assertEqual([], queries)
+
+    def test_flush_failed(self):
+        tracker = ActivityTracker()
+        tracker.touch_user(1, self.dt + timedelta(seconds=1))
+        tracker.touch_chat(1, self.dt + timedelta(seconds=1))
+
+        update_last_activity = storage.update_last_activity
+
+        def _update_last_activity(model, activity_by_id: dict) -> int:
+            if model is Chat:
+                # Пока запись шла, пришла более новая отметка
+                tracker.touch_chat(1, self.dt + timedelta(seconds=2))
+                raise Exception("database is locked")
+            return update_last_activity(model, activity_by_id)
+
+        with patch.object(storage, "update_last_activity", _update_last_activity):
+            with self.assertRaises(Exception):
+                tracker.flush()
+
+        # Отметки пользователей записаны, а чатов возвращены без потери новой
+        self.assertEqual(1, tracker.get_pending_count())
+        self.assertEqual(
+            self.dt + timedelta(seconds=1), User.get_by_id(1).last_activity
+        )
+
+        tracker.flush()
+        self.assertEqual(0, tracker.get_pending_count())
+        self.assertEqual(
+            self.dt + timedelta(seconds=2), Chat.get_by_id(1).last_activity
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
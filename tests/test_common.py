@@ -14,7 +14,9 @@ from common import (
     prepare_text,
     get_int_from_match,
     get_tz,
+    get_tz_cache_info,
     convert_tz,
+    LRUCache,
     ZoneInfoNotFoundError,
 )
 
@@ -88,3 +90,55 @@ class TestCaseCommon(TestCase):
 
         with self.assertRaises(ZoneInfoNotFoundError):
             get_tz("dfgsdfsdfdsf")
+
+        # Смещения вне диапазона считаются несуществующими часовыми поясами
+        for value in ["+24:00", "-24:00", "+99:00"]:
+            with self.subTest(value=value):
+                with self.assertRaises(ZoneInfoNotFoundError):
+                    get_tz(value)
+
+    def test_get_tz_cache(self):
+        for value in ["+04:45", "Asia/Kathmandu", "not/exists/tz"]:
+            with self.subTest(value=value):
+                info_before = get_tz_cache_info()
+                try:
+                    tz = get_tz(value)
+                except ZoneInfoNotFoundError:
+                    tz = None
+
+                info = get_tz_cache_info()
+                self.assertEqual(info_before.misses + 1, info.misses)
+
+                for _ in range(3):
+                    if tz:
+                        self.assertIs(tz, get_tz(value))
+                    else:
+                        # Ошибка тоже берется из кэша
+                        with self.assertRaises(ZoneInfoNotFoundError):
+                            get_tz(value)
+
+                info_after = get_tz_cache_info()
+                self.assertEqual(info.misses, info_after.misses)
+                self.assertEqual(info.hits + 3, info_after.hits)
+
+    def test_LRUCache(self):
+        cache = LRUCache(max_size=2)
+        cache.put(1, "1")
+        cache.put(2, "2")
+        self.assertEqual("1", cache.get(1))
+
+        # Вытесняется давно не используемый
+        cache.put(3, "3")
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get(2))
+        self.assertEqual("1", cache.get(1))
+        self.assertEqual("3", cache.get(3))
+        self.assertEqual(3, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+        self.assertEqual("3", cache.pop(3))
+        self.assertIsNone(cache.get(3))
+
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.hits)
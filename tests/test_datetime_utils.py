@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import unittest
+from datetime import datetime, timedelta
+
+from datetime_utils import (
+    get_days_in_month,
+    add_months,
+    add_years,
+    get_months_between,
+    add_weekdays,
+    get_steps_to_pass,
+)
+
+
+class TestCaseDatetimeUtils(unittest.TestCase):
+    def test_get_days_in_month(self):
+        self.assertEqual(31, get_days_in_month(2025, 1))
+        self.assertEqual(28, get_days_in_month(2025, 2))
+        self.assertEqual(29, get_days_in_month(2024, 2))
+        self.assertEqual(30, get_days_in_month(2025, 4))
+
+    def test_add_months(self):
+        dt = datetime(year=2024, month=1, day=31, hour=10, minute=30)
+
+        for months, value in [
+            (0, datetime(year=2024, month=1, day=31, hour=10, minute=30)),
+            (1, datetime(year=2024, month=2, day=29, hour=10, minute=30)),
+            (2, datetime(year=2024, month=3, day=31, hour=10, minute=30)),
+            (3, datetime(year=2024, month=4, day=30, hour=10, minute=30)),
+            (11, datetime(year=2024, month=12, day=31, hour=10, minute=30)),
+            (12, datetime(year=2025, month=1, day=31, hour=10, minute=30)),
+            (13, datetime(year=2025, month=2, day=28, hour=10, minute=30)),
+            (-1, datetime(year=2023, month=12, day=31, hour=10, minute=30)),
+            (-11, datetime(year=2023, month=2, day=28, hour=10, minute=30)),
+            (1200, datetime(year=2124, month=1, day=31, hour=10, minute=30)),
+        ]:
+            with self.subTest(months=months):
+                self.assertEqual(value, add_months(dt, months))
+
+    def test_add_years(self):
+        dt = datetime(year=2024, month=2, day=29)
+        self.assertEqual(datetime(year=2025, month=2, day=28), add_years(dt, 1))
+        self.assertEqual(datetime(year=2028, month=2, day=29), add_years(dt, 4))
+        self.assertEqual(datetime(year=2023, month=2, day=28), add_years(dt, -1))
+
+    def test_get_months_between(self):
+        start = datetime(year=2024, month=1, day=31, hour=10)
+
+        for end, value in [
+            (start, 0),
+            (datetime(year=2024, month=2, day=29, hour=9), 0),
+            (datetime(year=2024, month=2, day=29, hour=10), 1),
+            (datetime(year=2024, month=3, day=30), 1),
+            (datetime(year=2024, month=3, day=31, hour=10), 2),
+            (datetime(year=2025, month=1, day=31, hour=10), 12),
+            (datetime(year=2023, month=12, day=31, hour=10), -1),
+        ]:
+            with self.subTest(end=end):
+                months: int = get_months_between(start, end)
+                self.assertEqual(value, months)
+                self.assertLessEqual(add_months(start, months), end)
+                self.assertGreater(add_months(start, months + 1), end)
+
+    def test_add_weekdays(self):
+        # Понедельник
+        dt = datetime(year=2025, month=8, day=4, hour=12)
+
+        for isoweekday in range(1, 8):
+            # Перебор для сравнения
+            next_dt: datetime = dt
+            for count in range(1, 5):
+                next_dt += timedelta(days=1)
+                while next_dt.isoweekday() != isoweekday:
+                    next_dt += timedelta(days=1)
+
+                with self.subTest(isoweekday=isoweekday, count=count):
+                    self.assertEqual(next_dt, add_weekdays(dt, isoweekday, count))
+
+    def test_get_steps_to_pass(self):
+        start = datetime(year=2025, month=8, day=4)
+        step = timedelta(days=2)
+
+        self.assertEqual(0, get_steps_to_pass(start, start - step, step))
+        self.assertEqual(1, get_steps_to_pass(start, start, step))
+        self.assertEqual(1, get_steps_to_pass(start, start + timedelta(days=1), step))
+        self.assertEqual(2, get_steps_to_pass(start, start + step, step))
+        self.assertEqual(501, get_steps_to_pass(start, start + step * 500, step))
+
+
+if __name__ == "__main__":
+    unittest.main()
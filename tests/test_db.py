@@ -5,16 +5,44 @@ __author__ = "ipetrash"
 
 
 import unittest
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from typing import Iterator
+from unittest.mock import patch
 
+import telegram
 from peewee import SqliteDatabase
 
+import db as db_module
 from db import (
     BaseModel,
+    CatchUpPolicyEnum,
     # TODO:
     Reminder,
+    Chat,
+    User,
     db,
+    migrate_tables,
+    set_process_caches_enabled,
 )
+from occurrences import occurrences_cache
+from parser import RepeatEvery, TimeUnit
+
+
+@contextmanager
+def record_queries(database: SqliteDatabase) -> Iterator[list[tuple[str, tuple]]]:
+    queries: list[tuple[str, tuple]] = []
+    execute_sql = database.execute_sql
+
+    def _execute_sql(sql: str, params=None, *args, **kwargs):
+        queries.append((sql, tuple(params or ())))
+        return execute_sql(sql, params, *args, **kwargs)
+
+    database.execute_sql = _execute_sql
+    try:
+        yield queries
+    finally:
+        del database.execute_sql
 
 
 # NOTE: https://docs.peewee-orm.com/en/latest/peewee/database.html#testing-peewee-applications
@@ -26,9 +54,469 @@ class TestCaseDb(unittest.TestCase):
         self.test_db.connect()
         self.test_db.create_tables(self.models)
 
+        User.clear_cache()
+        Chat.clear_cache()
+        Reminder.clear_count_cache()
+        occurrences_cache.clear()
+
     def tearDown(self):
         db.bind(self.models, bind_refs=False, bind_backrefs=False)
 
+    def add_reminders(
+        self,
+        number: int,
+        next_send_datetime_utc: datetime,
+    ) -> list[Reminder]:
+        user = User.create(id=1, first_name="user")
+        chat = Chat.create(id=1, type="private")
+
+        return [
+            Reminder.create(
+                original_message_text=f'"{i}" завтра',
+                original_message_id=i,
+                target=str(i),
+                target_datetime_utc=next_send_datetime_utc,
+                next_send_datetime_utc=next_send_datetime_utc,
+                user=user,
+                chat=chat,
+            )
+            for i in range(number)
+        ]
+
+    @contextmanager
+    def assert_query_count(self, expected: int) -> Iterator[list[tuple[str, tuple]]]:
+        with record_queries(self.test_db) as queries:
+            yield queries
+
+        self.assertEqual(
+            expected,
+            len(queries),
+            msg="Queries:\n" + "\n".join(sql for sql, _ in queries),
+        )
+
+    def get_query_plan(self, sql: str, params: tuple) -> list[str]:
+        cursor = self.test_db.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+    def assert_no_scan(self, queries: list[tuple[str, tuple]]):
+        self.assertTrue(queries)
+
+        for sql, params in queries:
+            with self.subTest(sql=sql):
+                plan: list[str] = self.get_query_plan(sql, params)
+                for detail in plan:
+                    self.assertFalse(
+                        detail.startswith("SCAN"),
+                        msg=f"Full table scan in {plan} for {sql!r}",
+                    )
+                    self.assertNotIn("USE TEMP B-TREE", detail)
+
+    def test_query_plan_get_due(self):
+        with record_queries(self.test_db) as queries:
+            list(Reminder.get_due(datetime.utcnow()))
+        self.assert_no_scan(queries)
+
+    def test_query_plan_get_page(self):
+        filters = [
+            (Reminder.chat_id == 1),
+            (Reminder.user_id == 1),
+        ]
+        with record_queries(self.test_db) as queries:
+            Reminder.get_page(page=2, filters=filters)
+            Reminder.get_page(page=9, filters=filters, total=10)
+            Reminder.get_page(page=5, filters=filters, anchor_page=4, anchor_id=1)
+            Reminder.get_page(page=3, filters=filters, anchor_page=4, anchor_id=1)
+            Reminder.count(filters)
+        self.assert_no_scan(queries)
+
+    def test_get_page_keyset_one_per_page(self):
+        now_utc: datetime = datetime.utcnow()
+        reminders: list[Reminder] = self.add_reminders(6, now_utc)
+
+        # Одинаковые даты отправки упорядочиваются по id
+        for reminder in reminders[:3]:
+            reminder.next_send_datetime_utc = now_utc + timedelta(days=1)
+            reminder.save()
+        reminders.sort(key=lambda x: (x.next_send_datetime_utc, x.id))
+        total: int = len(reminders)
+        filters = Reminder.get_filters_of(chat_id=1, user_id=1)
+
+        for page in range(1, total + 2):
+            expected: list[int] = [r.id for r in reminders[page - 1 : page]]
+
+            with self.subTest(page=page):
+                items = Reminder.get_page(page=page, filters=filters)
+                self.assertEqual(expected, [reminder.id for reminder in items])
+
+                items = Reminder.get_page(page=page, filters=filters, total=total)
+                self.assertEqual(expected, [reminder.id for reminder in items])
+
+            for anchor_page, anchor in enumerate(reminders, start=1):
+                with self.subTest(page=page, anchor_page=anchor_page):
+                    items = Reminder.get_page(
+                        page=page,
+                        filters=filters,
+                        total=total,
+                        anchor_page=anchor_page,
+                        anchor_id=anchor.id,
+                    )
+                    self.assertEqual(expected, [reminder.id for reminder in items])
+
+    def test_get_page_keyset(self):
+        reminders: list[Reminder] = self.add_reminders(23, datetime.utcnow())
+        ids: list[int] = [reminder.id for reminder in reminders]
+        total: int = len(ids)
+        filters = Reminder.get_filters_of(chat_id=1, user_id=1)
+
+        items_per_page: int = 5
+        page_count: int = 5
+        for page in range(1, page_count + 2):
+            first_index: int = (page - 1) * items_per_page
+            expected: list[int] = ids[first_index : first_index + items_per_page]
+
+            with self.subTest(page=page):
+                items = Reminder.get_page(
+                    page=page,
+                    items_per_page=items_per_page,
+                    filters=filters,
+                    total=total,
+                )
+                self.assertEqual(expected, [reminder.id for reminder in items])
+
+            for anchor_page in range(1, page_count + 1):
+                with self.subTest(page=page, anchor_page=anchor_page):
+                    # Страницы за концом списка не запрашиваются
+                    with self.assert_query_count(1 if expected else 0):
+                        items = Reminder.get_page(
+                            page=page,
+                            items_per_page=items_per_page,
+                            filters=filters,
+                            total=total,
+                            anchor_page=anchor_page,
+                            anchor_id=ids[(anchor_page - 1) * items_per_page],
+                        )
+                    self.assertEqual(expected, [reminder.id for reminder in items])
+
+    def test_get_page_keyset_deleted_anchor(self):
+        reminders: list[Reminder] = self.add_reminders(5, datetime.utcnow())
+        filters = Reminder.get_filters_of(chat_id=1, user_id=1)
+
+        anchor: Reminder = reminders[1]
+        anchor.delete_instance()
+
+        # Отсчет идет от начала списка
+        items = Reminder.get_page(
+            page=3, filters=filters, total=4, anchor_page=2, anchor_id=anchor.id
+        )
+        self.assertEqual([reminders[3].id], [reminder.id for reminder in items])
+
+    def test_get_count_of(self):
+        reminders: list[Reminder] = self.add_reminders(3, datetime.utcnow())
+
+        self.assertEqual(3, Reminder.get_count_of(chat_id=1, user_id=1))
+        with self.assert_query_count(0):
+            self.assertEqual(3, Reminder.get_count_of(chat_id=1, user_id=1))
+
+        reminders[0].delete_instance()
+        self.assertEqual(2, Reminder.get_count_of(chat_id=1, user_id=1))
+
+        Reminder.delete_by_ids([reminders[1].id])
+        self.assertEqual(1, Reminder.get_count_of(chat_id=1, user_id=1))
+
+        Reminder.add(
+            original_message_id=1,
+            original_message_text='"1" завтра',
+            target="1",
+            target_datetime_utc=datetime.utcnow(),
+            next_send_datetime_utc=datetime.utcnow(),
+            repeat_every=None,
+            repeat_before=[],
+            user=User.get_by_id(1),
+            chat=Chat.get_by_id(1),
+        )
+        self.assertEqual(2, Reminder.get_count_of(chat_id=1, user_id=1))
+
+    def test_process_caches_disabled(self):
+        self.add_reminders(3, datetime.utcnow())
+        self.assertEqual(3, Reminder.get_count_of(chat_id=1, user_id=1))
+        self.assertEqual("UTC", Chat.get_cached(1).get_tz().key)
+
+        set_process_caches_enabled(False)
+        self.addCleanup(set_process_caches_enabled, True)
+
+        # Изменения другого процесса бота видны сразу
+        Chat.update(tz="Europe/Berlin").where(Chat.id == 1).execute()
+        Reminder.delete().where(Reminder.id == 1).execute()
+
+        self.assertEqual(2, Reminder.get_count_of(chat_id=1, user_id=1))
+        self.assertEqual("Europe/Berlin", Chat.get_cached(1).get_tz().key)
+
+    def test_migrate_tables(self):
+        self.test_db.execute_sql("ALTER TABLE reminder DROP COLUMN claim_token")
+        self.test_db.execute_sql(
+            "ALTER TABLE reminder DROP COLUMN claim_expires_datetime_utc"
+        )
+
+        migrate_tables(self.test_db, self.models)
+
+        column_names: set[str] = {
+            column.name for column in self.test_db.get_columns("reminder")
+        }
+        self.assertIn("claim_token", column_names)
+        self.assertIn("claim_expires_datetime_utc", column_names)
+
+        # Повторная миграция ничего не меняет
+        migrate_tables(self.test_db, self.models)
+
+    def test_claim_due(self):
+        now_utc: datetime = datetime.utcnow()
+        self.add_reminders(3, next_send_datetime_utc=now_utc - timedelta(minutes=1))
+        Reminder.create(
+            original_message_text='"future" завтра',
+            original_message_id=100,
+            target="future",
+            next_send_datetime_utc=now_utc + timedelta(days=1),
+            user=1,
+            chat=1,
+        )
+
+        reminders: list[Reminder] = Reminder.claim_due(now_utc)
+        self.assertEqual(3, len(reminders))
+        self.assertEqual(1, len({reminder.claim_token for reminder in reminders}))
+
+        # Захваченные напоминания повторно не захватываются
+        self.assertEqual([], Reminder.claim_due(now_utc))
+
+        # Пока не истечет время захвата
+        self.assertEqual(
+            3, len(Reminder.claim_due(now_utc + timedelta(hours=1, seconds=1)))
+        )
+
+    def test_release_claimed(self):
+        now_utc: datetime = datetime.utcnow()
+        self.add_reminders(3, next_send_datetime_utc=now_utc)
+
+        reminders: list[Reminder] = Reminder.claim_due(now_utc)
+        self.assertEqual(2, Reminder.release_claimed([r.id for r in reminders[:2]]))
+        self.assertEqual(2, len(Reminder.claim_due(now_utc)))
+
+    def test_save_claimed(self):
+        now_utc: datetime = datetime.utcnow()
+        self.add_reminders(100, next_send_datetime_utc=now_utc)
+
+        with record_queries(self.test_db) as queries:
+            reminders: list[Reminder] = Reminder.claim_due(now_utc)
+            for reminder in reminders:
+                reminder.next_send_datetime_utc = now_utc + timedelta(days=1)
+                reminder.last_send_message_id = reminder.id
+                reminder.last_send_datetime_utc = now_utc
+
+            self.assertEqual(50, Reminder.save_claimed(reminders[:50]))
+            self.assertEqual(50, Reminder.delete_by_ids([r.id for r in reminders[50:]]))
+
+        # Количество запросов не зависит от количества напоминаний.
+        # При сохранении проверяются часовые пояса чатов, а при удалении
+        # выбираются пары чат-пользователь для сброса количества
+        self.assertEqual(6, len(queries))
+
+        self.assertEqual(50, Reminder.count())
+        self.assertEqual(
+            0,
+            Reminder.count(
+                [
+                    Reminder.claim_token.is_null(False)
+                    | (Reminder.next_send_datetime_utc <= now_utc)
+                ]
+            ),
+        )
+
+    def test_claim_due_query_count(self):
+        now_utc: datetime = datetime.utcnow()
+        self.add_reminders(10, next_send_datetime_utc=now_utc)
+
+        # Захват и выборка с чатами, без отдельного запроса на каждое напоминание
+        with self.assert_query_count(2):
+            reminders: list[Reminder] = Reminder.claim_due(now_utc)
+            for reminder in reminders:
+                reminder.get_next_send_datetime()
+                reminder.get_target_datetime()
+                reminder.get_create_datetime()
+
+        self.assertEqual(10, len(reminders))
+        self.assertEqual(1, len({id(reminder.chat) for reminder in reminders}))
+
+    def test_get_page_query_count(self):
+        self.add_reminders(3, next_send_datetime_utc=datetime.utcnow())
+
+        with self.assert_query_count(1):
+            (reminder,) = Reminder.get_page(
+                page=2, filters=[Reminder.chat_id == 1, Reminder.user_id == 1]
+            )
+            reminder.get_next_send_datetime()
+            reminder.get_target_datetime()
+
+        with self.assert_query_count(1):
+            Reminder.get_with_chat(reminder.id).get_target_datetime()
+
+    def test_chat_get_tz(self):
+        chat = Chat(id=1, type="private", tz="+03:00")
+        tz = chat.get_tz()
+        self.assertIs(tz, chat.get_tz())
+        self.assertEqual("UTC+03:00", str(tz))
+
+        chat.tz = "Europe/Moscow"
+        self.assertEqual("Europe/Moscow", str(chat.get_tz()))
+
+    def test_get_from_identity_cache(self):
+        tg_user = telegram.User(id=1, first_name="user", is_bot=False)
+        tg_chat = telegram.Chat(id=1, type="private")
+
+        with self.assert_query_count(4):
+            user: User = User.get_from(tg_user)
+            chat: Chat = Chat.get_from(tg_chat)
+
+        # Повторные обращения не обращаются к базе
+        with self.assert_query_count(0):
+            self.assertIs(user, User.get_from(tg_user))
+            self.assertIs(chat, Chat.get_from(tg_chat))
+
+        # Объект, которого нет в кэше, загружается из базы один раз
+        Chat.clear_cache()
+        with self.assert_query_count(1):
+            chat = Chat.get_from(tg_chat)
+            self.assertIs(chat, Chat.get_from(tg_chat))
+
+    def test_identity_cache_save(self):
+        tg_chat = telegram.Chat(id=1, type="private")
+        chat: Chat = Chat.get_from(tg_chat)
+        chat.last_activity = datetime(year=2000, month=1, day=1)
+        chat.save()
+
+        # Сохраняются только измененные поля
+        chat.tz = "+03:00"
+        with self.assert_query_count(1) as queries:
+            chat.save()
+        self.assertNotIn("last_activity", queries[0][0])
+
+        self.assertEqual("+03:00", Chat.get_by_id(1).tz)
+        self.assertIs(chat, Chat.get_from(tg_chat))
+
+        Chat.clear_cache()
+        self.assertEqual("+03:00", Chat.get_from(tg_chat).tz)
+
+    def test_process_next_notify_catch_up(self):
+        target_datetime_utc = datetime(year=2025, month=8, day=1, hour=10)
+        now_utc: datetime = target_datetime_utc + timedelta(days=7, hours=1)
+
+        for policy, next_datetime_utc in [
+            (CatchUpPolicyEnum.FIRE_ONCE, datetime(year=2025, month=8, day=9, hour=10)),
+            (CatchUpPolicyEnum.SKIP, datetime(year=2025, month=8, day=9, hour=10)),
+            # Каждый пропущенный повтор будет отправлен сразу
+            (CatchUpPolicyEnum.FIRE_ALL, datetime(year=2025, month=8, day=2, hour=10)),
+        ]:
+            with self.subTest(policy=policy):
+                reminder = Reminder(
+                    target="x",
+                    target_datetime_utc=target_datetime_utc,
+                    next_send_datetime_utc=target_datetime_utc,
+                    repeat_every="1 DAY",
+                )
+                self.assertTrue(reminder.is_missed(now_utc))
+
+                self.assertTrue(reminder.process_next_notify(now_utc, policy))
+                self.assertEqual(next_datetime_utc, reminder.target_datetime_utc)
+                self.assertEqual(next_datetime_utc, reminder.next_send_datetime_utc)
+
+        # Без повторов следующей отправки нет
+        reminder = Reminder(
+            target="x",
+            target_datetime_utc=target_datetime_utc,
+            next_send_datetime_utc=target_datetime_utc,
+        )
+        self.assertFalse(reminder.process_next_notify(now_utc))
+
+    def test_process_next_notify_fire_all(self):
+        target_datetime_utc = datetime(year=2025, month=8, day=1, hour=10)
+        now_utc: datetime = target_datetime_utc + timedelta(days=3, hours=1)
+
+        reminder = Reminder(
+            target="x",
+            target_datetime_utc=target_datetime_utc,
+            next_send_datetime_utc=target_datetime_utc,
+            repeat_every="1 DAY",
+            repeat_before='["1 DAY"]',
+        )
+
+        next_send_datetimes_utc: list[datetime] = []
+        for _ in range(4):
+            reminder.process_next_notify(now_utc, CatchUpPolicyEnum.FIRE_ALL)
+            next_send_datetimes_utc.append(reminder.next_send_datetime_utc)
+
+        # Пропущенные повторы, затем ближайшая будущая отправка
+        self.assertEqual(
+            [
+                datetime(year=2025, month=8, day=2, hour=10),
+                datetime(year=2025, month=8, day=3, hour=10),
+                datetime(year=2025, month=8, day=4, hour=10),
+                # Напоминание за день до 5-го числа уже прошло
+                datetime(year=2025, month=8, day=5, hour=10),
+            ],
+            next_send_datetimes_utc,
+        )
+
+    def test_repeat_columns(self):
+        now_utc: datetime = datetime.utcnow()
+        repeat_every = RepeatEvery.parse_value("2 WEEK")
+        repeat_before = [TimeUnit.parse_value("1 DAY")]
+
+        reminder = Reminder.add(
+            original_message_id=1,
+            original_message_text='"x" завтра',
+            target="x",
+            target_datetime_utc=now_utc,
+            next_send_datetime_utc=now_utc,
+            repeat_every=repeat_every,
+            repeat_before=repeat_before,
+            user=User.create(id=1, first_name="user"),
+            chat=Chat.create(id=1, type="private"),
+        )
+        reminder = Reminder.get_by_id(reminder.id)
+
+        # Значения берутся из числовых столбцов, без разбора строк
+        with (
+            patch.object(db_module, "parse_repeat_every") as parse_every_mock,
+            patch.object(db_module, "parse_repeat_before") as parse_before_mock,
+        ):
+            self.assertEqual(repeat_every, reminder.get_repeat_every())
+            self.assertEqual(repeat_before, reminder.get_repeat_before())
+        parse_every_mock.assert_not_called()
+        parse_before_mock.assert_not_called()
+
+    def test_fill_repeat_columns(self):
+        reminders: list[Reminder] = self.add_reminders(
+            3, next_send_datetime_utc=datetime.utcnow()
+        )
+        Reminder.update(repeat_every="MONDAY", repeat_before='["1 WEEK"]').where(
+            Reminder.id != reminders[0].id
+        ).execute()
+
+        self.assertEqual(2, Reminder.fill_repeat_columns())
+        self.assertEqual(0, Reminder.fill_repeat_columns())
+
+        reminder: Reminder = Reminder.get_by_id(reminders[1].id)
+        self.assertIsNotNone(reminder.repeat_every_unit)
+        self.assertIsNotNone(reminder.repeat_before_packed)
+        self.assertEqual(
+            RepeatEvery.parse_value("MONDAY"), reminder.get_repeat_every()
+        )
+        self.assertEqual(
+            [TimeUnit.parse_value("1 WEEK")], reminder.get_repeat_before()
+        )
+
+        reminder = Reminder.get_by_id(reminders[0].id)
+        self.assertIsNone(reminder.get_repeat_every())
+        self.assertEqual([], reminder.get_repeat_before())
+
     def test_TODO(self):
         # TODO:
         1 / 0
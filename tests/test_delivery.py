@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import asyncio
+import unittest
+
+from common import log
+from delivery import DeliveryPool
+
+
+class TestCaseDeliveryPool(unittest.IsolatedAsyncioTestCase):
+    async def test_order_in_chat(self):
+        pool = DeliveryPool()
+
+        sent: dict[int, list[int]] = dict()
+
+        async def send(chat_id: int, task_id: int):
+            await asyncio.sleep(0.001)
+            sent.setdefault(chat_id, []).append(task_id)
+
+        task_id: int = 0
+        for i in range(10):
+            for chat_id in range(5):
+                task_id += 1
+                pool.submit(
+                    chat_id=chat_id,
+                    task_id=task_id,
+                    func=lambda c=chat_id, t=task_id: send(c, t),
+                )
+
+        await pool.join()
+
+        self.assertEqual(5, len(sent))
+        for chat_id, task_ids in sent.items():
+            with self.subTest(chat_id=chat_id):
+                self.assertEqual(10, len(task_ids))
+                self.assertEqual(sorted(task_ids), task_ids)
+
+    async def test_in_flight(self):
+        pool = DeliveryPool()
+        event = asyncio.Event()
+
+        self.assertTrue(pool.submit(chat_id=1, task_id=1, func=event.wait))
+        self.assertTrue(pool.is_in_flight(1))
+
+        # Повторная постановка уже отправляемой задачи игнорируется
+        self.assertFalse(pool.submit(chat_id=1, task_id=1, func=event.wait))
+
+        event.set()
+        await pool.join()
+        self.assertFalse(pool.is_in_flight(1))
+
+    async def test_parallel_chats(self):
+        pool = DeliveryPool()
+        number: int = 100
+
+        started: list[int] = []
+        all_started = asyncio.Event()
+
+        async def send(chat_id: int):
+            # Задача завершается, только когда начались задачи всех чатов,
+            # при последовательной отправке это не случится
+            started.append(chat_id)
+            if len(started) == number:
+                all_started.set()
+
+            await all_started.wait()
+
+        for chat_id in range(number):
+            pool.submit(
+                chat_id=chat_id, task_id=chat_id, func=lambda c=chat_id: send(c)
+            )
+        await asyncio.wait_for(pool.join(), timeout=5)
+
+        self.assertTrue(all_started.is_set())
+        self.assertEqual(list(range(number)), sorted(started))
+
+    async def test_error(self):
+        pool = DeliveryPool()
+        sent: list[int] = []
+
+        async def fail():
+            raise Exception("Error")
+
+        async def send():
+            sent.append(2)
+
+        # Ошибка задачи не мешает следующим задачам чата
+        pool.submit(chat_id=1, task_id=1, func=fail)
+        pool.submit(chat_id=1, task_id=2, func=send)
+        with self.assertLogs(log, level="ERROR"):
+            await pool.join()
+
+        self.assertEqual([2], sent)
+        self.assertFalse(pool.is_in_flight(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import asyncio
+import threading
+import time
+import unittest
+
+from typing import Any, Coroutine
+
+from common import log
+from lifecycle import Lifecycle, LifecycleStateEnum
+
+
+class Bot:
+    def __init__(self, username: str):
+        self.username: str = username
+
+
+class TestCaseLifecycle(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        self.drained: list[str] = []
+        self.lifecycle = Lifecycle(loop=self.loop, drain=self._drain)
+
+    def tearDown(self):
+        self.run_coroutine(self._cancel_tasks()).result(timeout=1)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    @staticmethod
+    async def _cancel_tasks():
+        tasks: list[asyncio.Task] = [
+            task for task in asyncio.all_tasks() if task is not asyncio.current_task()
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _drain(self):
+        self.drained.append("drain")
+
+    def run_coroutine(self, coro: Coroutine) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def get_bot(self, seconds: float = 0) -> Bot:
+        async with self.lifecycle.running() as bot:
+            await asyncio.sleep(seconds)
+            return bot
+
+    def test_wait_ready(self):
+        self.assertEqual(LifecycleStateEnum.STARTING, self.lifecycle.get_state())
+
+        future = self.run_coroutine(self.get_bot())
+        time.sleep(0.05)
+        self.assertFalse(future.done())
+
+        bot = Bot("bot")
+        self.lifecycle.start(bot)
+        self.assertIs(bot, future.result(timeout=1))
+        self.assertTrue(self.lifecycle.is_ready())
+
+    def test_pause(self):
+        self.lifecycle.start(Bot("old"))
+
+        # Остановка ждет начатой отправки со старым ботом
+        future = self.run_coroutine(self.get_bot(seconds=0.1))
+        time.sleep(0.01)
+
+        self.lifecycle.pause()
+        self.assertEqual("old", future.result(timeout=1).username)
+        self.assertEqual(["drain"], self.drained)
+        self.assertEqual(LifecycleStateEnum.PAUSED, self.lifecycle.get_state())
+
+        # Пока бот не запущен снова, отправки ждут
+        future = self.run_coroutine(self.get_bot())
+        time.sleep(0.05)
+        self.assertFalse(future.done())
+
+        self.lifecycle.start(Bot("new"))
+        self.assertEqual("new", future.result(timeout=1).username)
+
+    def test_pause_timeout(self):
+        self.lifecycle.start(Bot("bot"))
+        self.run_coroutine(self.get_bot(seconds=1))
+        time.sleep(0.01)
+
+        with self.assertLogs(log, level="WARNING"):
+            self.lifecycle.pause(timeout=0.05)
+        self.assertEqual([], self.drained)
+
+    def test_health(self):
+        health: dict = self.lifecycle.get_health()
+        self.assertEqual("STARTING", health["state"])
+        self.assertIsNone(health["bot"])
+
+        self.lifecycle.start(Bot("bot"))
+        self.lifecycle.stop()
+
+        health = self.lifecycle.get_health()
+        self.assertEqual("STOPPED", health["state"])
+        self.assertEqual("bot", health["bot"])
+
+
+if __name__ == "__main__":
+    unittest.main()
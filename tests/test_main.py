@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import asyncio
+import os
+import signal
+import threading
+import time
+import unittest
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from telegram import Bot
+from telegram import User as TelegramUser
+from telegram.ext import Updater
+
+import main
+import scheduler
+
+from db import Chat, Reminder, User
+from lifecycle import Lifecycle, LifecycleStateEnum
+from scheduler import ReminderScheduler
+from storage import MemoryStorage
+from webhook import WebhookServer
+
+
+class TestCaseProcessCheckReminders(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.now_utc = datetime.utcnow() - timedelta(seconds=1)
+
+        self.user = User(id=1, first_name="user")
+        self.reminders: list[Reminder] = [
+            self.storage.add_reminder(
+                original_message_id=1,
+                original_message_text='"1" завтра',
+                target="1",
+                target_datetime_utc=self.now_utc,
+                next_send_datetime_utc=self.now_utc,
+                repeat_every=None,
+                repeat_before=[],
+                user=self.user,
+                chat=Chat(id=chat_id, type="private"),
+            )
+            for chat_id in [1, 2]
+        ]
+
+    def send_reminder_notification(self, bot, reminder: Reminder, now_utc: datetime):
+        # Чат 2 медленный, например из-за ограничения частоты отправки в группу
+        if reminder.chat_id == 2:
+            time.sleep(0.5)
+        return main.SendStatusEnum.FINISHED
+
+    async def test_flush_before_batch_finished(self):
+        with (
+            patch.object(main, "storage", self.storage),
+            patch.object(main, "BATCH_FLUSH_TIMEOUT", 0.05),
+            patch.object(
+                main, "send_reminder_notification", self.send_reminder_notification
+            ),
+        ):
+            await main.process_check_reminders(bot=None)
+            await asyncio.sleep(0.2)
+
+            # Результат быстрого чата записан, не дожидаясь медленного
+            self.assertIsNone(self.storage.get_reminder(self.reminders[0].id))
+            self.assertIsNotNone(self.storage.get_reminder(self.reminders[1].id))
+
+            await main.delivery_pool.join()
+            self.assertEqual({}, self.storage.get_schedule())
+
+
+class TestCaseDoCheckingReminders(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.now_utc = datetime.utcnow() - timedelta(seconds=1)
+        self.reminder: Reminder = self.storage.add_reminder(
+            original_message_id=1,
+            original_message_text='"1" завтра',
+            target="1",
+            target_datetime_utc=self.now_utc,
+            next_send_datetime_utc=self.now_utc,
+            repeat_every=None,
+            repeat_before=[],
+            user=User(id=1, first_name="user"),
+            chat=Chat(id=1, type="private"),
+        )
+
+        self.claim_errors: list[Exception] = [TimeoutError("results timeout")]
+
+    def claim_due(self, *args, **kwargs) -> list[Reminder]:
+        # Первый захват не удается, как при таймауте очереди записи в базу
+        if self.claim_errors:
+            raise self.claim_errors.pop()
+        return MemoryStorage.claim_due(self.storage, *args, **kwargs)
+
+    async def test_retry_after_claim_error(self):
+        lifecycle = Lifecycle(loop=asyncio.get_running_loop())
+        lifecycle.start(bot=None)
+
+        with (
+            patch.object(self.storage, "claim_due", self.claim_due),
+            patch.object(main, "storage", self.storage),
+            patch.object(scheduler, "storage", self.storage),
+            patch.object(main, "reminder_scheduler", ReminderScheduler()),
+            patch.object(main, "lifecycle", lifecycle),
+            patch.object(main, "RETRY_SEND_TIMEOUT", timedelta(seconds=0.1)),
+            patch.object(
+                main,
+                "send_reminder_notification",
+                lambda *args: main.SendStatusEnum.FINISHED,
+            ),
+        ):
+            task = asyncio.create_task(main.do_checking_reminders())
+            try:
+                # Напоминание отправлено повторно, не дожидаясь перезагрузки
+                # расписания из базы
+                for _ in range(50):
+                    await asyncio.sleep(0.1)
+                    if not self.storage.get_schedule():
+                        break
+
+                self.assertEqual([], self.claim_errors)
+                self.assertIsNone(self.storage.get_reminder(self.reminder.id))
+            finally:
+                task.cancel()
+
+
+class WebhookBot(Bot):
+    def set_webhook(self, *args, **kwargs) -> bool:
+        # Остановка, как при перезапуске сервиса
+        threading.Timer(0.1, os.kill, args=(os.getpid(), signal.SIGTERM)).start()
+        return True
+
+
+class TestCaseRunWebhook(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        self.drained: list[str] = []
+        self.lifecycle = Lifecycle(loop=self.loop, drain=self._drain)
+
+        self.servers: list[WebhookServer] = []
+        self.updaters: list[Updater] = []
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def _drain(self):
+        self.drained.append("drain")
+
+    def get_bot(self, *args, **kwargs) -> Bot:
+        # Без запросов к Telegram
+        bot = WebhookBot("123456:TEST")
+        bot._bot = TelegramUser(id=123456, first_name="bot", is_bot=True)
+        return bot
+
+    def get_updater(self, *args, **kwargs) -> Updater:
+        updater = Updater(*args, **kwargs)
+        self.updaters.append(updater)
+        return updater
+
+    def get_server(self, *args, **kwargs) -> WebhookServer:
+        server = WebhookServer(*args, **kwargs)
+        self.servers.append(server)
+        return server
+
+    def test_stop_by_signal(self):
+        with (
+            patch.object(main, "RateLimitedBot", self.get_bot),
+            patch.object(main, "Updater", self.get_updater),
+            patch.object(main, "WebhookServer", self.get_server),
+            patch.object(main, "lifecycle", self.lifecycle),
+            patch.object(main, "WEBHOOK_URL", "https://example.com/webhook"),
+            patch.object(main, "WEBHOOK_PORT", 0),
+        ):
+            main.main()
+
+        # Сервер и диспетчер остановлены, начатые отправки дождались
+        (server,) = self.servers
+        self.assertIsNone(server._thread)
+        (updater,) = self.updaters
+        self.assertFalse(updater.dispatcher.running)
+
+        self.assertEqual(["drain"], self.drained)
+        self.assertEqual(LifecycleStateEnum.PAUSED, self.lifecycle.get_state())
+
+        # Обработчик сигнала восстановлен
+        self.assertIs(signal.default_int_handler, signal.getsignal(signal.SIGINT))
+
+
+if __name__ == "__main__":
+    unittest.main()
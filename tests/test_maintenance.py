@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import random
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from peewee import SqliteDatabase
+
+from common import get_tz
+import maintenance
+
+from db import BaseModel, Reminder, Chat, User, db
+from maintenance import (
+    change_chat_tz,
+    get_nearest_send,
+    recompute_next_send_datetime,
+    migrate_chat_tz,
+)
+from parser import TimeUnit, get_nearest_datetime
+from tests.test_db import record_queries
+
+
+class TestCaseMaintenance(unittest.TestCase):
+    def setUp(self):
+        self.models = BaseModel.get_inherited_models()
+        self.test_db = SqliteDatabase(":memory:")
+        self.test_db.bind(self.models, bind_refs=False, bind_backrefs=False)
+        self.test_db.connect()
+        self.test_db.create_tables(self.models)
+
+        User.clear_cache()
+        Chat.clear_cache()
+
+    def tearDown(self):
+        db.bind(self.models, bind_refs=False, bind_backrefs=False)
+
+    def test_get_nearest_send(self):
+        offsets = (0, 10, 100)
+        self.assertEqual(1000, get_nearest_send(1000, offsets, now=1000 - 5))
+        self.assertEqual(990, get_nearest_send(1000, offsets, now=1000 - 11))
+        self.assertEqual(990, get_nearest_send(1000, offsets, now=1000 - 100))
+        self.assertEqual(900, get_nearest_send(1000, offsets, now=1000 - 101))
+        # Целевая дата уже наступила
+        self.assertEqual(1000, get_nearest_send(1000, offsets, now=1000))
+        self.assertEqual(1000, get_nearest_send(1000, (0,), now=2000))
+
+    def test_recompute_next_send_datetime(self):
+        now_utc = datetime(year=2025, month=8, day=9, hour=10)
+        user = User.create(id=1, first_name="user")
+        chat = Chat.create(id=1, type="private")
+
+        rnd = random.Random(42)
+        all_repeat_before: list[list[TimeUnit]] = [
+            [],
+            [TimeUnit.parse_value("1 DAY")],
+            [TimeUnit.parse_value("1 WEEK"), TimeUnit.parse_value("3 DAY")],
+            [TimeUnit.parse_value("1 MONTH"), TimeUnit.parse_value("1 DAY")],
+        ]
+
+        expected_by_id: dict[int, datetime] = dict()
+        for i in range(1000):
+            target_datetime_utc: datetime = now_utc + timedelta(
+                minutes=rnd.randint(-1000, 60 * 24 * 60)
+            )
+            repeat_before: list[TimeUnit] = rnd.choice(all_repeat_before)
+            reminder = Reminder.add(
+                original_message_id=i,
+                original_message_text=f'"{i}"',
+                target=str(i),
+                target_datetime_utc=target_datetime_utc,
+                # Устаревшее значение
+                next_send_datetime_utc=now_utc - timedelta(days=1000),
+                repeat_every=None,
+                repeat_before=repeat_before,
+                user=user,
+                chat=chat,
+            )
+
+            if target_datetime_utc <= now_utc:
+                expected = target_datetime_utc
+            else:
+                expected = get_nearest_datetime(
+                    now_utc, target_datetime_utc, repeat_before
+                )
+            expected_by_id[reminder.id] = expected
+
+        with record_queries(self.test_db) as queries:
+            changed: int = recompute_next_send_datetime(now_utc, batch_size=100)
+        self.assertEqual(1000, changed)
+
+        # Одна выборка и запись пачками
+        self.assertEqual(1 + 10, len(queries))
+
+        self.assertEqual(
+            expected_by_id,
+            {
+                reminder.id: reminder.next_send_datetime_utc
+                for reminder in Reminder.select()
+            },
+        )
+
+        # Повторный пересчет ничего не меняет
+        self.assertEqual(0, recompute_next_send_datetime(now_utc))
+
+    def test_recompute_without_update_from(self):
+        # Как в SQLite старше 3.33
+        with patch.object(maintenance, "IS_UPDATE_FROM_SUPPORTED", False):
+            self.test_recompute_next_send_datetime()
+
+    def test_recompute_skip_claimed(self):
+        now_utc = datetime(year=2025, month=8, day=9, hour=10)
+        Reminder.create(
+            original_message_text='"x"',
+            original_message_id=1,
+            target="x",
+            target_datetime_utc=now_utc + timedelta(days=1),
+            next_send_datetime_utc=now_utc,
+            claim_token="token",
+            user=User.create(id=1, first_name="user"),
+            chat=Chat.create(id=1, type="private"),
+        )
+        self.assertEqual(0, recompute_next_send_datetime(now_utc))
+
+    def test_migrate_chat_tz(self):
+        now_utc = datetime(year=2025, month=1, day=9, hour=10)
+        user = User.create(id=1, first_name="user")
+        chat = Chat.create(id=1, type="private")
+        other_chat = Chat.create(id=2, type="private")
+
+        def _add(
+            chat: Chat,
+            target_datetime_utc: datetime,
+            repeat_before: list[TimeUnit],
+        ) -> Reminder:
+            return Reminder.add(
+                original_message_id=1,
+                original_message_text='"x"',
+                target="x",
+                target_datetime_utc=target_datetime_utc,
+                next_send_datetime_utc=get_nearest_datetime(
+                    now_utc, target_datetime_utc, repeat_before
+                ),
+                repeat_every=None,
+                repeat_before=repeat_before,
+                user=user,
+                chat=chat,
+            )
+
+        # 10:00 по UTC+03:00 зимой и летом
+        winter = _add(chat, datetime(year=2025, month=2, day=1, hour=7), [])
+        summer = _add(
+            chat,
+            datetime(year=2025, month=7, day=1, hour=7),
+            [TimeUnit.parse_value("1 DAY")],
+        )
+        other = _add(other_chat, datetime(year=2025, month=2, day=1, hour=7), [])
+
+        with record_queries(self.test_db) as queries:
+            result = migrate_chat_tz(
+                chat_id=chat.id,
+                from_tz=get_tz("+03:00"),
+                to_tz=get_tz("Europe/Berlin"),
+                now_utc=now_utc,
+            )
+        self.assertEqual(2, len(queries))
+        self.assertEqual(2, result.changed)
+        self.assertGreater(result.elapsed, 0)
+
+        # 10:00 по Берлину: зимой UTC+01:00, летом UTC+02:00
+        winter = Reminder.get_by_id(winter.id)
+        self.assertEqual(
+            datetime(year=2025, month=2, day=1, hour=9), winter.target_datetime_utc
+        )
+        self.assertEqual(winter.target_datetime_utc, winter.next_send_datetime_utc)
+
+        summer = Reminder.get_by_id(summer.id)
+        self.assertEqual(
+            datetime(year=2025, month=7, day=1, hour=8), summer.target_datetime_utc
+        )
+        self.assertEqual(
+            datetime(year=2025, month=6, day=30, hour=8), summer.next_send_datetime_utc
+        )
+
+        self.assertEqual(
+            {
+                winter.id: winter.next_send_datetime_utc,
+                summer.id: summer.next_send_datetime_utc,
+            },
+            result.next_send_by_id,
+        )
+
+        # Напоминания другого чата не меняются
+        self.assertEqual(
+            other.target_datetime_utc, Reminder.get_by_id(other.id).target_datetime_utc
+        )
+
+    def test_migrate_chat_tz_unchanged(self):
+        now_utc = datetime(year=2025, month=1, day=9, hour=10)
+        reminder = Reminder.add(
+            original_message_id=1,
+            original_message_text='"x"',
+            target="x",
+            target_datetime_utc=now_utc + timedelta(days=1),
+            next_send_datetime_utc=now_utc + timedelta(days=1),
+            repeat_every=None,
+            repeat_before=[],
+            user=User.create(id=1, first_name="user"),
+            chat=Chat.create(id=1, type="private"),
+        )
+
+        # У Москвы то же смещение UTC+03:00, поэтому записывать нечего
+        with record_queries(self.test_db) as queries:
+            result = migrate_chat_tz(
+                chat_id=1,
+                from_tz=get_tz("+03:00"),
+                to_tz=get_tz("Europe/Moscow"),
+                now_utc=now_utc,
+            )
+        self.assertEqual(1, len(queries))
+        self.assertEqual(0, result.changed)
+        self.assertEqual({}, result.next_send_by_id)
+        self.assertEqual(
+            now_utc + timedelta(days=1),
+            Reminder.get_by_id(reminder.id).target_datetime_utc,
+        )
+
+    def add_claimed(self, now_utc: datetime, number: int) -> list[Reminder]:
+        user = User.create(id=1, first_name="user")
+        chat = Chat.create(id=1, type="private", tz="+03:00")
+        for i in range(number):
+            Reminder.add(
+                original_message_id=i,
+                original_message_text=f'"{i}"',
+                target=str(i),
+                target_datetime_utc=now_utc,
+                next_send_datetime_utc=now_utc,
+                repeat_every=None,
+                repeat_before=[],
+                user=user,
+                chat=chat,
+            )
+        return Reminder.claim_due(now_utc)
+
+    def test_change_chat_tz_claimed(self):
+        # 10:00 по UTC+03:00
+        now_utc = datetime(year=2025, month=1, day=9, hour=7)
+        sent, failed = self.add_claimed(now_utc, number=2)
+
+        # Пока напоминание отправлялось, рассчитана следующая отправка
+        # в старом часовом поясе: завтра в 10:00 по UTC+03:00
+        sent.target_datetime_utc = now_utc + timedelta(days=1)
+        sent.next_send_datetime_utc = now_utc + timedelta(days=1)
+
+        result = change_chat_tz(Chat.get_by_id(1), "+05:00", now_utc=now_utc)
+        self.assertEqual(2, result.changed)
+        self.assertEqual("+05:00", Chat.get_by_id(1).tz)
+
+        Reminder.save_claimed([sent])
+        Reminder.release_claimed([failed.id])
+
+        # 10:00 по UTC+05:00
+        sent = Reminder.get_by_id(sent.id)
+        self.assertIsNone(sent.claim_token)
+        self.assertEqual(
+            now_utc + timedelta(days=1, hours=-2), sent.target_datetime_utc
+        )
+        self.assertEqual(sent.target_datetime_utc, sent.next_send_datetime_utc)
+
+        failed = Reminder.get_by_id(failed.id)
+        self.assertIsNone(failed.claim_token)
+        self.assertEqual(now_utc - timedelta(hours=2), failed.target_datetime_utc)
+        self.assertEqual(failed.target_datetime_utc, failed.next_send_datetime_utc)
+
+    def test_change_chat_tz_rollback(self):
+        now_utc = datetime(year=2025, month=1, day=9, hour=7)
+        self.add_claimed(now_utc, number=1)
+        chat: Chat = Chat.get_by_id(1)
+
+        with (
+            patch.object(maintenance, "migrate_chat_tz", side_effect=Exception()),
+            self.assertRaises(Exception),
+        ):
+            change_chat_tz(chat, "+05:00", now_utc=now_utc)
+
+        # Часовой пояс не изменился, раз напоминания не перенесены
+        self.assertEqual("+03:00", chat.tz)
+        self.assertEqual("+03:00", Chat.get_by_id(1).tz)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import occurrences
+from occurrences import (
+    Occurrence,
+    OccurrencesCache,
+    iter_occurrences,
+    parse_repeat_every,
+    parse_repeat_before,
+)
+from parser import ParserException, RepeatEvery, get_nearest_datetime
+
+
+class TestCaseOccurrences(unittest.TestCase):
+    def test_parse(self):
+        self.assertIs(parse_repeat_every("1 DAY"), parse_repeat_every("1 DAY"))
+        self.assertIsNone(parse_repeat_every("???"))
+
+        value: str = '["1 WEEK", "1 DAY"]'
+        self.assertIs(parse_repeat_before(value), parse_repeat_before(value))
+        self.assertEqual(2, len(parse_repeat_before(value)))
+
+    def test_iter_occurrences(self):
+        target_datetime = datetime(year=2025, month=8, day=9, hour=10)
+
+        for repeat_every, repeat_before in [
+            (None, "[]"),
+            (None, '["1 WEEK", "1 DAY"]'),
+            ("1 DAY", "[]"),
+            ("1 DAY", '["3 DAY"]'),
+            ("1 WEEK", '["1 DAY", "2 DAY"]'),
+            ("2 WEEK", '["1 MONTH"]'),
+            ("MONDAY", '["1 DAY"]'),
+            ("1 MONTH", '["1 WEEK"]'),
+            ("1 YEAR", '["1 MONTH", "1 WEEK", "1 DAY"]'),
+        ]:
+            with self.subTest(repeat_every=repeat_every, repeat_before=repeat_before):
+                rule = parse_repeat_every(repeat_every) if repeat_every else None
+                units = parse_repeat_before(repeat_before)
+
+                # Пошаговый расчет, как в Reminder.process_next_notify до кэша
+                expected: list[Occurrence] = []
+                now: datetime = target_datetime - timedelta(days=40)
+                current_target_datetime: datetime = target_datetime
+                while len(expected) < 20:
+                    if now >= current_target_datetime:
+                        if not rule:
+                            break
+                        current_target_datetime = rule.get_next_datetime(
+                            current_target_datetime
+                        )
+
+                    try:
+                        now = get_nearest_datetime(
+                            now, current_target_datetime, list(units)
+                        )
+                    except ParserException:
+                        break
+                    expected.append(Occurrence(now, current_target_datetime))
+
+                actual: list[Occurrence] = []
+                for occurrence in iter_occurrences(
+                    target_datetime=target_datetime,
+                    repeat_every=rule,
+                    repeat_before=units,
+                    after=target_datetime - timedelta(days=40),
+                ):
+                    actual.append(occurrence)
+                    if len(actual) == 20:
+                        break
+
+                if rule and rule.unit.unit.name in ("MONTH", "YEAR"):
+                    # Дни месяца не накапливают сдвиг, поэтому сравнение
+                    # только по количеству и порядку
+                    self.assertEqual(len(expected), len(actual))
+                    self.assertEqual(sorted(actual), actual)
+                else:
+                    self.assertEqual(expected, actual)
+
+    def test_iter_occurrences_after(self):
+        target_datetime = datetime(year=2025, month=8, day=1, hour=10)
+
+        # Пропущенные повторы не перебираются
+        rule = parse_repeat_every("1 DAY")
+        with patch.object(
+            RepeatEvery,
+            "get_next_datetime",
+            autospec=True,
+            side_effect=RepeatEvery.get_next_datetime,
+        ) as mock:
+            occurrence: Occurrence = next(
+                iter_occurrences(
+                    target_datetime=target_datetime,
+                    repeat_every=rule,
+                    repeat_before=tuple(),
+                    after=target_datetime + timedelta(days=10_000, hours=1),
+                )
+            )
+        self.assertEqual(1, mock.call_count)
+        self.assertEqual(
+            target_datetime + timedelta(days=10_001), occurrence.send_datetime
+        )
+
+    def test_cache(self):
+        cache = OccurrencesCache(limit=4)
+        target_datetime = datetime(year=2025, month=8, day=9, hour=10)
+
+        kwargs = dict(
+            reminder_id=1,
+            repeat_every=parse_repeat_every("1 DAY"),
+            repeat_before=parse_repeat_before('["2 DAY"]'),
+        )
+
+        with patch.object(
+            occurrences, "iter_occurrences", wraps=occurrences.iter_occurrences
+        ) as mock:
+            occurrence = Occurrence(target_datetime, target_datetime)
+            items: list[Occurrence] = []
+            for _ in range(8):
+                occurrence = cache.get_next(
+                    target_datetime=occurrence.target_datetime,
+                    next_send_datetime=occurrence.send_datetime,
+                    now=occurrence.send_datetime,
+                    **kwargs,
+                )
+                items.append(occurrence)
+
+            # Расчет выполняется один раз на limit отправок
+            self.assertEqual(2, mock.call_count)
+
+            self.assertEqual(
+                [target_datetime + timedelta(days=i) for i in range(1, 9)],
+                [occurrence.target_datetime for occurrence in items],
+            )
+
+            # Если состояние напоминания отличается от выданного, то расчет заново
+            cache.get_next(
+                target_datetime=target_datetime,
+                next_send_datetime=target_datetime,
+                now=target_datetime,
+                **kwargs,
+            )
+            self.assertEqual(3, mock.call_count)
+
+            # Правила повтора изменились
+            cache.get_next(
+                reminder_id=1,
+                target_datetime=target_datetime + timedelta(days=1),
+                next_send_datetime=target_datetime + timedelta(days=1),
+                repeat_every=parse_repeat_every("1 WEEK"),
+                repeat_before=tuple(),
+                now=target_datetime + timedelta(days=1),
+            )
+            self.assertEqual(4, mock.call_count)
+
+        # Повторов нет
+        self.assertIsNone(
+            cache.get_next(
+                reminder_id=2,
+                target_datetime=target_datetime,
+                next_send_datetime=target_datetime,
+                repeat_every=None,
+                repeat_before=tuple(),
+                now=target_datetime,
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
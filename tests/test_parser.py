@@ -4,6 +4,8 @@
 __author__ = "ipetrash"
 
 
+import re
+import time
 import unittest
 from datetime import datetime, timedelta
 
@@ -21,6 +23,10 @@ from parser import (
     parse_command,
     ParserException,
     get_nearest_datetime,
+    search_target_datetime,
+    PATTERN_TARGET_DATETIME,
+    COMMAND_MAX_LENGTH,
+    PARSE_TIMEOUT,
 )
 
 
@@ -175,6 +181,11 @@ class TestCaseParserCommon(unittest.TestCase):
                 "Напомнить за день",
                 [TimeUnit(number=1, unit=TimeUnitEnum.DAY)],
             ),
+            (
+                # Неизвестные единицы пропускаются
+                "Напомнить за 2 дням, за день",
+                [TimeUnit(number=1, unit=TimeUnitEnum.DAY)],
+            ),
             (
                 "Напомнить за неделю, за 2 дня, за 7 дней, за 3 дня, за 2 дня, за день",
                 [
@@ -1509,6 +1520,76 @@ class TestCaseParseCommand(unittest.TestCase):
         with self.assertRaises(ParserException):
             parse_command("Некорректная команда", self.now, self.defaults)
 
+    def test_search_target_datetime(self):
+        # Поиск с позиций кавычек должен совпадать с поиском с ведущим .*?
+        pattern_legacy = re.compile(
+            ".*?" + PATTERN_TARGET_DATETIME.pattern,
+            flags=PATTERN_TARGET_DATETIME.flags,
+        )
+
+        for command in [
+            "",
+            "Без кавычек 10 февраля",
+            '"Встреча" сегодня в 18:00',
+            'Напомни о "🍕" 10 февраля',
+            '"a" "b" завтра',
+            '"a" и "b" завтра в 12:00',
+            'Один "x"\nДругой "y" 10 февраля',
+            '"x\ny" завтра',
+            'Кавычка " без пары 10 февраля',
+            '"1" "2" "3" "4"',
+            '"Покупки" через 2 дня в 12:00. Повтор каждый день',
+            '"x" 10 февраля 2027 года в 14:55',
+            '"" завтра',
+            '"" "a" завтра',
+            '"a""b" завтра',
+            '" "x" завтра',
+            '"a" "\n" завтра',
+            '"a"\n"b" завтра',
+        ]:
+            with self.subTest(command=command):
+                m = search_target_datetime(command)
+                m_legacy = pattern_legacy.search(command)
+                if m_legacy is None:
+                    self.assertIsNone(m)
+                else:
+                    self.assertEqual(m_legacy.groupdict(), m.groupdict())
+
+    def test_search_target_datetime_timeout(self):
+        with self.assertRaises(ParserException):
+            search_target_datetime('"a" "b" "c" завтра', timeout=-1)
+
+        # Без кавычек шаблон не проверяется и время не ограничивается
+        self.assertIsNone(search_target_datetime("Без кавычек", timeout=-1))
+
+    def test_parse_command_adversarial(self):
+        now = datetime(year=2025, month=8, day=9, hour=22, minute=0)
+        defaults = Defaults(hours=11, minutes=0)
+
+        length: int = COMMAND_MAX_LENGTH
+        for command in [
+            ('"a" ' * length)[:length],
+            ('"1" 1 ' * length)[:length],
+            ('"' + "x" * length)[:length],
+            ('"x" ' + "слово " * length)[:length],
+            ('"x' + " " * length + '"')[:length],
+            ('"x" "' + "1 " * length)[:length],
+            ("Напомни за " * length)[:length],
+            ("Повтор каждый " * length)[:length],
+            # Дата в конце длинного сообщения
+            '"a" ' * (length // 8) + "завтра",
+        ]:
+            with self.subTest(command=command[:20]):
+                t = time.perf_counter()
+                try:
+                    parse_command(command, now, defaults)
+                except ParserException:
+                    pass
+                elapsed: float = time.perf_counter() - t
+
+                # Время растет линейно и далеко от ограничения
+                self.assertLess(elapsed, PARSE_TIMEOUT / 5)
+
 
 class TestCaseTimeUnit(unittest.TestCase):
     @classmethod
@@ -1611,6 +1692,26 @@ class TestCaseTimeUnit(unittest.TestCase):
         self.assertEqual(data_sorted, sorted(data))
         self.assertEqual(data_sorted[::-1], sorted(data, reverse=True))
 
+    def test_immutable(self):
+        unit = TimeUnit(number=1, unit=TimeUnitEnum.DAY)
+        with self.assertRaises(AttributeError):
+            unit.number = 2
+
+        self.assertEqual(1, len({unit, TimeUnit(number=1, unit=TimeUnitEnum.DAY)}))
+
+        # Одинаковая длительность, но разные значения
+        days_7 = TimeUnit(number=7, unit=TimeUnitEnum.DAY)
+        week_1 = TimeUnit(number=1, unit=TimeUnitEnum.WEEK)
+        self.assertNotEqual(days_7, week_1)
+        self.assertFalse(days_7 < week_1 or week_1 < days_7)
+
+    def test_get(self):
+        unit: TimeUnit = TimeUnit.get(1, TimeUnitEnum.DAY)
+        self.assertEqual(TimeUnit(number=1, unit=TimeUnitEnum.DAY), unit)
+        self.assertIs(unit, TimeUnit.get(1, TimeUnitEnum.DAY))
+        self.assertIs(unit, TimeUnit.parse_value("1 DAY"))
+        self.assertIs(unit, TimeUnit.parse_text("день"))
+
 
 class TestCaseTimeUnitWeekDayUnit(unittest.TestCase):
     @classmethod
@@ -2021,6 +2122,61 @@ class TestCaseParserRepeatEvery(unittest.TestCase):
             with self.subTest(value=value, repeat_every=repeat_every):
                 self.assertEqual(value, repeat_every.get_next_datetime(dt))
 
+    def test_get_next_datetime_count(self):
+        dt = datetime(year=2024, month=1, day=31, hour=10, minute=0, second=0)
+
+        for _, repeat_every in self.get_test_data():
+            next_dt: datetime = dt
+            for count in range(1, 6):
+                next_dt = repeat_every.get_next_datetime(next_dt)
+                unit = repeat_every.unit
+                if isinstance(unit, TimeUnit) and unit.unit in (
+                    TimeUnitEnum.MONTH,
+                    TimeUnitEnum.YEAR,
+                ):
+                    # День месяца не накапливает сдвиг из-за коротких месяцев
+                    continue
+
+                with self.subTest(repeat_every=repeat_every, count=count):
+                    self.assertEqual(
+                        next_dt, repeat_every.get_next_datetime(dt, count)
+                    )
+
+        repeat_every = RepeatEvery(unit=TimeUnit(number=1, unit=TimeUnitEnum.MONTH))
+        for count, value in [
+            (1, datetime(year=2024, month=2, day=29, hour=10)),
+            (2, datetime(year=2024, month=3, day=31, hour=10)),
+            (3, datetime(year=2024, month=4, day=30, hour=10)),
+            (13, datetime(year=2025, month=2, day=28, hour=10)),
+        ]:
+            with self.subTest(count=count):
+                self.assertEqual(value, repeat_every.get_next_datetime(dt, count))
+
+    def test_get_next_datetime_after(self):
+        dt = datetime(year=2024, month=1, day=31, hour=10, minute=0, second=0)
+
+        for _, repeat_every in self.get_test_data():
+            for after in [
+                dt - timedelta(days=10),
+                dt,
+                dt + timedelta(hours=1),
+                dt + timedelta(days=1),
+                dt + timedelta(days=45),
+                dt + timedelta(days=400),
+                dt + timedelta(days=3000, minutes=1),
+            ]:
+                with self.subTest(repeat_every=repeat_every, after=after):
+                    # Перебор для сравнения
+                    count: int = 1
+                    while repeat_every.get_next_datetime(dt, count) <= after:
+                        count += 1
+
+                    self.assertEqual(count, repeat_every.get_count_to_pass(dt, after))
+                    self.assertEqual(
+                        repeat_every.get_next_datetime(dt, count),
+                        repeat_every.get_next_datetime_after(dt, after),
+                    )
+
 
 if __name__ == "__main__":
     unittest.main()
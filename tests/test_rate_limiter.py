@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import threading
+import time
+import unittest
+
+from telegram.error import RetryAfter
+
+from rate_limiter import (
+    TokenBucket,
+    RateLimiter,
+    RateLimitedBot,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BULK,
+)
+
+
+class FakeRequest:
+    con_pool_size: int = 8
+
+    def __init__(self, errors: list[Exception] | None = None):
+        self.errors: list[Exception] = errors or []
+        self.calls: list[tuple[str, dict]] = []
+
+    def post(self, url: str, data: dict, timeout: float | None = None) -> dict:
+        self.calls.append((url.rsplit("/", 1)[-1], data))
+        if self.errors:
+            raise self.errors.pop(0)
+        return True
+
+
+class TestCaseTokenBucket(unittest.TestCase):
+    def test_acquire(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+
+        t = time.perf_counter()
+        for _ in range(6):
+            bucket.acquire()
+        elapsed: float = time.perf_counter() - t
+
+        # Первый токен есть сразу, остальные 5 появляются каждые 10мс
+        self.assertGreaterEqual(elapsed, 0.045)
+
+    def test_acquire_priority(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        bucket.acquire()
+
+        items: list[int] = []
+
+        def acquire(priority: int):
+            bucket.acquire(priority)
+            items.append(priority)
+
+        threads: list[threading.Thread] = []
+        for priority in [PRIORITY_BULK, PRIORITY_BULK, PRIORITY_INTERACTIVE]:
+            thread = threading.Thread(target=acquire, args=(priority,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.005)
+
+        for thread in threads:
+            thread.join()
+
+        # Ответ пользователю пришел последним, но получил токен первым
+        self.assertEqual([PRIORITY_INTERACTIVE, PRIORITY_BULK, PRIORITY_BULK], items)
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=100, capacity=10)
+        bucket.pause(0.05)
+        self.assertFalse(bucket.is_full())
+
+        t = time.perf_counter()
+        bucket.acquire()
+        self.assertGreaterEqual(time.perf_counter() - t, 0.04)
+
+    def test_is_full(self):
+        bucket = TokenBucket(rate=1, capacity=1)
+        self.assertTrue(bucket.is_full())
+
+        bucket.acquire()
+        self.assertFalse(bucket.is_full())
+
+
+class TestCaseRateLimiter(unittest.TestCase):
+    def test_get_chat_bucket(self):
+        rate_limiter = RateLimiter(private_chat_rate=1, group_chat_rate=20 / 60)
+
+        bucket: TokenBucket = rate_limiter.get_chat_bucket(123)
+        self.assertIs(bucket, rate_limiter.get_chat_bucket(123))
+        self.assertEqual(1, bucket.rate)
+
+        self.assertEqual(20 / 60, rate_limiter.get_chat_bucket(-123).rate)
+        self.assertEqual(20 / 60, rate_limiter.get_chat_bucket("@channel").rate)
+
+    def test_remove_full_chat_buckets(self):
+        rate_limiter = RateLimiter()
+        rate_limiter.MAX_CHAT_BUCKETS = 2
+
+        rate_limiter.acquire(1)
+        rate_limiter.get_chat_bucket(2)
+        rate_limiter.get_chat_bucket(3)
+
+        # Корзина второго чата была полной и удалена
+        self.assertEqual([1, 3], sorted(rate_limiter._chat_buckets))
+
+
+class TestCaseRateLimitedBot(unittest.TestCase):
+    def get_bot(self, request: FakeRequest, rate: float = 1000) -> RateLimitedBot:
+        return RateLimitedBot(
+            "123:TEST",
+            request=request,
+            rate_limiter=RateLimiter(
+                global_rate=rate, private_chat_rate=rate, group_chat_rate=rate
+            ),
+        )
+
+    def test_limited_endpoint(self):
+        request = FakeRequest()
+        bot = self.get_bot(request)
+
+        bot._post("sendMessage", {"chat_id": 1, "text": "1"})
+        bot._post("getMe")
+
+        self.assertEqual(["sendMessage", "getMe"], [name for name, _ in request.calls])
+        self.assertIn(1, bot.rate_limiter._chat_buckets)
+        self.assertTrue(RateLimitedBot.is_limited_endpoint("editMessageText"))
+        self.assertFalse(RateLimitedBot.is_limited_endpoint("answerCallbackQuery"))
+
+    def test_retry_after(self):
+        request = FakeRequest(errors=[RetryAfter(0.05)])
+        bot = self.get_bot(request)
+
+        t = time.perf_counter()
+        bot._post("sendMessage", {"chat_id": 1, "text": "1"})
+        self.assertGreaterEqual(time.perf_counter() - t, 0.04)
+        self.assertEqual(2, len(request.calls))
+
+    def test_retry_after_max_retries(self):
+        request = FakeRequest(errors=[RetryAfter(0.01) for _ in range(3)])
+        bot = self.get_bot(request)
+        bot.max_retries = 2
+
+        with self.assertRaises(RetryAfter):
+            bot._post("sendMessage", {"chat_id": 1, "text": "1"})
+        self.assertEqual(3, len(request.calls))
+
+
+if __name__ == "__main__":
+    unittest.main()
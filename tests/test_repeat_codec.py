@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import unittest
+
+from parser import RepeatEvery, TimeUnit, TimeUnitEnum, TimeUnitWeekDayEnum
+from repeat_codec import (
+    RepeatUnitCodeEnum,
+    encode_repeat_every,
+    decode_repeat_every,
+    encode_repeat_before,
+    decode_repeat_before,
+)
+
+
+class TestCaseRepeatCodec(unittest.TestCase):
+    def test_repeat_every(self):
+        self.assertEqual((None, None, None), encode_repeat_every(None))
+        self.assertIsNone(decode_repeat_every(None, None, None))
+
+        for value in [
+            "1 DAY",
+            "10 DAY",
+            "2 WEEK",
+            "1 MONTH",
+            "6 MONTH",
+            "3 YEAR",
+            *(weekday.name for weekday in TimeUnitWeekDayEnum),
+        ]:
+            with self.subTest(value=value):
+                repeat_every = RepeatEvery.parse_value(value)
+                encoded = encode_repeat_every(repeat_every)
+                self.assertTrue(all(isinstance(v, (int, type(None))) for v in encoded))
+
+                decoded = decode_repeat_every(*encoded)
+                self.assertEqual(repeat_every, decoded)
+                self.assertIs(decoded, decode_repeat_every(*encoded))
+
+        self.assertEqual(
+            (RepeatUnitCodeEnum.WEEKDAY, 1, 0b100),
+            encode_repeat_every(RepeatEvery.parse_value("WEDNESDAY")),
+        )
+
+    def test_repeat_before(self):
+        self.assertIsNone(encode_repeat_before([]))
+        self.assertEqual(tuple(), decode_repeat_before(None))
+
+        repeat_before: list[TimeUnit] = [
+            TimeUnit(number=1, unit=TimeUnitEnum.YEAR),
+            TimeUnit(number=6, unit=TimeUnitEnum.MONTH),
+            TimeUnit(number=2, unit=TimeUnitEnum.WEEK),
+            TimeUnit(number=365, unit=TimeUnitEnum.DAY),
+        ]
+        data: bytes = encode_repeat_before(repeat_before)
+        self.assertEqual(4 * len(repeat_before), len(data))
+
+        decoded = decode_repeat_before(data)
+        self.assertEqual(tuple(repeat_before), decoded)
+        self.assertIs(decoded, decode_repeat_before(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import asyncio
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from scheduler import ReminderScheduler
+
+
+class TestCaseReminderScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = ReminderScheduler()
+        self.now_utc = datetime(year=2025, month=8, day=9, hour=10)
+
+    def test_schedule(self):
+        self.assertIsNone(self.scheduler.get_nearest_datetime())
+
+        self.scheduler.schedule(1, self.now_utc + timedelta(minutes=10))
+        self.scheduler.schedule(2, self.now_utc + timedelta(minutes=5))
+        self.assertEqual(
+            self.now_utc + timedelta(minutes=5),
+            self.scheduler.get_nearest_datetime(),
+        )
+
+        # Перенос напоминания
+        self.scheduler.schedule(2, self.now_utc + timedelta(minutes=20))
+        self.assertEqual(
+            self.now_utc + timedelta(minutes=10),
+            self.scheduler.get_nearest_datetime(),
+        )
+
+    def test_unschedule(self):
+        self.scheduler.schedule(1, self.now_utc + timedelta(minutes=10))
+        self.scheduler.schedule(2, self.now_utc + timedelta(minutes=5))
+
+        self.scheduler.unschedule(2)
+        self.assertEqual(
+            self.now_utc + timedelta(minutes=10),
+            self.scheduler.get_nearest_datetime(),
+        )
+
+        self.scheduler.unschedule(1)
+        self.assertIsNone(self.scheduler.get_nearest_datetime())
+
+        # Удаление несуществующего
+        self.scheduler.unschedule(999)
+
+    def test_pop_due(self):
+        self.scheduler.schedule(1, self.now_utc - timedelta(minutes=1))
+        self.scheduler.schedule(2, self.now_utc)
+        self.scheduler.schedule(3, self.now_utc + timedelta(minutes=1))
+        self.scheduler.schedule(4, self.now_utc - timedelta(minutes=2))
+        self.scheduler.unschedule(4)
+
+        self.assertEqual([1, 2], self.scheduler.pop_due(self.now_utc))
+        self.assertEqual([], self.scheduler.pop_due(self.now_utc))
+        self.assertEqual(
+            [3], self.scheduler.pop_due(self.now_utc + timedelta(minutes=1))
+        )
+        self.assertIsNone(self.scheduler.get_nearest_datetime())
+
+    def test_schedule_missing(self):
+        self.scheduler.schedule(1, self.now_utc + timedelta(minutes=10))
+
+        # Запланированные раньше не переносятся
+        self.scheduler.schedule_missing([1, 2], self.now_utc + timedelta(minutes=1))
+        self.assertEqual(
+            [2], self.scheduler.pop_due(self.now_utc + timedelta(minutes=1))
+        )
+        self.assertEqual(
+            self.now_utc + timedelta(minutes=10),
+            self.scheduler.get_nearest_datetime(),
+        )
+
+
+class TestCaseReminderSchedulerWaitDue(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.scheduler = ReminderScheduler()
+
+        # Без перезагрузки из базы
+        self.scheduler._last_reload_datetime_utc = datetime.utcnow()
+
+    async def test_wait_due(self):
+        self.scheduler.schedule(1, datetime.utcnow() + timedelta(seconds=0.1))
+
+        t = time.perf_counter()
+        self.assertEqual([1], await self.scheduler.wait_due())
+        self.assertGreaterEqual(time.perf_counter() - t, 0.09)
+
+    async def test_wait_due_schedule_from_thread(self):
+        self.scheduler.schedule(1, datetime.utcnow() + timedelta(hours=1))
+
+        # Напоминание, добавленное из другого потока, будит ожидание
+        timer = threading.Timer(
+            0.05, lambda: self.scheduler.schedule(2, datetime.utcnow())
+        )
+        timer.start()
+
+        reminder_ids: list[int] = await asyncio.wait_for(
+            self.scheduler.wait_due(), timeout=1
+        )
+        self.assertEqual([2], reminder_ids)
+        self.assertFalse(self.scheduler._listeners)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import multiprocessing
+import tempfile
+import time
+import unittest
+
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from peewee import SqliteDatabase, chunked
+
+from db import (
+    BaseModel,
+    Chat,
+    Reminder,
+    SchedulerWorker,
+    User,
+    DB_PRAGMAS,
+    SHARD_COUNT,
+    db,
+    get_shard,
+)
+from sharding import ShardLeaseManager
+
+
+def add_reminders(number: int, chat_count: int, next_send_datetime_utc: datetime):
+    User.insert(id=1, first_name="user").execute()
+    for chat_id in range(-chat_count // 2, chat_count - chat_count // 2):
+        Chat.insert(id=chat_id, type="private").execute()
+
+    rows: list[dict] = [
+        dict(
+            original_message_text=f'"{i}" завтра',
+            original_message_id=i,
+            target=str(i),
+            target_datetime_utc=next_send_datetime_utc,
+            next_send_datetime_utc=next_send_datetime_utc,
+            user=1,
+            chat=i % chat_count - chat_count // 2,
+        )
+        for i in range(number)
+    ]
+    for batch in chunked(rows, 50):
+        Reminder.insert_many(batch).execute()
+
+
+def get_file_db(path: str) -> SqliteDatabase:
+    return SqliteDatabase(path, pragmas=DB_PRAGMAS, timeout=30)
+
+
+def run_worker(
+    path: str,
+    send_timeout: float,
+    barrier: multiprocessing.Barrier,
+    results: multiprocessing.Queue,
+):
+    # Процесс бота: отправляет напоминания своих шардов, пока они есть
+    models: list[type[BaseModel]] = BaseModel.get_inherited_models()
+    database = get_file_db(path)
+    database.bind(models, bind_refs=False, bind_backrefs=False)
+
+    manager = ShardLeaseManager(heartbeat_interval=timedelta(seconds=0.05))
+    sent: list[int] = []
+
+    # Процессы начинают, когда все отметились, чтобы шарды сразу поделились
+    manager.heartbeat()
+    barrier.wait()
+
+    last_heartbeat: float = 0
+    while Reminder.select().exists():
+        if time.monotonic() - last_heartbeat >= 0.05:
+            manager.heartbeat()
+            last_heartbeat = time.monotonic()
+
+        shards: frozenset[int] = manager.get_shards()
+        if not shards:
+            time.sleep(0.01)
+            continue
+
+        reminders: list[Reminder] = Reminder.claim_due(
+            datetime.utcnow(), shards=shards
+        )
+        for reminder in reminders:
+            time.sleep(send_timeout)  # Отправка сообщения
+            sent.append(reminder.id)
+        Reminder.delete_by_ids([reminder.id for reminder in reminders])
+
+    manager.release_all()
+    database.close()
+    results.put(sent)
+
+
+def run_workers(
+    workers: int,
+    number: int,
+    send_timeout: float,
+) -> tuple[list[list[int]], float]:
+    """
+    Запускает процессы, отправляющие number напоминаний из общей базы.
+    Возвращает отправленные каждым процессом напоминания и затраченное время
+    """
+
+    with tempfile.TemporaryDirectory() as dir_name:
+        path = str(Path(dir_name) / "database.sqlite")
+
+        models: list[type[BaseModel]] = BaseModel.get_inherited_models()
+        database = get_file_db(path)
+        with database.bind_ctx(models):
+            database.create_tables(models)
+            add_reminders(
+                number, chat_count=100, next_send_datetime_utc=datetime.utcnow()
+            )
+            ShardLeaseManager().init_shards()
+        database.close()
+
+        barrier = multiprocessing.Barrier(workers)
+        results = multiprocessing.Queue()
+        processes: list[multiprocessing.Process] = [
+            multiprocessing.Process(
+                target=run_worker,
+                args=(path, send_timeout, barrier, results),
+            )
+            for _ in range(workers)
+        ]
+
+        t = time.perf_counter()
+        for process in processes:
+            process.start()
+
+        sent_by_worker: list[list[int]] = [results.get(timeout=60) for _ in processes]
+        elapsed: float = time.perf_counter() - t
+
+        for process in processes:
+            process.join()
+
+    return sent_by_worker, elapsed
+
+
+class TestCaseShardLeaseManager(unittest.TestCase):
+    def setUp(self):
+        self.models = BaseModel.get_inherited_models()
+        self.test_db = SqliteDatabase(":memory:")
+        self.test_db.bind(self.models, bind_refs=False, bind_backrefs=False)
+        self.test_db.connect()
+        self.test_db.create_tables(self.models)
+
+        self.now_utc = datetime(year=2025, month=8, day=9, hour=10)
+
+    def tearDown(self):
+        db.bind(self.models, bind_refs=False, bind_backrefs=False)
+
+    def get_manager(self, owner: str) -> ShardLeaseManager:
+        manager = ShardLeaseManager(owner=owner)
+        manager.init_shards()
+        return manager
+
+    def test_get_shard(self):
+        # Чаты групп с отрицательными id попадают в те же шарды, что и в SQL
+        add_reminders(50, chat_count=40, next_send_datetime_utc=self.now_utc)
+        query = Reminder.select(Reminder.chat_id, Reminder.get_shard_expr()).tuples()
+        for chat_id, shard in query:
+            with self.subTest(chat_id=chat_id):
+                self.assertEqual(get_shard(chat_id), shard)
+                self.assertTrue(0 <= shard < SHARD_COUNT)
+
+    def test_rebalance(self):
+        a = self.get_manager("a")
+        b = self.get_manager("b")
+
+        self.assertEqual(set(range(SHARD_COUNT)), a.heartbeat(self.now_utc))
+
+        # Новый процесс получает шарды, когда старый отпустит лишние
+        self.assertEqual(set(), b.heartbeat(self.now_utc))
+        self.assertEqual(SHARD_COUNT // 2, len(a.heartbeat(self.now_utc)))
+        self.assertEqual(SHARD_COUNT // 2, len(b.heartbeat(self.now_utc)))
+        self.assertFalse(a.get_shards() & b.get_shards())
+
+        # Шарды упавшего процесса забирает оставшийся
+        now_utc: datetime = self.now_utc + a.lease_timeout + timedelta(seconds=1)
+        self.assertEqual(set(range(SHARD_COUNT)), b.heartbeat(now_utc))
+
+    def test_release_when_inactive(self):
+        is_active: bool = True
+        a = ShardLeaseManager(owner="a", is_active=lambda: is_active)
+        a.init_shards()
+        b = self.get_manager("b")
+
+        a.heartbeat(self.now_utc)
+        b.heartbeat(self.now_utc)
+        a.heartbeat(self.now_utc)
+        b.heartbeat(self.now_utc)
+
+        # Перезапускающийся процесс отпускает свои шарды сразу
+        is_active = False
+        self.assertEqual(set(), a.heartbeat(self.now_utc))
+        self.assertEqual(set(range(SHARD_COUNT)), b.heartbeat(self.now_utc))
+        self.assertIsNone(SchedulerWorker.get_or_none(id="a"))
+
+    def test_claim_due_shards(self):
+        add_reminders(100, chat_count=40, next_send_datetime_utc=self.now_utc)
+
+        shards: set[int] = {0, 3, 15}
+        reminders: list[Reminder] = Reminder.claim_due(self.now_utc, shards=shards)
+        self.assertTrue(reminders)
+        self.assertTrue(all(get_shard(r.chat_id) in shards for r in reminders))
+
+        # Напоминания остальных шардов не захвачены
+        self.assertEqual(
+            100 - len(reminders),
+            len(Reminder.claim_due(self.now_utc)),
+        )
+
+
+class TestCaseShardingProcesses(unittest.TestCase):
+    def test_no_duplicates(self):
+        sent_by_worker, _ = run_workers(workers=3, number=300, send_timeout=0.001)
+
+        sent: Counter = Counter(
+            reminder_id for items in sent_by_worker for reminder_id in items
+        )
+        self.assertEqual(300, len(sent))
+        self.assertEqual({1}, set(sent.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
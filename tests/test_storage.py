@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import tempfile
+import threading
+import unittest
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from peewee import SqliteDatabase
+
+from db import BaseModel, Chat, Reminder, User, CLAIM_LEASE_TIMEOUT, db, get_shard
+from occurrences import occurrences_cache
+from storage import (
+    MemoryStorage,
+    SqliteConcurrentStorage,
+    SqliteStorage,
+    Storage,
+    StorageBackendEnum,
+    get_storage,
+)
+
+
+# Чатов больше, чем шардов, чтобы в каждом шарде были напоминания
+SHARD_CHATS: int = 40
+
+
+class StorageTestMixin:
+    """
+    Общие проверки для всех хранилищ
+    """
+
+    def create_storage(self) -> Storage:
+        raise NotImplementedError()
+
+    def create_user_chat(self, user_id: int, chat_id: int) -> tuple[User, Chat]:
+        return (
+            User.create(id=user_id, first_name=f"user{user_id}"),
+            Chat.get_or_create(id=chat_id, type="private")[0],
+        )
+
+    def setUp(self):
+        self.models = BaseModel.get_inherited_models()
+
+        User.clear_cache()
+        Chat.clear_cache()
+        Reminder.clear_count_cache()
+        occurrences_cache.clear()
+
+        self.storage: Storage = self.create_storage()
+        self.now_utc = datetime(year=2025, month=8, day=9, hour=10)
+        self.user, self.chat = self.create_user_chat(user_id=1, chat_id=1)
+
+    def tearDown(self):
+        if isinstance(self.storage, SqliteStorage):
+            self.storage.close()
+
+    def add_reminder(
+        self,
+        next_send_datetime_utc: datetime,
+        user: User | None = None,
+        chat: Chat | None = None,
+    ) -> Reminder:
+        return self.storage.add_reminder(
+            original_message_id=1,
+            original_message_text='"1" завтра',
+            target="1",
+            target_datetime_utc=next_send_datetime_utc,
+            next_send_datetime_utc=next_send_datetime_utc,
+            repeat_every=None,
+            repeat_before=[],
+            user=user or self.user,
+            chat=chat or self.chat,
+        )
+
+    def test_add_reminder(self):
+        reminder: Reminder = self.add_reminder(self.now_utc)
+        self.assertIsNotNone(reminder.id)
+
+        reminder = self.storage.get_reminder(reminder.id)
+        self.assertEqual(self.now_utc, reminder.next_send_datetime_utc)
+        self.assertEqual(self.chat.id, reminder.chat.id)
+        self.assertIsNone(self.storage.get_reminder(999))
+
+    def test_claim_due(self):
+        due: list[int] = [
+            self.add_reminder(self.now_utc - timedelta(minutes=i)).id for i in range(3)
+        ]
+        self.add_reminder(self.now_utc + timedelta(minutes=1))
+
+        reminders: list[Reminder] = self.storage.claim_due(self.now_utc)
+        self.assertEqual(sorted(due), sorted(reminder.id for reminder in reminders))
+        self.assertTrue(all(reminder.chat.id == self.chat.id for reminder in reminders))
+
+        # Захваченные не возвращаются, пока захват не истек
+        self.assertEqual([], self.storage.claim_due(self.now_utc))
+
+        # После истечения захвата напоминания снова доступны
+        now_utc: datetime = self.now_utc + CLAIM_LEASE_TIMEOUT + timedelta(minutes=1)
+        self.assertEqual(4, len(self.storage.claim_due(now_utc)))
+
+    def test_claim_due_shards(self):
+        for chat_id in range(SHARD_CHATS):
+            _, chat = self.create_user_chat(user_id=100 + chat_id, chat_id=-chat_id)
+            self.add_reminder(self.now_utc, chat=chat)
+
+        shards: set[int] = {0, 5}
+        reminders: list[Reminder] = self.storage.claim_due(self.now_utc, shards=shards)
+        self.assertTrue(reminders)
+        self.assertTrue(all(get_shard(r.chat.id) in shards for r in reminders))
+
+        # Напоминания других шардов остаются незахваченными
+        self.assertEqual(
+            SHARD_CHATS - len(reminders),
+            len(self.storage.claim_due(self.now_utc)),
+        )
+
+    def test_save_claimed(self):
+        self.add_reminder(self.now_utc)
+
+        (reminder,) = self.storage.claim_due(self.now_utc)
+        reminder.next_send_datetime_utc = self.now_utc + timedelta(days=1)
+        self.assertEqual(1, self.storage.save_claimed([reminder]))
+        self.assertEqual(0, self.storage.save_claimed([]))
+
+        self.assertEqual([], self.storage.claim_due(self.now_utc))
+        self.assertEqual(
+            {reminder.id: self.now_utc + timedelta(days=1)},
+            self.storage.get_schedule(),
+        )
+        self.assertEqual(
+            [reminder.id],
+            [r.id for r in self.storage.claim_due(self.now_utc + timedelta(days=1))],
+        )
+
+    def test_release_claimed(self):
+        reminder_id: int = self.add_reminder(self.now_utc).id
+
+        self.storage.claim_due(self.now_utc)
+        self.assertEqual(1, self.storage.release_claimed([reminder_id]))
+        self.assertEqual(
+            [reminder_id], [r.id for r in self.storage.claim_due(self.now_utc)]
+        )
+
+    def test_delete_reminders(self):
+        reminders: list[Reminder] = [self.add_reminder(self.now_utc) for _ in range(3)]
+        self.assertEqual(3, self.storage.get_count(self.chat.id, self.user.id))
+
+        self.assertEqual(
+            2, self.storage.delete_reminders([reminders[0].id, reminders[1].id])
+        )
+        self.assertEqual(0, self.storage.delete_reminders([reminders[0].id]))
+        self.assertEqual(0, self.storage.delete_reminders([]))
+
+        self.assertIsNone(self.storage.get_reminder(reminders[0].id))
+        self.assertEqual(1, self.storage.get_count(self.chat.id, self.user.id))
+        self.assertEqual([reminders[2].id], list(self.storage.get_schedule()))
+
+    def test_get_page(self):
+        other_user, _ = self.create_user_chat(user_id=2, chat_id=1)
+        self.add_reminder(self.now_utc, user=other_user)
+
+        ids: list[int] = [
+            self.add_reminder(self.now_utc + timedelta(minutes=i % 3)).id
+            for i in range(7)
+        ]
+        expected: list[int] = sorted(ids, key=lambda i: ((i - ids[0]) % 3, i))
+
+        total: int = self.storage.get_count(self.chat.id, self.user.id)
+        self.assertEqual(7, total)
+        self.assertEqual(1, self.storage.get_count(self.chat.id, other_user.id))
+        self.assertEqual(0, self.storage.get_count(999, self.user.id))
+
+        anchor_id: int | None = None
+        for page in range(1, 6):
+            with self.subTest(page=page):
+                reminders: list[Reminder] = self.storage.get_page(
+                    chat_id=self.chat.id,
+                    user_id=self.user.id,
+                    page=page,
+                    items_per_page=2,
+                    total=total,
+                    anchor_page=page - 1 if anchor_id else None,
+                    anchor_id=anchor_id,
+                )
+                self.assertEqual(
+                    expected[(page - 1) * 2 : page * 2],
+                    [reminder.id for reminder in reminders],
+                )
+                anchor_id = reminders[0].id if reminders else None
+
+    def test_get_page_anchor(self):
+        ids: list[int] = [
+            self.add_reminder(self.now_utc + timedelta(minutes=i)).id for i in range(6)
+        ]
+
+        # Напоминание, добавленное в начало списка, не сдвигает страницы
+        # относительно anchor_id
+        self.add_reminder(self.now_utc - timedelta(minutes=1))
+        for page, anchor_page, anchor_id, expected in [
+            (3, 2, ids[2], ids[4:6]),
+            (2, 3, ids[4], ids[2:4]),
+        ]:
+            with self.subTest(page=page, anchor_page=anchor_page):
+                reminders: list[Reminder] = self.storage.get_page(
+                    chat_id=self.chat.id,
+                    user_id=self.user.id,
+                    page=page,
+                    items_per_page=2,
+                    anchor_page=anchor_page,
+                    anchor_id=anchor_id,
+                )
+                self.assertEqual(expected, [reminder.id for reminder in reminders])
+
+        # Без anchor_id отсчет идет от начала списка
+        self.storage.delete_reminders([ids[2]])
+        reminders: list[Reminder] = self.storage.get_page(
+            chat_id=self.chat.id,
+            user_id=self.user.id,
+            page=2,
+            items_per_page=2,
+            anchor_page=1,
+            anchor_id=ids[2],
+        )
+        self.assertEqual([ids[1], ids[3]], [reminder.id for reminder in reminders])
+
+    def test_update_last_activity(self):
+        dt = self.now_utc + timedelta(hours=1)
+        self.add_reminder(self.now_utc)
+
+        self.assertEqual(1, self.storage.update_last_activity(User, {self.user.id: dt}))
+        self.assertEqual(
+            1, self.storage.update_last_activity(Chat, {self.chat.id: dt, 999: dt})
+        )
+        self.assertEqual(0, self.storage.update_last_activity(Chat, {}))
+
+
+class TestCaseSqliteStorage(StorageTestMixin, unittest.TestCase):
+    def create_storage(self) -> Storage:
+        test_db = SqliteDatabase(":memory:")
+        storage = SqliteStorage(test_db)
+        test_db.create_tables(SqliteStorage.MODELS)
+        return storage
+
+    def test_bind(self):
+        # Модели, с которыми хранилище не работает, остаются в базе из db.py
+        for model in self.models:
+            with self.subTest(model=model):
+                self.assertIs(
+                    self.storage.database if model in SqliteStorage.MODELS else db,
+                    model._meta.database,
+                )
+
+        # Второе хранилище с другой базой не забирает модели первого
+        with self.assertRaises(Exception):
+            SqliteStorage(SqliteDatabase(":memory:"))
+        self.assertIs(self.storage.database, Reminder._meta.database)
+
+        self.storage.close()
+        self.assertTrue(all(model._meta.database is db for model in self.models))
+
+
+class TestCaseSqliteConcurrentStorage(StorageTestMixin, unittest.TestCase):
+    def create_storage(self) -> Storage:
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        storage = SqliteConcurrentStorage(str(Path(self.dir.name) / "database.sqlite"))
+        self.addCleanup(storage.database.close)
+        storage.database.create_tables(SqliteStorage.MODELS)
+        return storage
+
+    def test_concurrent_writes(self):
+        errors: list[Exception] = []
+        claimed: list[int] = []
+
+        def _run():
+            try:
+                for _ in range(20):
+                    self.add_reminder(self.now_utc)
+                    reminders: list[Reminder] = self.storage.claim_due(self.now_utc)
+                    claimed.extend(reminder.id for reminder in reminders)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                self.storage.database.close()
+
+        threads: list[threading.Thread] = [
+            threading.Thread(target=_run) for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Каждое напоминание захвачено ровно один раз, без "database is locked"
+        self.assertEqual([], errors)
+        self.assertEqual(8 * 20, len(claimed))
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(set(claimed), set(self.storage.get_schedule()))
+
+
+class TestCaseMemoryStorage(StorageTestMixin, unittest.TestCase):
+    def create_storage(self) -> Storage:
+        return MemoryStorage()
+
+    def create_user_chat(self, user_id: int, chat_id: int) -> tuple[User, Chat]:
+        return (
+            User(id=user_id, first_name=f"user{user_id}"),
+            Chat(id=chat_id, type="private"),
+        )
+
+    def test_update_last_activity(self):
+        super().test_update_last_activity()
+        self.assertEqual(self.now_utc + timedelta(hours=1), self.user.last_activity)
+
+
+class TestCaseGetStorage(unittest.TestCase):
+    def test_get_storage(self):
+        self.assertIsInstance(get_storage("MEMORY"), MemoryStorage)
+        self.assertIsInstance(get_storage(StorageBackendEnum.SQLITE), SqliteStorage)
+
+        with self.assertRaises(ValueError):
+            get_storage("UNKNOWN")
+
+
+if __name__ == "__main__":
+    unittest.main()
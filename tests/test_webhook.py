@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import asyncio
+import json
+import unittest
+import urllib.request
+
+from queue import Queue
+from urllib.error import HTTPError
+
+from telegram import Bot, Update, User
+
+from common import log
+from lifecycle import Lifecycle
+from webhook import HEALTH_PATH, SECRET_TOKEN_HEADER, WebhookServer
+
+
+SECRET_TOKEN: str = "secret"
+
+# Обновление в том виде, в котором его присылает Telegram
+UPDATE: dict = {
+    "update_id": 100,
+    "message": {
+        "message_id": 1,
+        "date": 1754733600,
+        "chat": {"id": 1, "type": "private", "first_name": "user"},
+        "from": {"id": 1, "is_bot": False, "first_name": "user"},
+        "text": 'Напомни о "Покупки" завтра в 12:00',
+    },
+}
+
+
+class TestCaseWebhookServer(unittest.TestCase):
+    def setUp(self):
+        self.update_queue = Queue()
+        self.lifecycle = Lifecycle(loop=asyncio.new_event_loop())
+        # Без запроса getMe к Telegram
+        bot = Bot("123456:TEST")
+        bot._bot = User(id=123456, first_name="bot", is_bot=True, username="bot")
+
+        self.server = WebhookServer(
+            bot=bot,
+            update_queue=self.update_queue,
+            secret_token=SECRET_TOKEN,
+            port=0,
+            url_path="/webhook",
+            update_queue_max_size=2,
+            lifecycle=self.lifecycle,
+        )
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.lifecycle.loop.close()
+
+    def post(
+        self,
+        data: bytes,
+        secret_token: str = SECRET_TOKEN,
+        path: str = "/webhook",
+    ) -> int:
+        request = urllib.request.Request(
+            url=f"http://127.0.0.1:{self.server.port}{path}",
+            data=data,
+            headers={
+                "Content-Type": "application/json",
+                SECRET_TOKEN_HEADER: secret_token,
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=5) as rs:
+                return rs.status
+        except HTTPError as e:
+            return e.code
+
+    def test_update(self):
+        self.assertEqual(200, self.post(json.dumps(UPDATE).encode("utf-8")))
+
+        update: Update = self.update_queue.get_nowait()
+        self.assertEqual(UPDATE["update_id"], update.update_id)
+        self.assertEqual(UPDATE["message"]["text"], update.effective_message.text)
+        self.assertEqual(1, update.effective_chat.id)
+
+    def test_secret_token(self):
+        data: bytes = json.dumps(UPDATE).encode("utf-8")
+        self.assertEqual(403, self.post(data, secret_token="invalid"))
+        self.assertEqual(403, self.post(data, secret_token=""))
+        self.assertTrue(self.update_queue.empty())
+
+    def test_path(self):
+        data: bytes = json.dumps(UPDATE).encode("utf-8")
+        self.assertEqual(404, self.post(data, path="/"))
+        self.assertTrue(self.update_queue.empty())
+
+    def test_invalid_update(self):
+        with self.assertLogs(log, level="ERROR"):
+            self.assertEqual(400, self.post(b"{"))
+        self.assertEqual(400, self.post(b""))
+        self.assertTrue(self.update_queue.empty())
+
+    def test_queue_full(self):
+        data: bytes = json.dumps(UPDATE).encode("utf-8")
+        self.assertEqual(200, self.post(data))
+        self.assertEqual(200, self.post(data))
+
+        # Telegram повторит отправку, когда очередь освободится
+        with self.assertLogs(log, level="WARNING"):
+            self.assertEqual(503, self.post(data))
+        self.assertEqual(2, self.update_queue.qsize())
+
+        self.update_queue.get_nowait()
+        self.assertEqual(200, self.post(data))
+
+    def test_health(self):
+        url: str = f"http://127.0.0.1:{self.server.port}{HEALTH_PATH}"
+
+        with self.assertRaises(HTTPError) as cm:
+            urllib.request.urlopen(url, timeout=5)
+        self.assertEqual(503, cm.exception.code)
+        self.assertEqual("STARTING", json.load(cm.exception)["state"])
+
+        self.lifecycle.start(self.server.bot)
+        with urllib.request.urlopen(url, timeout=5) as rs:
+            self.assertEqual(200, rs.status)
+            self.assertEqual("READY", json.load(rs)["state"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import hmac
+import json
+import threading
+
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue
+
+from telegram import Bot, Update
+
+from common import log
+from lifecycle import Lifecycle
+
+
+# SOURCE: https://core.telegram.org/bots/api#setwebhook
+SECRET_TOKEN_HEADER: str = "X-Telegram-Bot-Api-Secret-Token"
+
+# Состояние бота для проверок работоспособности, например балансировщиком
+HEALTH_PATH: str = "/health"
+
+# Обновления больше этого размера не принимаются
+MAX_BODY_SIZE: int = 1024 * 1024
+
+# Сколько обновлений может ждать обработки. Если больше, то Telegram получит
+# ошибку и повторит отправку позже, а не будет копиться очередь в памяти
+UPDATE_QUEUE_MAX_SIZE: int = 1024
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    server: "WebhookServer"
+
+    def _reply(self, status: HTTPStatus, data: dict | None = None):
+        body: bytes = json.dumps(data).encode("utf-8") if data is not None else b""
+
+        self.send_response(status)
+        if data is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        lifecycle: Lifecycle | None = self.server.lifecycle
+        if self.path != HEALTH_PATH or not lifecycle:
+            self._reply(HTTPStatus.NOT_FOUND)
+            return
+
+        self._reply(
+            HTTPStatus.OK if lifecycle.is_ready() else HTTPStatus.SERVICE_UNAVAILABLE,
+            lifecycle.get_health(),
+        )
+
+    def do_POST(self):
+        server = self.server
+
+        if self.path != server.url_path:
+            self._reply(HTTPStatus.NOT_FOUND)
+            return
+
+        secret_token: str = self.headers.get(SECRET_TOKEN_HEADER, "")
+        if not hmac.compare_digest(secret_token, server.secret_token):
+            self._reply(HTTPStatus.FORBIDDEN)
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if not 0 < length <= MAX_BODY_SIZE:
+            self._reply(HTTPStatus.BAD_REQUEST)
+            return
+
+        try:
+            data = json.loads(self.rfile.read(length))
+            update: Update | None = Update.de_json(data, server.bot)
+        except Exception:
+            log.exception("Invalid webhook update")
+            update = None
+
+        if not update:
+            self._reply(HTTPStatus.BAD_REQUEST)
+            return
+
+        if not server.put_update(update):
+            log.warning(f"Webhook update queue is full, update {update.update_id}")
+            self._reply(HTTPStatus.SERVICE_UNAVAILABLE)
+            return
+
+        self._reply(HTTPStatus.OK)
+
+    def log_message(self, format: str, *args):
+        log.debug(f"Webhook {self.address_string()}: {format % args}")
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """
+    HTTP-сервер для приема обновлений от Telegram вместо start_polling.
+
+    Обновления с правильным секретным токеном передаются в очередь диспетчера.
+    Несколько процессов бота можно поставить за балансировщиком, если
+    отключены кэши процесса (см. set_process_caches_enabled).
+    По GET HEALTH_PATH возвращается состояние бота из lifecycle
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        bot: Bot,
+        update_queue: Queue,
+        secret_token: str,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        url_path: str = "/",
+        update_queue_max_size: int = UPDATE_QUEUE_MAX_SIZE,
+        lifecycle: Lifecycle | None = None,
+    ):
+        super().__init__((host, port), WebhookRequestHandler)
+
+        self.bot: Bot = bot
+        self.update_queue: Queue = update_queue
+        self.secret_token: str = secret_token
+        self.url_path: str = url_path or "/"
+        self.update_queue_max_size: int = update_queue_max_size
+        self.lifecycle: Lifecycle | None = lifecycle
+
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def put_update(self, update: Update) -> bool:
+        # Очередь диспетчера не ограничена, поэтому размер проверяется здесь
+        with self._lock:
+            if self.update_queue.qsize() >= self.update_queue_max_size:
+                return False
+
+            self.update_queue.put(update)
+            return True
+
+    def start(self):
+        if self._thread:
+            return
+
+        self._thread = threading.Thread(
+            target=self.serve_forever,
+            name="WebhookServer",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+        self._thread = None